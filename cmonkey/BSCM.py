@@ -18,7 +18,6 @@ import scipy as sp
 import math
 import random
 import datetime as dt
-import multiprocessing as mp
 import logging
 
 import cmonkey.datamatrix as datamatrix
@@ -26,7 +25,9 @@ import cmonkey.util as util
 
 
 def getVarianceMeanSDvect_mp_wrapper(args):
-    return getVarianceMeanSDvect(args[0], args[1], args[2], args[3], args[4], args[5], args[6])
+    """args[0] is the index of the column in the broadcast ratios matrix"""
+    ratioVect = util.shared('BSCM.ratios').column_values(args[0])
+    return getVarianceMeanSDvect(ratioVect, args[1], args[2], args[3], args[4], args[5], args[6])
 
 
 def getVarianceMeanSDvect(ratioVect, n, tolerance = 0.01, maxTime=600, chunkSize=200, verbose=False,
@@ -159,14 +160,15 @@ class BSCM:
                 logging.info("\tFitting variance samples to Chi2 distribution")
 
             if num_cores > 1:
+                # the workers read the ratio columns from the shared matrix
+                util.broadcast('BSCM.ratios', self.ratios, force=False)
+                colIdxs = self.ratios.column_indexes_for(noVarCns)
                 newargs = []
                 for i in range(0, len(noVarNs)):
-                    newargs.append([noVarRats[i], noVarNs[i], self.tolerance,
+                    newargs.append([colIdxs[i], noVarNs[i], self.tolerance,
                                     self.maxTime, self.chunkSize, self.verbose, noVarCns[i]])
-                pool = mp.Pool(num_cores)
-                newVars = pool.map(getVarianceMeanSDvect_mp_wrapper, newargs)
-                pool.close()
-                pool.join()
+                with util.get_mp_pool({'num_cores': num_cores}) as pool:
+                    newVars = pool.map(getVarianceMeanSDvect_mp_wrapper, newargs)
             else:
                 tolerance = np.repeat(self.tolerance, len(noVarNs)).tolist()
                 maxTime = np.repeat(self.maxTime, len(noVarNs)).tolist()
@@ -231,5 +233,6 @@ class BSCM:
                                         dtype='int32')
         for col in pDict.keys():
             membership.col_membs[membership.colidx[col]] = np.array(pDict[col], dtype='int32')
+        membership.reindex()
 
         return membership
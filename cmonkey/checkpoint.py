@@ -0,0 +1,95 @@
+# vi: sw=4 ts=4 et:
+"""checkpoint.py - snapshots of the run state for --resume
+
+A checkpoint holds everything an iteration depends on: the membership
+tables, the cached results and internal state of the scoring functions and
+the random number generator states. A resumed run restores the state of
+the last checkpoint and continues with the next iteration without
+recomputing the scores. The rows of later iterations in the output
+database are discarded, so the database matches the restored state.
+
+The checkpoint is one pickle file in the output directory, written with
+util.write_atomic(), so an interrupted run always leaves the previous
+complete checkpoint.
+
+This file is part of cMonkey Python. Please see README and LICENSE for
+more information and licensing details.
+"""
+import os
+import logging
+import cmonkey.util as util
+
+# Python2/Python3 compatibility
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+CHECKPOINT_FILE = 'checkpoint.pkl'
+CHECKPOINT_VERSION = 1
+
+# output tables with an iteration column
+ITERATION_TABLES = ['row_members', 'column_members', 'cluster_stats', 'iteration_stats',
+                    'motif_pssm_rows', 'motif_annotations', 'meme_runs']
+
+
+def checkpoint_path(output_dir):
+    return os.path.join(output_dir, CHECKPOINT_FILE)
+
+
+def dumps(state):
+    """returns the pickled state. The state is pickled when the checkpoint
+    is made, so it can be written later while the run continues"""
+    state = dict(state)
+    state['version'] = CHECKPOINT_VERSION
+    return pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+
+
+def write_file(conn, path, data):
+    """writes the pickled state to path atomically, the connection is not used"""
+    util.write_atomic(path, lambda outfile: outfile.write(data))
+
+
+def load(path):
+    """returns the state stored in path or None if there is no usable checkpoint"""
+    try:
+        with open(path, 'rb') as infile:
+            state = pickle.load(infile)
+    except (IOError, OSError, EOFError, pickle.UnpicklingError):
+        return None
+    if state.get('version') != CHECKPOINT_VERSION:
+        logging.warn("ignoring checkpoint '%s' of version %s", path, str(state.get('version')))
+        return None
+    return state
+
+
+def membership_state(membership):
+    """the membership tables in the order of the membership's names"""
+    return {'row_names': list(membership.row_names),
+            'col_names': list(membership.col_names),
+            'row_membs': membership.row_membs.copy(),
+            'col_membs': membership.col_membs.copy()}
+
+
+def restore_membership(membership, state):
+    """replaces the membership tables, the scoring functions keep their
+    reference to the membership object"""
+    if (state['row_names'] != list(membership.row_names) or
+        state['col_names'] != list(membership.col_names)):
+        raise ValueError('the checkpoint does not match the membership')
+    membership.row_membs = state['row_membs'].copy()
+    membership.col_membs = state['col_membs'].copy()
+    membership.reindex()
+
+
+def discard_results_after(conn, iteration):
+    """removes the rows of the iterations after iteration from the output database"""
+    with conn:
+        conn.execute('''delete from meme_motif_sites where motif_info_id in
+                        (select rowid from motif_infos where iteration > ?)''', [iteration])
+        conn.execute('''delete from tomtom_results where motif_info_id1 in
+                        (select rowid from motif_infos where iteration > ?)''', [iteration])
+        for table in ITERATION_TABLES + ['motif_infos']:
+            conn.execute('delete from %s where iteration > ?' % table, [iteration])
+        conn.execute('update run_infos set last_iteration = ?', [iteration])
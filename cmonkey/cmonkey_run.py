@@ -1,5 +1,6 @@
 # vi: sw=4 ts=4 et:
 import os
+import sys
 import shutil
 from datetime import date, datetime
 import json
@@ -8,12 +9,13 @@ import gc
 import re
 import logging
 import gzip
-import sqlite3
 from decimal import Decimal
 import bz2
+from functools import partial
 from pkg_resources import Requirement, resource_filename, DistributionNotFound
 
 import cmonkey.config as config
+import cmonkey.datamatrix as dm
 import cmonkey.microarray as microarray
 import cmonkey.membership as memb
 import cmonkey.meme as meme
@@ -29,6 +31,9 @@ import cmonkey.debug as debug
 import cmonkey.sizes as sizes
 import cmonkey.thesaurus as thesaurus
 import cmonkey.BSCM as BSCM
+import cmonkey.result_writer as result_writer
+import cmonkey.membership_history as membership_history
+import cmonkey.checkpoint as checkpoint
 
 # Python2/Python3 compatibility
 try:
@@ -66,6 +71,9 @@ class CMonkeyRun:
         self.__membership = None
         self.__organism = None
         self.config_params = args_in
+        if args_in['multiprocessing']:
+            # workers map the ratios instead of receiving a copy
+            ratios = dm.SharedDataMatrix(ratios)
         self.ratios = ratios
         if args_in['resume']:
             self.row_seeder = memb.make_db_row_seeder(args_in['out_database'])
@@ -77,7 +85,20 @@ class CMonkeyRun:
         else:
             self.row_seeder = memb.make_kmeans_row_seeder(args_in['num_clusters'])
             self.column_seeder = microarray.seed_column_members
+        self.row_scoring = None
+        self.column_scoring = None
         self.__conn = None
+        self.__writer = None
+        self.__membership_history = None
+        self.__cluster_residuals = None
+        self.__restored = False
+
+        # the worker pool is shared by all scoring functions and lives until
+        # cleanup(), the worker processes are started in prepare_run()
+        self.__pool = None
+        if args_in['multiprocessing']:
+            self.__pool = util.WorkerPool(args_in.get('num_cores', None))
+            util.RUN_POOL = self.__pool
 
         today = date.today()
         logging.info('Input matrix has # rows: %d, # columns: %d',
@@ -93,18 +114,56 @@ class CMonkeyRun:
             logging.error('MEME not detected - please check')
 
     def cleanup(self):
-        """cleanup this run object"""
-        if self.__conn is not None:
-            self.__conn.close()
-            self.__conn = None
+        """cleanup this run object. The resources are released even if one
+        of the steps fails. An error of the result writer is raised, unless
+        cleanup() runs while another exception propagates, then it is logged
+        so it does not hide the original error"""
+        propagating = sys.exc_info()[0] is not None
+        try:
+            for scoring_function in [self.row_scoring, self.column_scoring]:
+                if scoring_function is not None:
+                    scoring_function.shutdown()
+            if self.__writer is not None:
+                # the queued writes are finished before the connection is closed
+                writer = self.__writer
+                self.__writer = None
+                try:
+                    writer.close()
+                except Exception:
+                    if not propagating:
+                        raise
+                    logging.exception("could not write the results to the output database")
+        finally:
+            if self.__conn is not None:
+                self.__conn.close()
+                self.__conn = None
+            if self.__pool is not None:
+                self.__pool.shutdown(terminate=propagating)
+                if util.RUN_POOL is self.__pool:
+                    util.RUN_POOL = None
+                self.__pool = None
+            if isinstance(self.ratios, dm.SharedDataMatrix):
+                self.ratios.unlink()
 
     def __dbconn(self):
         """Returns an autocommit database connection. We maintain a single database
         connection throughout the life of this run objec"""
         if self.__conn is None:
-            self.__conn = sqlite3.connect(self['out_database'], 15, isolation_level='DEFERRED')
+            self.__conn = result_writer.connect(self['out_database'])
         return self.__conn
 
+    def __result_writer(self):
+        """Returns the writer that buffers the result rows for the database
+        connection. With db_write_queue > 0, the rows are written in a
+        background thread while the next iterations run"""
+        if self.__writer is None:
+            background = None
+            if self.config_params.get('db_write_queue', 0) > 0:
+                background = result_writer.BackgroundWriter(self['out_database'],
+                                                            self['db_write_queue'])
+            self.__writer = result_writer.ResultWriter(self.__dbconn(), background)
+        return self.__writer
+
     def __create_output_database(self):
         conn = self.__dbconn()
         # these are the tables for storing cmonkey run information.
@@ -159,6 +218,7 @@ class CMonkeyRun:
         conn.execute('''create table motif_annotations (motif_info_id int,
                         iteration int, gene_num int,
                         position int, reverse boolean, pvalue decimal)''')
+        self.__create_added_tables()
         conn.execute('''create index if not exists colmemb_iter_index
                         on column_members (iteration)''')
         conn.execute('''create index if not exists rowmemb_iter_index
@@ -184,6 +244,17 @@ class CMonkeyRun:
                              (index, self.ratios.column_names[index]))
         logging.debug("added row and column names to output database")
 
+    def __create_added_tables(self):
+        """creates the tables that were added to the output database schema
+        later, they are also created in older databases of resumed runs"""
+        conn = self.__dbconn()
+        with conn:
+            # wall times of the MEME/MAST jobs in milliseconds and their estimates
+            # from the job scheduler's cost model
+            conn.execute('''create table if not exists meme_runs (iteration int,
+                            cluster int, seqtype text, num_seqs int, seq_length int,
+                            estimated_cost decimal, wall_time int)''')
+
     def report_params(self):
         logging.info('cmonkey_run config_params:')
         for param, value in self.config_params.items():
@@ -209,18 +280,6 @@ class CMonkeyRun:
         if self.__membership is None:
             logging.debug("creating and seeding memberships")
             self.__membership = self.__make_membership()
-
-            # debug: write seed into an analytical file for iteration 0
-            if 'random_seed' in self['debug']:
-                conn = self.__dbconn()
-                with conn:
-                    self.write_memberships(conn, 0)
-                # write complete result into a cmresults.tsv
-                path =  os.path.join(self['output_dir'], 'cmresults-0000.tsv.bz2')
-                with bz2.BZ2File(path, 'w') as outfile:
-                    debug.write_iteration(conn, outfile, 0,
-                                          self['num_clusters'], self['output_dir'])
-
         return self.__membership
 
     def organism(self):
@@ -469,6 +528,8 @@ class CMonkeyRun:
 
                 shutil.copyfile(self['ratios_file'],
                                 os.path.join(output_dir, 'ratios.original.tsv'))
+        else:
+            self.__create_added_tables()
 
         # gene index map is used for writing statistics
         thesaurus = self.organism().thesaurus()
@@ -485,6 +546,17 @@ class CMonkeyRun:
         self.row_scoring = row_scoring
         self.column_scoring = col_scoring
 
+        # the workers are forked before the result writer starts its thread
+        if self.__pool is not None:
+            self.__pool.start()
+
+        # debug: write seed into an analytical file for iteration 0
+        if 'random_seed' in self['debug']:
+            self.write_memberships(self.__result_writer(), 0)
+            self.__result_writer().flush()
+            # write complete result into a cmresults.tsv
+            self.write_iteration_dump(0, 'cmresults-0000.tsv.bz2')
+
         ## MOVED FROM run_iterations()
         self.report_params()
         self.write_start_info()
@@ -501,7 +573,11 @@ class CMonkeyRun:
         ## end MOVED
 
         if self['resume']:
-            self['start_iteration'] = self.get_last_iteration()
+            iteration = self.restore_checkpoint()
+            if iteration is not None:
+                self['start_iteration'] = iteration + 1
+            else:
+                self['start_iteration'] = self.get_last_iteration()
 
         ##return row_scoring, col_scoring
 
@@ -519,125 +595,209 @@ class CMonkeyRun:
             matrix = self.ratios.submatrix_by_name(row_names, column_names)
             return matrix.residual()
 
-    def write_memberships(self, conn, iteration):
+    def cluster_residuals(self):
+        """returns the residuals of all clusters, the residuals of the
+        clusters that did not change since the last call are reused"""
+        membership = self.membership()
+        if self.__cluster_residuals is None:
+            self.__cluster_residuals = dm.ClusterResiduals(self.ratios)
+        start_time = util.current_millis()
+        row_positions = np.array(self.ratios.row_indexes_for(membership.row_names),
+                                 dtype=np.int64)
+        col_positions = np.array(self.ratios.column_indexes_for(membership.col_names),
+                                 dtype=np.int64)
+        num_computed = self.__cluster_residuals.num_computed
+        result = []
+        for cluster in range(1, self['num_clusters'] + 1):
+            row_indexes = row_positions[membership.row_indexes_for_cluster(cluster)]
+            col_indexes = col_positions[membership.column_indexes_for_cluster(cluster)]
+            result.append(self.__cluster_residuals.residual(
+                cluster, np.sort(row_indexes[row_indexes >= 0]),
+                np.sort(col_indexes[col_indexes >= 0])))
+        logging.debug("computed %d of %d cluster residuals in %d ms.",
+                      self.__cluster_residuals.num_computed - num_computed,
+                      self['num_clusters'], util.current_millis() - start_time)
+        return result
+
+    def write_memberships(self, writer, iteration):
+        column_members = []
+        row_members = []
         for cluster in range(1, self['num_clusters'] + 1):
             column_names = self.membership().columns_for_cluster(cluster)
-            for order_num in self.ratios.column_indexes_for(column_names):
-                conn.execute('''insert into column_members (iteration,cluster,order_num)
-                                values (?,?,?)''', (iteration, cluster, order_num))
-
+            column_members.extend([(iteration, cluster, order_num)
+                                   for order_num in self.ratios.column_indexes_for(column_names)])
             row_names = self.membership().rows_for_cluster(cluster)
-            for order_num in self.ratios.row_indexes_for(row_names):
-                conn.execute('''insert into row_members (iteration,cluster,order_num)
-                                values (?,?,?)''', (iteration, cluster, order_num))
-
-    def write_results(self, iteration_result):
-        """write iteration results to database"""
+            row_members.extend([(iteration, cluster, order_num)
+                                for order_num in self.ratios.row_indexes_for(row_names)])
+        writer.insert_many('column_members', ('iteration', 'cluster', 'order_num'),
+                           column_members)
+        writer.insert_many('row_members', ('iteration', 'cluster', 'order_num'), row_members)
+
+    def write_membership_history(self, writer, iteration):
+        """appends the memberships to the columnar membership history in
+        the output directory. The tables are copied in the order of the
+        row_names and column_names tables and written after the flushed results"""
+        if self.__membership_history is None:
+            self.__membership_history = membership_history.MembershipHistory(
+                os.path.join(self['output_dir'], 'membership_history'),
+                self.ratios.row_names, self.ratios.column_names)
+        membership = self.membership()
+        row_membs = membership.row_membs[[membership.rowidx[name]
+                                          for name in self.ratios.row_names]]
+        col_membs = membership.col_membs[[membership.colidx[name]
+                                          for name in self.ratios.column_names]]
+        writer.run(partial(append_membership_history, history=self.__membership_history,
+                           iteration=iteration, row_membs=row_membs, col_membs=col_membs))
+
+    def write_results(self, iteration_result, flush=True):
+        """write iteration results to database. The rows are buffered and written
+        in one transaction, unless flush is False"""
         iteration = iteration_result['iteration']
-        conn = self.__dbconn()
-        with conn:
-            self.write_memberships(conn, iteration)
+        writer = self.__result_writer()
+        self.write_memberships(writer, iteration)
+        if self.config_params.get('membership_history', False):
+            self.write_membership_history(writer, iteration)
 
         if 'motifs' in iteration_result:
             motifs = iteration_result['motifs']
-            with conn:
-                for seqtype in motifs:
-                    for cluster in motifs[seqtype]:
-                        motif_infos = motifs[seqtype][cluster]['motif-info']
-                        for motif_info in motif_infos:
-                            c = conn.cursor()
-                            c.execute('''insert into motif_infos (iteration,cluster,seqtype,motif_num,evalue)
-                                        values (?,?,?,?,?)''',
-                                      (iteration, cluster, seqtype, motif_info['motif_num'],
-                                       motif_info['evalue']))
-                            motif_info_id = c.lastrowid
-                            c.close()
-                            pssm_rows = motif_info['pssm']
-                            for row in xrange(len(pssm_rows)):
-                                pssm_row = pssm_rows[row]
-                                conn.execute('''insert into motif_pssm_rows (motif_info_id,iteration,row,a,c,g,t)
-                                                values (?,?,?,?,?,?,?)''',
-                                             (motif_info_id, iteration, row, pssm_row[0], pssm_row[1],
-                                              pssm_row[2], pssm_row[3]))
-                            annotations = motif_info['annotations']
-                            for annotation in annotations:
-                                gene_num = self.gene_indexes[annotation['gene']]
-                                conn.execute('''insert into motif_annotations (motif_info_id,
-                                                iteration,gene_num,
-                                                position,reverse,pvalue) values (?,?,?,?,?,?)''',
-                                             (motif_info_id, iteration, gene_num,
-                                              annotation['position'],
-                                              annotation['reverse'], annotation['pvalue']))
-
-                            sites = motif_info['sites']
-                            if len(sites) > 0 and isinstance(sites[0], tuple):
-                                for seqname, strand, start, pval, flank_left, seq, flank_right in sites:
-                                    conn.execute('''insert into meme_motif_sites (motif_info_id, seq_name, reverse, start, pvalue, flank_left, seq, flank_right)
-                                                    values (?,?,?,?,?,?,?,?)''',
-                                                 (motif_info_id, seqname, strand == '-',
-                                                  start, pval, flank_left, seq,
-                                                  flank_right))
-
-    def write_stats(self, iteration_result):
-        # write stats for this iteration
+            for seqtype in motifs:
+                for cluster in motifs[seqtype]:
+                    if 'meme-run' in motifs[seqtype][cluster]:
+                        meme_run = motifs[seqtype][cluster]['meme-run']
+                        writer.insert('meme_runs', ('iteration', 'cluster', 'seqtype', 'num_seqs',
+                                                    'seq_length', 'estimated_cost', 'wall_time'),
+                                      (iteration, cluster, seqtype, meme_run['num_seqs'],
+                                       meme_run['seq_length'], meme_run['estimated_cost'],
+                                       meme_run['wall_time']))
+                    motif_infos = motifs[seqtype][cluster]['motif-info']
+                    for motif_info in motif_infos:
+                        motif_info_id = writer.next_rowid('motif_infos')
+                        writer.insert('motif_infos', ('rowid', 'iteration', 'cluster', 'seqtype',
+                                                      'motif_num', 'evalue'),
+                                      (motif_info_id, iteration, cluster, seqtype,
+                                       motif_info['motif_num'], motif_info['evalue']))
+                        writer.insert_many('motif_pssm_rows', ('motif_info_id', 'iteration', 'row',
+                                                               'a', 'c', 'g', 't'),
+                                           [(motif_info_id, iteration, row, pssm_row[0],
+                                             pssm_row[1], pssm_row[2], pssm_row[3])
+                                            for row, pssm_row in enumerate(motif_info['pssm'])])
+                        writer.insert_many('motif_annotations', ('motif_info_id', 'iteration',
+                                                                 'gene_num', 'position',
+                                                                 'reverse', 'pvalue'),
+                                           [(motif_info_id, iteration,
+                                             self.gene_indexes[annotation['gene']],
+                                             annotation['position'], annotation['reverse'],
+                                             annotation['pvalue'])
+                                            for annotation in motif_info['annotations']])
+
+                        sites = motif_info['sites']
+                        if len(sites) > 0 and isinstance(sites[0], tuple):
+                            writer.insert_many('meme_motif_sites',
+                                               ('motif_info_id', 'seq_name', 'reverse', 'start',
+                                                'pvalue', 'flank_left', 'seq', 'flank_right'),
+                                               [(motif_info_id, seqname, strand == '-', start,
+                                                 pval, flank_left, seq, flank_right)
+                                                for seqname, strand, start, pval, flank_left,
+                                                seq, flank_right in sites])
+        if flush:
+            self.flush_results()
+
+    def write_stats(self, iteration_result, flush=True):
+        """write stats for this iteration. The rows are buffered and written
+        in one transaction, unless flush is False"""
         iteration = iteration_result['iteration']
 
         network_scores = iteration_result['networks'] if 'networks' in iteration_result else {}
         motif_pvalues = iteration_result['motif-pvalue'] if 'motif-pvalue' in iteration_result else {}
         fuzzy_coeff = iteration_result['fuzzy-coeff'] if 'fuzzy-coeff' in iteration_result else 0.0
 
-        residuals = []
-        conn = self.__dbconn()
-        cur = conn.cursor()
-        with conn:
-            for cluster in range(1, self['num_clusters'] + 1):
-                row_names = self.membership().rows_for_cluster(cluster)
-                column_names = self.membership().columns_for_cluster(cluster)
-                residual = self.residual_for(row_names, column_names)
-                residuals.append(residual)
-                try:
-                    conn.execute('''insert into cluster_stats (iteration, cluster, num_rows,
-                                    num_cols, residual) values (?,?,?,?,?)''',
-                                 (iteration, cluster, len(row_names), len(column_names),
-                                  residual))
-                except:
-                    # residual is messed up, insert with 1.0
-                    logging.warn('STATS: residual was messed up, insert with 1.0')
-                    conn.execute('''insert into cluster_stats (iteration, cluster, num_rows,
-                                    num_cols, residual) values (?,?,?,?,?)''',
-                                 (iteration, cluster, len(row_names), len(column_names),
-                                  1.0))
-
-            median_residual = np.median(residuals)
-            conn.execute("insert into iteration_stats (statstype,iteration,score) values (?,?,?)",
-                         (1, iteration, fuzzy_coeff))
-
-            try:
-                conn.execute("insert into iteration_stats (statstype,iteration,score) values (?,?,?)", (2, iteration, median_residual))
-            except:
-                logging.warn('STATS: median was messed up, insert with 1.0')
-                conn.execute("insert into iteration_stats (statstype,iteration,score) values (?,?,?)", (2, iteration, 1.0))
-
-            # insert the score means
-            for fun_id in iteration_result['score_means']:
-                cur.execute("select rowid from statstypes where category='scoring' and name=?", [fun_id])
-                type_id = cur.fetchone()[0]
-                conn.execute('insert into iteration_stats (statstype,iteration,score) values (?,?,?)',
-                             [type_id, iteration, iteration_result['score_means'][fun_id]])
-
-        with conn:
-            for network, score in network_scores.items():
-                cur.execute("select rowid from statstypes where category='network' and name=?", [network])
-                typeid = cur.fetchone()[0]
-                conn.execute("insert into iteration_stats values (?,?,?)",
-                             (typeid, iteration, score))
-        with conn:
-            for seqtype, pval in motif_pvalues.items():
-                cur.execute("select rowid from statstypes where category='seqtype' and name=?", [seqtype])
-                typeid = cur.fetchone()[0]
-                conn.execute("insert into iteration_stats values (?,?,?)",
-                             (typeid, iteration, pval))
-        cur.close()
+        writer = self.__result_writer()
+        residuals = self.cluster_residuals()
+        cluster_stats = []
+        for cluster in range(1, self['num_clusters'] + 1):
+            cluster_stats.append((iteration, cluster,
+                                  self.membership().num_row_members(cluster),
+                                  self.membership().num_column_members(cluster),
+                                  stats_value(residuals[cluster - 1], 'residual')))
+        writer.insert_many('cluster_stats', ('iteration', 'cluster', 'num_rows', 'num_cols',
+                                             'residual'), cluster_stats)
+
+        iteration_stats = [(writer.statstype_id('main', 'fuzzy_coeff'), iteration, fuzzy_coeff),
+                           (writer.statstype_id('main', 'median_residual'), iteration,
+                            stats_value(np.median(residuals), 'median'))]
+        # insert the score means
+        for fun_id, score in iteration_result['score_means'].items():
+            iteration_stats.append((writer.statstype_id('scoring', fun_id), iteration, score))
+        for network, score in network_scores.items():
+            iteration_stats.append((writer.statstype_id('network', network), iteration, score))
+        for seqtype, pval in motif_pvalues.items():
+            iteration_stats.append((writer.statstype_id('seqtype', seqtype), iteration, pval))
+        writer.insert_many('iteration_stats', ('statstype', 'iteration', 'score'),
+                           iteration_stats)
+        if flush:
+            self.flush_results()
+
+    def flush_results(self):
+        """writes the buffered result and stats rows in one transaction"""
+        writer = self.__result_writer()
+        num_rows = writer.num_rows()
+        start_time = util.current_millis()
+        writer.flush()
+        logging.debug("flushed %d result rows in %d ms.", num_rows,
+                      util.current_millis() - start_time)
+
+    def write_iteration_dump(self, iteration, filename):
+        """writes the iteration's results from the database into a
+        cmresults file, after the flushed results were written"""
+        path = os.path.join(self['output_dir'], filename)
+        self.__result_writer().run(partial(write_iteration_dump, path=path,
+                                           iteration=iteration,
+                                           num_clusters=self['num_clusters'],
+                                           output_dir=self['output_dir']))
+
+    def checkpoint_path(self):
+        return checkpoint.checkpoint_path(self['output_dir'])
+
+    def write_checkpoint(self, iteration):
+        """saves the state after the iteration. The file is written after
+        the flushed results, so it never gets ahead of the database"""
+        start_time = util.current_millis()
+        data = checkpoint.dumps({
+            'iteration': iteration,
+            'num_rows': self.ratios.num_rows,
+            'num_columns': self.ratios.num_columns,
+            'num_clusters': self['num_clusters'],
+            'membership': checkpoint.membership_state(self.membership()),
+            'row_scoring': self.row_scoring.checkpoint_state(),
+            'column_scoring': self.column_scoring.checkpoint_state(),
+            'random_states': util.random_states()})
+        self.__result_writer().run(partial(checkpoint.write_file, path=self.checkpoint_path(),
+                                           data=data))
+        logging.info("checkpoint of iteration %d (%d bytes) in %d ms.", iteration,
+                     len(data), util.current_millis() - start_time)
+
+    def restore_checkpoint(self):
+        """restores the state of the last checkpoint and discards the
+        results of the later iterations. Returns the iteration of the
+        checkpoint or None if there is no checkpoint for this run"""
+        state = checkpoint.load(self.checkpoint_path())
+        if state is None:
+            logging.info("no checkpoint found, resuming from the database")
+            return None
+        if (state['num_rows'] != self.ratios.num_rows or
+            state['num_columns'] != self.ratios.num_columns or
+            state['num_clusters'] != self['num_clusters']):
+            logging.warn("the checkpoint does not match the input, resuming from the database")
+            return None
+        iteration = state['iteration']
+        checkpoint.restore_membership(self.membership(), state['membership'])
+        self.row_scoring.restore_checkpoint_state(state['row_scoring'])
+        self.column_scoring.restore_checkpoint_state(state['column_scoring'])
+        util.set_random_states(state['random_states'])
+        checkpoint.discard_results_after(self.__dbconn(), iteration)
+        self.__restored = True
+        logging.info("restored the checkpoint of iteration %d", iteration)
+        return iteration
 
     def write_start_info(self):
         conn = self.__dbconn()
@@ -660,10 +820,11 @@ class CMonkeyRun:
                           self.ratios.num_columns, self['num_clusters'],
                           '$Id$'))
 
-    def update_iteration(self, iteration):
-        conn = self.__dbconn()
-        with conn:
-            conn.execute('''update run_infos set last_iteration = ?''', (iteration,))
+    def update_iteration(self, iteration, flush=True):
+        writer = self.__result_writer()
+        writer.execute('''update run_infos set last_iteration = ?''', (iteration,))
+        if flush:
+            self.flush_results()
 
     def get_last_iteration(self):
         """Return the last iteration listed in cMonkey database.  This is intended to
@@ -679,9 +840,11 @@ class CMonkeyRun:
         return iteration
 
     def write_finish_info(self):
-        conn = self.__dbconn()
-        with conn:
-            conn.execute('''update run_infos set finish_time = ?''', (datetime.now(),))
+        writer = self.__result_writer()
+        writer.execute('''update run_infos set finish_time = ?''', (datetime.now(),))
+        writer.flush()
+        # all results are in the database when the run is finished
+        writer.wait()
 
     def combined_rscores_pickle_path(self):
         return "%s/combined_rscores_last.pkl" % self.config_params['output_dir']
@@ -730,21 +893,22 @@ class CMonkeyRun:
         # Reduce I/O, will write the results to database only on a debug run
         if not self['minimize_io']:
             if iteration == 1 or (iteration % self['result_freq'] == 0):
-                self.write_results(iteration_result)
+                self.write_results(iteration_result, flush=False)
 
         # This should not be too much writing, so we can keep it OUT of minimize_io option...?
         if iteration == 1 or (iteration % self['stats_freq'] == 0):
-            self.write_stats(iteration_result)
-            self.update_iteration(iteration)
+            self.write_stats(iteration_result, flush=False)
+            self.update_iteration(iteration, flush=False)
+        self.flush_results()
 
         if 'dump_results' in self['debug'] and (iteration == 1 or
                                                 (iteration % self['debug_freq'] == 0)):
             # write complete result into a cmresults.tsv
-            conn = self.__dbconn()
-            path =  os.path.join(self['output_dir'], 'cmresults-%04d.tsv.bz2' % iteration)
-            with bz2.BZ2File(path, 'w') as outfile:
-                debug.write_iteration(conn, outfile, iteration,
-                                      self['num_clusters'], self['output_dir'])
+            self.write_iteration_dump(iteration, 'cmresults-%04d.tsv.bz2' % iteration)
+
+        if (self.config_params.get('checkpoint_interval', 0) > 0 and
+            iteration % self['checkpoint_interval'] == 0):
+            self.write_checkpoint(iteration)
 
     def write_mem_profile(self, outfile, iteration):
         membsize = sizes.asizeof(self.membership()) / 1000000.0
@@ -767,7 +931,8 @@ class CMonkeyRun:
 
         for iteration in range(start_iter, num_iter):
             start_time = util.current_millis()
-            force = self['resume'] and iteration == start_iter
+            # a restored checkpoint continues with the restored scores
+            force = self['resume'] and not self.__restored and iteration == start_iter
             self.run_iteration(iteration, force=force)
 
             # garbage collection after everything in iteration went out of scope
@@ -806,19 +971,16 @@ class CMonkeyRun:
             with open(self.combined_rscores_pickle_path(), 'wb') as outfile:
                 pickle.dump(combined_scores, outfile)
 
-            self.write_results(iteration_result)
-            self.write_stats(iteration_result)
+            self.write_results(iteration_result, flush=False)
+            self.write_stats(iteration_result, flush=False)
             self.update_iteration(iteration)
 
             # default behaviour:
             # always write complete result into a cmresults.tsv for R/cmonkey
             # compatibility
+            self.write_iteration_dump(self['num_iterations'] + 1, 'cmresults-postproc.tsv.bz2')
+            self.__result_writer().wait()
             conn = self.__dbconn()
-            path =  os.path.join(self['output_dir'], 'cmresults-postproc.tsv.bz2')
-            with bz2.BZ2File(path, 'w') as outfile:
-                debug.write_iteration(conn, outfile,
-                                      self['num_iterations'] + 1,
-                                      self['num_clusters'], self['output_dir'])
             # TODO: Why is conn never closed?  Where does it write to the db?
 
             # additionally: run tomtom on the motifs if requested
@@ -830,6 +992,28 @@ class CMonkeyRun:
         logging.info("Done !!!!")
 
 
+def write_iteration_dump(conn, path, iteration, num_clusters, output_dir):
+    """writes the iteration's results in the database into a cmresults file"""
+    with bz2.BZ2File(path, 'w') as outfile:
+        debug.write_iteration(conn, outfile, iteration, num_clusters, output_dir)
+
+
+def append_membership_history(conn, history, iteration, row_membs, col_membs):
+    """appends the membership tables to the history, the connection is
+    not used"""
+    history.append(iteration, row_membs, col_membs)
+
+
+def stats_value(value, name):
+    """returns the value as a float for the stats tables, values that can not
+    be stored are replaced with 1.0"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        logging.warn('STATS: %s was messed up, insert with 1.0', name)
+        return 1.0
+
+
 def get_function_class(scorefun):
     modulepath = scorefun['module'].split('.')
     if len(modulepath) > 1:
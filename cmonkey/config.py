@@ -112,6 +112,7 @@ def set_config_general(config, params):
     params['postadjust'] = config.getboolean('General', 'postadjust')
     params['log_subresults'] = config.getboolean('General', 'log_subresults')
     params['add_fuzz'] = config.get('General', 'add_fuzz')
+    params['numerics_backend'] = get_config_str(config, 'General', 'numerics_backend', 'r')
 
     # python can have large seeds, R, however has a 32 bit limit it seems
     params['random_seed'] = get_config_int(config, 'General', 'random_seed',
@@ -119,6 +120,10 @@ def set_config_general(config, params):
     params['stats_freq'] = config.getint('General', 'stats_frequency')
     params['result_freq'] = config.getint('General', 'result_frequency')
     params['debug_freq'] = config.getint('General', 'debug_frequency')
+    params['db_write_queue'] = get_config_int(config, 'General', 'db_write_queue', 0)
+    params['checkpoint_interval'] = get_config_int(config, 'General', 'checkpoint_interval', 0)
+    params['membership_history'] = get_config_boolean(config, 'General', 'membership_history',
+                                                      False)
 
     # implicit parameters for compatibility
     params['use_operons'] = get_config_boolean(config, 'General', 'use_operons', True)
@@ -144,6 +149,8 @@ def set_config_membership(config, params):
                                                      'clusters_per_row')
     params['memb.clusters_per_col'] = get_config_int(config, 'Membership',
                                                      'clusters_per_column')
+    params['memb.legacy_update'] = get_config_boolean(config, 'Membership',
+                                                      'legacy_update', False)
 
 
 def set_config_scoring_functions(config, params):
@@ -340,6 +347,7 @@ def setup_resume(args_in, config_parser):
             params[curParam] = args_in.__dict__[curParam]
 
     num_clusters = params['num_clusters']
+    util.set_numerics_backend(params['numerics_backend'])
 
     # TODO: these need to be restored or it will crash, need to move stuff around
     # needs rework
@@ -483,6 +491,7 @@ def setup_default(args, config_parser):
     for key, value in overrides.items():
         params[key] = value
 
+    util.set_numerics_backend(params['numerics_backend'])
     if params['random_seed'] is not None:
         random.seed(params['random_seed'])
         util.r_set_seed(params['random_seed'])
@@ -573,11 +582,15 @@ def write_general_settings(outfile, config_params):
     outfile.write('stats_frequency = %d\n' % config_params['stats_freq'])
     outfile.write('result_frequency = %d\n' % config_params['result_freq'])
     outfile.write('debug_frequency = %d\n' % config_params['debug_freq'])
+    outfile.write('db_write_queue = %d\n' % config_params['db_write_queue'])
+    outfile.write('checkpoint_interval = %d\n' % config_params['checkpoint_interval'])
+    outfile.write('membership_history = %s\n' % str(config_params['membership_history']))
     outfile.write('postadjust = %s\n' % str(config_params['postadjust']))
     outfile.write('add_fuzz = %s\n' % str(config_params['add_fuzz']))
     outfile.write('num_clusters = %d\n' % config_params['num_clusters'])
     outfile.write('random_seed = %s\n' % strparam(config_params['random_seed']))
     outfile.write('log_subresults = %s\n' % str(config_params['log_subresults']))
+    outfile.write('numerics_backend = %s\n' % config_params['numerics_backend'])
 
     # compatibility
     outfile.write('organism_code = %s\n' % str(config_params['organism_code']))
@@ -599,6 +612,7 @@ def write_membership_settings(outfile, config_params):
     outfile.write('max_cluster_rows_allowed = %d\n' % config_params['memb.max_cluster_rows_allowed'])
     outfile.write('clusters_per_row = %d\n' % config_params['memb.clusters_per_row'])
     outfile.write('clusters_per_column = %d\n' % config_params['memb.clusters_per_col'])
+    outfile.write('legacy_update = %s\n' % str(config_params['memb.legacy_update']))
 
 
 def write_section(outfile, section, settings):
@@ -12,6 +12,8 @@ import logging
 import gzip
 import os
 import random
+import tempfile
+import warnings
 import pandas
 
 # Python2/Python3 compatibility
@@ -279,11 +281,88 @@ class DataMatrix:
                 outfile.flush()
 
 
+class SharedDataMatrix(DataMatrix):
+    """A DataMatrix whose values are stored in a memory mapped file.
+    Pickling a SharedDataMatrix only transfers the names and the path of the
+    file, the receiving process maps the values read-only instead of copying
+    them, so all workers share the same physical pages.
+    The matrix that was created from a DataMatrix owns the file and removes
+    it in unlink()"""
+
+    def __init__(self, matrix):
+        """creates a shared copy of matrix"""
+        DataMatrix.__init__(self, matrix.num_rows, matrix.num_columns,
+                            matrix.row_names, matrix.column_names)
+        handle, self.path = tempfile.mkstemp(prefix='cmonkey-matrix-', suffix='.dat')
+        os.close(handle)
+        self.values = np.memmap(self.path, dtype=np.float64, mode='w+',
+                                shape=matrix.values.shape)
+        self.values[:] = matrix.values
+        self.values.flush()
+        self.__owner = True
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['values']
+        state['_SharedDataMatrix__owner'] = False
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.values = np.memmap(self.path, dtype=np.float64, mode='r',
+                                shape=(self.num_rows, len(self.column_names)))
+
+    def unlink(self):
+        """removes the backing file, processes that already mapped the
+        values can continue to use them"""
+        if self.__owner and os.path.exists(self.path):
+            os.remove(self.path)
+
+
 FILTER_THRESHOLD = 0.98
 ROW_THRESHOLD = 0.17
 COLUMN_THRESHOLD = 0.1
 
 
+def residual(values):
+    """computes the residual of a value array, the same as
+    DataMatrix.residual() without the row variance normalization"""
+    with warnings.catch_warnings():
+        # rows or columns without values have NaN means
+        warnings.simplefilter('ignore', RuntimeWarning)
+        d_rows = np.nanmean(values, axis=1)
+        d_cols = np.nanmean(values, axis=0)
+        d_all = np.nanmean(d_rows)
+        return np.nanmean(np.abs(values + d_all - (d_rows[:, np.newaxis] + d_cols)))
+
+
+class ClusterResiduals:
+    """Computes the residuals of the clusters of a matrix. A cluster's residual
+    is kept with its row and column indexes and only computed again when
+    the indexes changed"""
+
+    def __init__(self, matrix):
+        self.values = matrix.values
+        self.__cache = {}  # cluster -> (row indexes, column indexes, residual)
+        self.num_computed = 0
+
+    def residual(self, cluster, row_indexes, column_indexes):
+        """returns the residual of the submatrix with the sorted row and
+        column indexes, clusters with at most one row or column have a
+        residual of 1.0"""
+        cached = self.__cache.get(cluster, None)
+        if (cached is not None and np.array_equal(cached[0], row_indexes) and
+                np.array_equal(cached[1], column_indexes)):
+            return cached[2]
+        if len(row_indexes) <= 1 or len(column_indexes) <= 1:
+            result = 1.0
+        else:
+            result = residual(self.values[np.ix_(row_indexes, column_indexes)])
+            self.num_computed += 1
+        self.__cache[cluster] = (np.array(row_indexes), np.array(column_indexes), result)
+        return result
+
+
 def nochange_filter(dataframe):
     """returns a new filtered DataMatrix containing only the columns and
     rows that have large enough measurements"""
@@ -430,12 +509,22 @@ def ranks(values):
     return ranks
 
 
+def rank_means(values, tmp_mean):
+    """replaces the values with the means at their ranks, NaN values are
+    not ranked and stay NaN"""
+    rankvals = util.rrank_matrix(values)
+    result = np.empty(len(rankvals))
+    result.fill(np.nan)
+    isranked = rankvals >= 0
+    result[isranked] = tmp_mean[rankvals[isranked]]
+    return np.reshape(result, values.shape)
+
+
 def rank_fun(mat_mean):
     """ranking function that is run within Pool.map()"""
     values, row_names, column_names, tmp_mean = mat_mean
     num_rows, num_cols = values.shape
-    rankvals = util.rrank_matrix(values)
-    values = np.reshape(tmp_mean[rankvals], (num_rows, num_cols))
+    values = rank_means(values, tmp_mean)
     return DataMatrix(num_rows, num_cols, row_names, column_names,
                       values=values)
 
@@ -457,8 +546,7 @@ def qm_result_matrices(matrices, tmp_mean, multiprocessing=True):
             matrix = matrices[i]
             values = matrix.values
             num_rows, num_cols = values.shape
-            rankvals = util.rrank_matrix(values)
-            values = np.reshape(tmp_mean[rankvals], (num_rows, num_cols))
+            values = rank_means(values, tmp_mean)
             outmatrix = DataMatrix(num_rows,
                                    num_cols,
                                    matrix.row_names,
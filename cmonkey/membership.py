@@ -11,7 +11,6 @@ import random
 import logging
 import sys
 import numpy as np
-import rpy2.robjects as robjects
 
 import cmonkey.datamatrix as dm
 import cmonkey.util as util
@@ -44,12 +43,62 @@ KEY_MAX_CHANGES_PER_ROW = 'memb.max_changes_per_row'
 KEY_MAX_CHANGES_PER_COL = 'memb.max_changes_per_col'
 KEY_MIN_CLUSTER_ROWS_ALLOWED = 'memb.min_cluster_rows_allowed'
 KEY_MAX_CLUSTER_ROWS_ALLOWED = 'memb.max_cluster_rows_allowed'
+KEY_LEGACY_UPDATE = 'memb.legacy_update'
 
 # These keys are for save points
 KEY_ROW_IS_MEMBER_OF = 'memb.row_is_member_of'
 KEY_COL_IS_MEMBER_OF = 'memb.col_is_member_of'
 
 
+class ClusterMemberIndex:
+    """Inverted index cluster -> members of a membership table.
+    A member can hold the same cluster in several slots, so for each cluster
+    we keep a map member index -> number of slots and cache the sorted
+    member index arrays until the cluster changes"""
+    def __init__(self, membs):
+        self.rebuild(membs)
+
+    def rebuild(self, membs):
+        """rebuilds the index from the membership table"""
+        self.__members = defaultdict(dict)
+        self.__sorted = {}
+        rows, slots = np.nonzero(membs > 0)
+        pairs, counts = np.unique(np.vstack([membs[rows, slots], rows]),
+                                  axis=1, return_counts=True)
+        for (cluster, index), count in zip(pairs.T.tolist(), counts.tolist()):
+            self.__members[cluster][index] = count
+
+    def add(self, cluster, index):
+        """adds a slot of cluster to the member at index"""
+        if cluster > 0:
+            members = self.__members[int(cluster)]
+            members[int(index)] = members.get(int(index), 0) + 1
+            self.__sorted.pop(int(cluster), None)
+
+    def remove(self, cluster, index):
+        """removes a slot of cluster from the member at index"""
+        if cluster > 0:
+            members = self.__members[int(cluster)]
+            count = members[int(index)] - 1
+            if count > 0:
+                members[int(index)] = count
+            else:
+                del members[int(index)]
+            self.__sorted.pop(int(cluster), None)
+
+    def indexes(self, cluster):
+        """returns the sorted member indexes of the cluster as int32 array"""
+        cluster = int(cluster)
+        if cluster not in self.__sorted:
+            members = self.__members.get(cluster, {})
+            self.__sorted[cluster] = np.array(sorted(members), dtype='int32')
+        return self.__sorted[cluster]
+
+    def count(self, cluster):
+        """returns the number of distinct members of the cluster"""
+        return len(self.__members.get(int(cluster), ()))
+
+
 class OrigMembership:
     """This is an implementation of a membership data structure that more
     closely resembles the R original. It is much simpler than
@@ -82,6 +131,9 @@ class OrigMembership:
         Each row in the matrix has num_per_X slots, each cell contains a cluster number.
         """
         self.row_membs = np.zeros((len(row_names), num_per_row), dtype='int32')
+        # counts the modifications, so copies in other processes can tell
+        # whether they are current
+        self.changes = 0
         self.col_membs = np.zeros((len(col_names), num_per_col), dtype='int32')
 
         for row, clusters in row_is_member_of.items():
@@ -94,6 +146,29 @@ class OrigMembership:
             for i in range(len(tmp)):
                 self.col_membs[self.colidx[col]][i] = tmp[i]
 
+        self.reindex()
+
+    def reindex(self):
+        """rebuilds the cluster -> member indexes. Only needed after the
+        membership tables were modified directly instead of through the
+        add/replace methods"""
+        self.__row_index = ClusterMemberIndex(self.row_membs)
+        self.__col_index = ClusterMemberIndex(self.col_membs)
+        self.changes += 1
+
+    def __getstate__(self):
+        """the cluster indexes are not pickled, they are rebuilt on unpickling"""
+        state = self.__dict__.copy()
+        del state['_OrigMembership__row_index']
+        del state['_OrigMembership__col_index']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        changes = self.changes
+        self.reindex()
+        self.changes = changes
+
     def write_column_members(self, filename):
         """Mostly for debugging, write out the current column membership state into a TSV file"""
         with open(filename, 'w') as outfile:
@@ -178,19 +253,29 @@ class OrigMembership:
         """returns the number of clusters for the column"""
         return len(self.clusters_for_column(column))
 
+    def row_indexes_for_cluster(self, cluster):
+        """returns the sorted indexes of the rows in the cluster, the
+        result is shared and must not be modified"""
+        return self.__row_index.indexes(cluster)
+
+    def column_indexes_for_cluster(self, cluster):
+        """returns the sorted indexes of the columns in the cluster, the
+        result is shared and must not be modified"""
+        return self.__col_index.indexes(cluster)
+
     def rows_for_cluster(self, cluster):
-        idx = set(np.where(self.row_membs == cluster)[0])
-        return {self.row_names[i] for i in idx}
+        row_names = self.row_names
+        return {row_names[i] for i in self.__row_index.indexes(cluster).tolist()}
 
     def columns_for_cluster(self, cluster):
-        idx = set(np.where(self.col_membs == cluster)[0])
-        return {self.col_names[i] for i in idx}
+        col_names = self.col_names
+        return {col_names[i] for i in self.__col_index.indexes(cluster).tolist()}
 
     def num_row_members(self, cluster):
-        return len(self.rows_for_cluster(cluster))
+        return self.__row_index.count(cluster)
 
     def num_column_members(self, cluster):
-        return len(self.columns_for_cluster(cluster))
+        return self.__col_index.count(cluster)
 
     def clusters_not_in_row(self, row, clusters):
         return [cluster for cluster in clusters
@@ -218,6 +303,8 @@ class OrigMembership:
         if len(free_slots > 0):
             index = free_slots[0]
             self.row_membs[rowidx, index] = cluster
+            self.__row_index.add(cluster, rowidx)
+            self.changes += 1
         elif not force:
             raise Exception(("add_cluster_to_row() - exceeded clusters/row " +
                              "limit for row: '%s'" % str(row)))
@@ -226,6 +313,8 @@ class OrigMembership:
             tmp[:, :-1] = self.row_membs
             self.row_membs = tmp
             self.row_membs[rowidx][-1] = cluster
+            self.__row_index.add(cluster, rowidx)
+            self.changes += 1
 
     def add_cluster_to_column(self, col, cluster, force=False):
         colidx = self.colidx[col]
@@ -233,6 +322,8 @@ class OrigMembership:
         if len(free_slots) > 0:
             index = free_slots[0]
             self.col_membs[colidx, index] = cluster
+            self.__col_index.add(cluster, colidx)
+            self.changes += 1
         elif not force:
             raise Exception(("add_cluster_to_column() - exceeded clusters/col " +
                              "limit for column: '%s'" % str(col)))
@@ -241,12 +332,38 @@ class OrigMembership:
             tmp[:, :-1] = self.col_membs
             self.col_membs = tmp
             self.col_membs[colidx][-1] = cluster
+            self.__col_index.add(cluster, colidx)
+            self.changes += 1
 
     def replace_row_cluster(self, row, index, new):
-        self.row_membs[self.rowidx[row], index] = new
+        rowidx = self.rowidx[row]
+        self.__row_index.remove(self.row_membs[rowidx, index], rowidx)
+        self.row_membs[rowidx, index] = new
+        self.__row_index.add(new, rowidx)
+        self.changes += 1
 
     def replace_column_cluster(self, col, index, new):
-        self.col_membs[self.colidx[col], index] = new
+        colidx = self.colidx[col]
+        self.__col_index.remove(self.col_membs[colidx, index], colidx)
+        self.col_membs[colidx, index] = new
+        self.__col_index.add(new, colidx)
+        self.changes += 1
+
+    def replace_row_clusters(self, indexes, slots, new):
+        """batch version of replace_row_cluster() that works on row indexes"""
+        for rowidx, slot, cluster in zip(indexes.tolist(), slots.tolist(), new.tolist()):
+            self.__row_index.remove(self.row_membs[rowidx, slot], rowidx)
+            self.__row_index.add(cluster, rowidx)
+        self.row_membs[indexes, slots] = new
+        self.changes += 1
+
+    def replace_column_clusters(self, indexes, slots, new):
+        """batch version of replace_column_cluster() that works on column indexes"""
+        for colidx, slot, cluster in zip(indexes.tolist(), slots.tolist(), new.tolist()):
+            self.__col_index.remove(self.col_membs[colidx, slot], colidx)
+            self.__col_index.add(cluster, colidx)
+        self.col_membs[indexes, slots] = new
+        self.changes += 1
 
     def pickle_path(self):
         """returns the function-specific pickle-path"""
@@ -282,12 +399,18 @@ class OrigMembership:
         logging.debug("COMPENSATE_SIZE() took %f s.", elapsed / 1000.0)
 
         start_time = util.current_millis()
-        update_for_rows(self, rd_scores, self.__config_params['multiprocessing'])
+        if self.__config_params.get(KEY_LEGACY_UPDATE, False):
+            update_for_rows(self, rd_scores, self.__config_params['multiprocessing'])
+        else:
+            batch_update_for_rows(self, rd_scores)
         elapsed = util.current_millis() - start_time
         logging.debug("update_for rdscores finished in %f s.", elapsed / 1000.0)
 
         start_time = util.current_millis()
-        update_for_cols(self, cd_scores, self.__config_params['multiprocessing'])
+        if self.__config_params.get(KEY_LEGACY_UPDATE, False):
+            update_for_cols(self, cd_scores, self.__config_params['multiprocessing'])
+        else:
+            batch_update_for_cols(self, cd_scores)
         elapsed = util.current_millis() - start_time
         logging.debug("update_for cdscores finished in %f s.", elapsed / 1000.0)
 
@@ -427,6 +550,91 @@ def replace_delta_column_member(membership, col, cm, cd_scores):
         membership.replace_column_cluster(col, maxidx, cm[maxidx])
 
 
+def batch_update_for_rows(membership, rd_scores):
+    """Array version of update_for_rows(). All rows are updated at once
+    with the same rules: a row that sees a change takes the best cluster for
+    its first free slot, or, if it has no free slot, replaces the
+    member with the largest score improvement"""
+    positions = np.array([membership.rowidx[row] for row in rd_scores.row_names],
+                         dtype='int32')
+    # note: for rows, the original version sorts the best clusters by cluster number !!!
+    best = best_clusters(rd_scores.values, membership.num_clusters_per_row(), True)
+    num_best = best.shape[1]
+    if num_best == 0:
+        return
+    changing = change_mask(rd_scores.num_rows, membership.probability_seeing_row_change())
+    rows = np.arange(rd_scores.num_rows)
+
+    for _ in range(membership.max_changes_per_row()):
+        membs = membership.row_membs[positions]
+        free = membs == 0
+        has_free = free.any(axis=1)
+        first_free = free.argmax(axis=1)
+        take = best[rows, np.minimum(first_free, num_best - 1)]
+        add = changing & has_free & ~(membs == take[:, np.newaxis]).any(axis=1)
+
+        # replacement: slot i competes with best cluster i
+        num_slots = min(membs.shape[1], num_best)
+        curr = membs[:, :num_slots]
+        deltas = (rd_scores.values[rows[:, np.newaxis], best[:, :num_slots] - 1] -
+                  rd_scores.values[rows[:, np.newaxis], curr - 1])
+        deltas[(curr[:, :, np.newaxis] == best[:, np.newaxis, :]).any(axis=2)] = 0.0
+        maxidx = deltas.argmax(axis=1)
+        new = best[rows, maxidx]
+        replace = (changing & ~has_free & (deltas != 0.0).any(axis=1) &
+                   ~(membs == new[:, np.newaxis]).any(axis=1))
+
+        membership.replace_row_clusters(np.concatenate([positions[add], positions[replace]]),
+                                        np.concatenate([first_free[add], maxidx[replace]]),
+                                        np.concatenate([take[add], new[replace]]))
+
+
+def batch_update_for_cols(membership, cd_scores):
+    """Array version of update_for_cols(). Columns that see a change fill
+    their first free slot, replace the first cluster they hold multiple
+    times, or replace the member with the largest score improvement"""
+    positions = np.array([membership.colidx[col] for col in cd_scores.row_names],
+                         dtype='int32')
+    best = best_clusters(cd_scores.values, membership.num_clusters_per_column())
+    num_best = best.shape[1]
+    if num_best == 0:
+        return
+    changing = change_mask(cd_scores.num_rows, membership.probability_seeing_col_change())
+    cols = np.arange(cd_scores.num_rows)
+
+    for _ in range(membership.max_changes_per_col()):
+        membs = membership.col_membs[positions]
+        free = membs == 0
+        has_free = free.any(axis=1)
+        first_free = free.argmax(axis=1)
+        add = changing & has_free
+        take = best[cols, np.minimum(first_free, num_best - 1)]
+
+        # the first slot holding a cluster that occurs more than once
+        order = membs.argsort(axis=1, kind='stable')
+        sorted_membs = np.take_along_axis(membs, order, axis=1)
+        same = sorted_membs[:, 1:] == sorted_membs[:, :-1]
+        multiple = np.zeros(membs.shape, dtype=bool)
+        multiple[:, 1:] |= same
+        multiple[:, :-1] |= same
+        np.put_along_axis(multiple, order, multiple.copy(), axis=1)
+        has_multiple = multiple.any(axis=1)
+        first_multiple = np.minimum(multiple.argmax(axis=1), num_best - 1)
+        dedup = changing & ~has_free & has_multiple
+
+        num_slots = min(membs.shape[1], num_best)
+        deltas = (cd_scores.values[cols[:, np.newaxis], best[:, :num_slots] - 1] -
+                  cd_scores.values[cols[:, np.newaxis], membs[:, :num_slots] - 1])
+        maxidx = deltas.argmax(axis=1)
+        replace = changing & ~has_free & ~has_multiple & (deltas != 0.0).any(axis=1)
+
+        membership.replace_column_clusters(
+            np.concatenate([positions[add], positions[dedup], positions[replace]]),
+            np.concatenate([first_free[add], first_multiple[dedup], maxidx[replace]]),
+            np.concatenate([take[add], best[cols, first_multiple][dedup],
+                            best[cols, maxidx][replace]]))
+
+
 def postadjust(membership, rowscores, cutoff=0.33, limit=100):
     """adjusting the cluster memberships after the main iterations have been done
     Returns true if the function changed the membership, false if not"""
@@ -492,6 +700,40 @@ def seeing_change(prob):
     return prob >= 1.0 or random.uniform(0.0, 1.0) <= prob
 
 
+def change_mask(num_values, prob):
+    """vectorized seeing_change(), returns a boolean array with num_values
+    entries. The values are drawn from a generator that is seeded from
+    the random module, so results are reproducible with a fixed random seed"""
+    if prob >= 1.0:
+        return np.ones(num_values, dtype=bool)
+    generator = np.random.RandomState(random.getrandbits(32))
+    return generator.uniform(0.0, 1.0, num_values) <= prob
+
+
+def best_clusters(values, n, sort=False):
+    """vectorized get_best_clusters() on a score matrix, returns a |rows| x n
+    matrix of 1-based cluster numbers. Like util.rorder(), ties are broken by
+    cluster number and NaN values come last. If sort is True, the clusters in
+    each row are sorted by cluster number"""
+    num_rows, num_clusters = values.shape
+    n = min(n, num_clusters)
+    if n == 0:
+        return np.zeros((num_rows, 0), dtype='int32')
+    keys = -values
+    keys[np.isnan(keys)] = np.inf
+    # the n-th smallest key is the threshold, ties at the threshold are
+    # filled up in cluster order
+    threshold = np.partition(keys, n - 1, axis=1)[:, n - 1:n]
+    below = keys < threshold
+    at = keys == threshold
+    chosen = below | (at & (np.cumsum(at, axis=1) <= n - below.sum(axis=1)[:, np.newaxis]))
+    result = np.nonzero(chosen)[1].reshape(num_rows, n)
+    if not sort:
+        order = np.take_along_axis(keys, result, axis=1).argsort(axis=1, kind='stable')
+        result = np.take_along_axis(result, order, axis=1)
+    return (result + 1).astype('int32')
+
+
 def get_best_clusters(scores, n, sort=False):
     """retrieve the n best scored clusters for the given row/column score matrix"""
     if sort:
@@ -502,25 +744,40 @@ def get_best_clusters(scores, n, sort=False):
                 for row in xrange(scores.num_rows)}
 
 
+def member_indicator(membs, positions, num_rows, num_clusters):
+    """Returns a boolean |rows| x |clusters| matrix that is True where
+    a row is a member of a cluster. membs is a membership table and
+    positions maps the rows of the membership table to rows of the result,
+    negative positions are ignored"""
+    result = np.zeros((num_rows, num_clusters + 1), dtype=bool)
+    valid = positions >= 0
+    rows = np.repeat(positions[valid], membs.shape[1])
+    result[rows, membs[valid].ravel()] = True
+    return result[:, 1:]
+
+
 def get_row_density_scores(membership, row_scores):
     """getting density scores improves small clusters"""
     num_clusters = membership.num_clusters()
     rscore_range = abs(row_scores.max() - row_scores.min())
     rowscore_bandwidth = max(rscore_range / 100.0, 0.001)
-    rd_scores = dm.DataMatrix(row_scores.num_rows,
-                              row_scores.num_columns,
-                              row_scores.row_names,
-                              row_scores.column_names)
-    rds_values = rd_scores.values
 
     start_time = util.current_millis()
-    for cluster in xrange(1, num_clusters + 1):
-        # instead of assigning the rr_scores values per row, we can assign to the
-        # transpose and let numpy do the assignment
-        rds_values.T[cluster - 1] = get_rr_scores(membership, row_scores,
-                                                  rowscore_bandwidth,
-                                                  cluster)
-
+    row_members = member_indicator(membership.row_membs,
+                                   np.arange(len(membership.row_names)),
+                                   len(membership.row_names), num_clusters)
+    col_members = member_indicator(membership.col_membs,
+                                   np.arange(len(membership.col_names)),
+                                   len(membership.col_names), num_clusters)
+    num_rows = row_members.sum(axis=0)
+    num_cols = col_members.sum(axis=0)
+    members = member_indicator(membership.row_membs,
+                               np.array(row_scores.row_indexes_for(membership.row_names)),
+                               row_scores.num_rows, num_clusters)
+    # standard bandwidth scaling function for row scores
+    bandwidths = rowscore_bandwidth * np.exp(-num_rows / 10.0) * 10.0
+    rd_scores = get_density_scores_for(row_scores, members, bandwidths,
+                                       (num_rows > 0) & (num_cols > 0))
     elapsed = util.current_millis() - start_time
     logging.debug("RR_SCORES IN %f s.", elapsed / 1000.0)
     return rd_scores
@@ -530,20 +787,21 @@ def get_col_density_scores(membership, col_scores):
     num_clusters = membership.num_clusters()
     cscore_range = abs(col_scores.max() - col_scores.min())
     colscore_bandwidth = max(cscore_range / 100.0, 0.001)
-    cd_scores = dm.DataMatrix(col_scores.num_rows,
-                              col_scores.num_columns,
-                              col_scores.row_names,
-                              col_scores.column_names)
-    cds_values = cd_scores.values
 
     start_time = util.current_millis()
-    for cluster in xrange(1, num_clusters + 1):
-        # instead of assigning the cc_scores values per row, we can assign to the
-        # transpose and let numpy do the assignment
-        cds_values.T[cluster - 1] = get_cc_scores(membership, col_scores,
-                                                  colscore_bandwidth,
-                                                  cluster)
-
+    row_members = member_indicator(membership.row_membs,
+                                   np.arange(len(membership.row_names)),
+                                   len(membership.row_names), num_clusters)
+    members = member_indicator(membership.col_membs,
+                               np.array(col_scores.row_indexes_for(membership.col_names)),
+                               col_scores.num_rows, num_clusters)
+    num_rows = row_members.sum(axis=0)
+    num_cols = members.sum(axis=0)
+    bandwidths = np.repeat(colscore_bandwidth, num_clusters)
+    # This is a little weird, but is here to at least attempt to simulate
+    # what the original cMonkey is doing
+    cd_scores = get_density_scores_for(col_scores, members, bandwidths,
+                                       (num_rows > 0) & (num_cols > 1))
     elapsed = util.current_millis() - start_time
     logging.debug("CC_SCORES IN %f s.", elapsed / 1000.0)
     return cd_scores
@@ -554,49 +812,28 @@ def get_density_scores(membership, row_scores, col_scores):
             get_col_density_scores(membership, col_scores))
 
 
-def get_rr_scores(membership, rowscores, bandwidth, cluster):
-    """calculate the density scores for the given row score values in the
-    specified cluster"""
-    def bwscale(value):
-        """standard bandwidth scaling function for row scores"""
-        return math.exp(-value / 10.0) * 10.0
+def get_density_scores_for(scores, members, bandwidths, valid):
+    """calculate the density scores for all clusters of the given score matrix
+    in one pass. Column k of members flags the members of cluster k + 1.
+    Clusters that are not valid or do not have any finite scores
+    get the uniform density 1 / |rows|"""
+    kscores = scores.values
+    finite = np.isfinite(kscores)
+    valid = valid & finite.any(axis=0)
+    values = np.empty(kscores.shape)
+    values.fill(1.0 / scores.num_rows)
 
-    cluster_rows = membership.rows_for_cluster(cluster)
-    cluster_columns = membership.columns_for_cluster(cluster)
-    kscores = rowscores.column_values(cluster - 1)
-    kscores_finite = kscores[np.isfinite(kscores)]
+    if np.any(valid):
+        kscores = kscores[:, valid]
+        finite = finite[:, valid]
+        kmin = np.where(finite, kscores, np.inf).min(axis=0)
+        kmax = np.where(finite, kscores, -np.inf).max(axis=0)
+        values[:, valid] = util.density_matrix(kscores, members[:, valid],
+                                               bandwidths[valid], kmin - 1, kmax + 1)
 
-    if len(cluster_rows) == 0 or len(kscores_finite) == 0 or len(cluster_columns) == 0:
-        num_rows = rowscores.num_rows
-        return [(1.0 / num_rows) for _ in xrange(num_rows)]
-    else:
-        score_indexes = rowscores.row_indexes_for(cluster_rows)
-        cluster_scores = [kscores[index] for index in score_indexes]
-        cluster_bandwidth = bandwidth * bwscale(len(cluster_rows))
-        return util.density(kscores, cluster_scores, cluster_bandwidth,
-                            np.amin(kscores_finite) - 1,
-                            np.amax(kscores_finite) + 1)
-
-
-def get_cc_scores(membership, scores, bandwidth, cluster):
-    """calculate the density scores for the given column score values in the
-    specified cluster"""
-    cluster_rows = membership.rows_for_cluster(cluster)
-    cluster_columns = membership.columns_for_cluster(cluster)
-    kscores = scores.column_values(cluster - 1)
-    kscores_finite = kscores[np.isfinite(kscores)]
-
-    if len(cluster_rows) == 0 or len(kscores_finite) == 0 or len(cluster_columns) <= 1:
-        # This is a little weird, but is here to at least attempt to simulate
-        # what the original cMonkey is doing
-        num_rows = scores.num_rows
-        return [(1.0 / num_rows) for _ in xrange(num_rows)]
-    else:
-        score_indexes = scores.row_indexes_for(cluster_columns)
-        cluster_scores = [kscores[index] for index in score_indexes]
-        return util.density(kscores, cluster_scores, bandwidth,
-                            np.amin(kscores_finite) - 1,
-                            np.amax(kscores_finite) + 1)
+    return dm.DataMatrix(scores.num_rows, scores.num_columns,
+                         scores.row_names, scores.column_names,
+                         values=values)
 
 
 def compensate_size(membership, matrix, rd_scores, cd_scores):
@@ -663,11 +900,7 @@ def make_kmeans_row_seeder(num_clusters):
         flat_values[np.isnan(flat_values)] = 0.0
         flat_values[np.isinf(flat_values)] = 0.0
         flat_values[np.isneginf(flat_values)] = 0.0
-        matrix_values = robjects.r.matrix(
-            robjects.FloatVector(flat_values), nrow=matrix.num_rows, byrow=True)
-        kmeans = robjects.r['kmeans']
-        kwargs = {'centers': num_clusters, 'iter.max': 20, 'nstart': 2}
-        seeding = kmeans(matrix_values, **kwargs)[0]
+        seeding = util.kmeans(flat_values.reshape(matrix.values.shape), num_clusters)
         for row in xrange(len(seeding)):
             row_membership[row][0] = seeding[row]
 
@@ -814,13 +1047,12 @@ def fuzzify(membership, row_scores, column_scores, num_iterations, iteration_res
         row_score_values = row_scores.values
         row_sd_values = []
 
-        # iterate the row names directly
-        row_names = row_scores.row_names
+        # map the membership rows to the score rows and collect the
+        # member scores of each cluster in score row order
+        positions = np.array(row_scores.row_indexes_for(membership.row_names), dtype='int32')
         for col in xrange(row_scores.num_columns):
-            cluster_rows = membership.rows_for_cluster(col + 1)
-            for row in xrange(row_scores.num_rows):
-                if row_names[row] in cluster_rows:
-                    row_sd_values.append(row_score_values[row, col])
+            rows = np.sort(positions[membership.row_indexes_for_cluster(col + 1)])
+            row_sd_values.extend(row_score_values[rows[rows >= 0], col].tolist())
 
         # Note: If there are no non-NaN values in row_sd_values, row_rnorm
         # will have all NaNs
@@ -832,12 +1064,10 @@ def fuzzify(membership, row_scores, column_scores, num_iterations, iteration_res
         num_col_fuzzy_values = column_scores.num_rows * column_scores.num_columns
         col_score_values = column_scores.values
         col_sd_values = []
-        row_names = column_scores.row_names
+        positions = np.array(column_scores.row_indexes_for(membership.col_names), dtype='int32')
         for col in xrange(column_scores.num_columns):
-            cluster_cols = membership.columns_for_cluster(col + 1)
-            for row in xrange(column_scores.num_rows):
-                if row_names[row] in cluster_cols:
-                    col_sd_values.append(col_score_values[row, col])
+            rows = np.sort(positions[membership.column_indexes_for_cluster(col + 1)])
+            col_sd_values.extend(col_score_values[rows[rows >= 0], col].tolist())
 
         # Note: If there are no non-NaN values in col_sd_values, col_rnorm
         # will have all NaNs
@@ -0,0 +1,167 @@
+# vi: sw=4 ts=4 et:
+"""membership_history.py - columnar store of the saved memberships
+
+The row_members and column_members tables of the output database hold one
+(iteration, cluster, order_num) row per membership. This store keeps the
+membership tables of each saved iteration instead, as int32 arrays with
+one row per gene/condition in the order of the row_names/column_names
+tables and one column per membership slot, 0 marks an empty slot.
+
+The store is a directory with
+- names.npz: the row and column names, written once
+- memberships-<iteration>.npz: the row_membs and col_membs arrays
+
+Iterations are only appended, the file of an iteration is found by its
+name, so reading a snapshot does not depend on the number of iterations.
+
+This file is part of cMonkey Python. Please see README and LICENSE for
+more information and licensing details.
+"""
+import os
+import re
+import logging
+import sqlite3
+import numpy as np
+import cmonkey.util as util
+
+
+NAMES_FILE = 'names.npz'
+SNAPSHOT_PATTERN = re.compile(r'memberships-(\d+)\.npz$')
+
+
+def snapshot_filename(iteration):
+    return 'memberships-%06d.npz' % iteration
+
+
+def save_npz(path, **arrays):
+    """writes the arrays to path atomically"""
+    util.write_atomic(path, lambda outfile: np.savez(outfile, **arrays))
+
+
+class MembershipSnapshot:
+    """The memberships of one saved iteration"""
+
+    def __init__(self, iteration, row_names, col_names, row_membs, col_membs):
+        self.iteration = iteration
+        self.row_names = row_names
+        self.col_names = col_names
+        self.row_membs = row_membs
+        self.col_membs = col_membs
+
+    def num_clusters(self):
+        """the largest cluster number in the snapshot"""
+        return int(max(self.row_membs.max(initial=0), self.col_membs.max(initial=0)))
+
+    def row_indexes_for_cluster(self, cluster):
+        return np.nonzero((self.row_membs == cluster).any(axis=1))[0]
+
+    def column_indexes_for_cluster(self, cluster):
+        return np.nonzero((self.col_membs == cluster).any(axis=1))[0]
+
+    def rows_for_cluster(self, cluster):
+        return [self.row_names[i] for i in self.row_indexes_for_cluster(cluster)]
+
+    def columns_for_cluster(self, cluster):
+        return [self.col_names[i] for i in self.column_indexes_for_cluster(cluster)]
+
+    def clusters_for_row(self, row_index):
+        return sorted([int(c) for c in self.row_membs[row_index] if c > 0])
+
+    def clusters_for_column(self, col_index):
+        return sorted([int(c) for c in self.col_membs[col_index] if c > 0])
+
+
+class MembershipHistory:
+    """Reads and appends the saved memberships of a run"""
+
+    def __init__(self, dirname, row_names=None, col_names=None):
+        """opens the store in dirname. To create a store, the row and column
+        names in the order of the output database have to be provided"""
+        self.dirname = dirname
+        names_path = os.path.join(dirname, NAMES_FILE)
+        if os.path.exists(names_path):
+            with np.load(names_path) as names:
+                self.row_names = names['row_names'].tolist()
+                self.col_names = names['col_names'].tolist()
+            if row_names is not None and (list(row_names) != self.row_names or
+                                          list(col_names) != self.col_names):
+                raise ValueError("the names do not match the membership history in '%s'" %
+                                 dirname)
+        elif row_names is not None:
+            if not os.path.exists(dirname):
+                os.makedirs(dirname)
+            self.row_names = list(row_names)
+            self.col_names = list(col_names)
+            save_npz(names_path, row_names=np.array(self.row_names, dtype=str),
+                     col_names=np.array(self.col_names, dtype=str))
+        else:
+            raise IOError("no membership history in '%s'" % dirname)
+
+    def append(self, iteration, row_membs, col_membs):
+        """stores the membership tables of an iteration, their rows are in
+        the order of the names"""
+        if len(row_membs) != len(self.row_names) or len(col_membs) != len(self.col_names):
+            raise ValueError('the membership tables do not match the names')
+        save_npz(os.path.join(self.dirname, snapshot_filename(iteration)),
+                 row_membs=np.asarray(row_membs, dtype=np.int32),
+                 col_membs=np.asarray(col_membs, dtype=np.int32))
+
+    def iterations(self):
+        """returns the saved iterations in ascending order"""
+        result = []
+        for name in os.listdir(self.dirname):
+            match = SNAPSHOT_PATTERN.match(name)
+            if match:
+                result.append(int(match.group(1)))
+        return sorted(result)
+
+    def snapshot(self, iteration):
+        """returns the memberships of a saved iteration or None"""
+        path = os.path.join(self.dirname, snapshot_filename(iteration))
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as arrays:
+            return MembershipSnapshot(iteration, self.row_names, self.col_names,
+                                      arrays['row_membs'], arrays['col_membs'])
+
+
+def member_table(pairs, num_members):
+    """returns the membership table for the (cluster, order_num) pairs,
+    each member's clusters are in ascending order"""
+    pairs = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+    pairs = pairs[np.lexsort((pairs[:, 0], pairs[:, 1]))]
+    counts = np.bincount(pairs[:, 1], minlength=num_members)
+    result = np.zeros((num_members, max(counts.max(initial=0), 1)), dtype=np.int32)
+    # the slot of a pair is its position among the pairs of its member
+    starts = np.cumsum(counts) - counts
+    slots = np.arange(len(pairs)) - starts[pairs[:, 1]]
+    result[pairs[:, 1], slots] = pairs[:, 0]
+    return result
+
+
+def convert_database(dbpath, dirname):
+    """writes the memberships of all saved iterations in an output
+    database into a membership history in dirname. Iterations that
+    are already in the history are skipped. Returns the history"""
+    conn = sqlite3.connect(dbpath)
+    try:
+        row_names = [row[0] for row in
+                     conn.execute('select name from row_names order by order_num')]
+        col_names = [row[0] for row in
+                     conn.execute('select name from column_names order by order_num')]
+        history = MembershipHistory(dirname, row_names, col_names)
+        done = set(history.iterations())
+        iterations = [row[0] for row in
+                      conn.execute('select distinct iteration from row_members order by iteration')
+                      if row[0] not in done]
+        for iteration in iterations:
+            row_pairs = conn.execute('select cluster, order_num from row_members where iteration=?',
+                                     [iteration]).fetchall()
+            col_pairs = conn.execute('select cluster, order_num from column_members where iteration=?',
+                                     [iteration]).fetchall()
+            history.append(iteration, member_table(row_pairs, len(row_names)),
+                           member_table(col_pairs, len(col_names)))
+        logging.info("converted %d iterations from '%s'", len(iterations), dbpath)
+        return history
+    finally:
+        conn.close()
@@ -13,11 +13,19 @@ import os
 import shutil
 import re
 import collections
+import hashlib
 import xml.etree.ElementTree as ET
 from pkg_resources import Requirement, resource_filename, DistributionNotFound
 
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
 import cmonkey.seqtools as st
 import cmonkey.util as util
+import cmonkey.pssm_scan as pssm_scan
+import cmonkey.meme_cache as meme_cache
 
 try:
     xrange
@@ -40,6 +48,9 @@ class MemeSuite:
     dust - remove low-complexity regions or sequence repeats
     meme - discover motifs in a set of sequences
     mast - search for a group of motifs in a set of sequences
+
+    With the scan engine 'pssm', the motifs are scanned in-process
+    with a PssmScanner instead of MAST
     """
     def __init__(self, config_params, background_file=None, bgmodel=None,
                  remove_tempfiles=True):
@@ -51,6 +62,90 @@ class MemeSuite:
         self.bgmodel = bgmodel
         self.__remove_tempfiles = remove_tempfiles
         self.arg_mod = config_params['MEME']['arg_mod']
+        self.version = config_params['MEME'].get('version', None)
+        self.scan_engine = config_params['MEME'].get('scan_engine', 'mast')
+        self.scanner = None
+        # the MAST database and the background file are written to the
+        # output directory of the run and removed in cleanup()
+        self.__shared_dir = config_params.get('output_dir', None)
+        self.__database_file = None
+        self.__scan_digest = None
+        self.__background_digest = None
+        # the sequences never change, so dust only masks every sequence once
+        self.dust_cache = None
+        cache_size = int(config_params['MEME'].get('cache_size', 0))
+        if config_params.get('cache_dir', None) is not None and cache_size > 0:
+            self.dust_cache = meme_cache.DustCache(config_params['cache_dir'],
+                                                   self.dust_tool_id(),
+                                                   cache_size * 1024 * 1024)
+
+    def set_scan_sequences(self, seqs):
+        """sets the sequences that the motifs are scanned on, seqs is a
+        dictionary of (feature_id : (location, sequence)). The in-process
+        scanner encodes them once for the run, for MAST, the sequence
+        database is written once and shared by all MAST runs. Without an
+        output directory, the database is a temporary file"""
+        seqpairs = [(feature_id, locseq[1]) for feature_id, locseq in seqs.items()]
+        fasta = StringIO()
+        st.write_sequences_to_fasta_file(fasta, seqpairs)
+        self.__scan_digest = hashlib.sha1(fasta.getvalue().encode('utf-8')).hexdigest()
+        if self.scan_engine == 'pssm':
+            self.scanner = pssm_scan.PssmScanner(seqpairs)
+        elif self.__shared_dir is not None:
+            self.__database_file = util.write_content_addressed(
+                self.__shared_dir, 'mastdb', fasta.getvalue())
+        else:
+            self.__database_file = self.make_sequence_file(seqpairs)
+
+    def database_file(self):
+        """returns the shared MAST sequence database or None if it was
+        not created"""
+        return self.__database_file
+
+    def cleanup(self):
+        """removes the shared MAST sequence database and the global
+        background file at the end of the run"""
+        if not self.__remove_tempfiles:
+            return
+        for path in [self.__database_file, self.__background_file]:
+            try:
+                if path is not None and os.path.exists(path):
+                    os.remove(path)
+            except OSError:
+                logging.warn("could not remove tmp file: '%s'", path)
+        self.__database_file = None
+
+    def meme_seed(self, previous_motif_infos):  # pylint: disable-msg=W0613,R0201
+        """returns the consensus string that MEME is seeded with or None"""
+        return None
+
+    def cache_key(self, params):
+        """returns the key of the run's result in the MEME result cache,
+        a hash of everything the result depends on: the MEME settings,
+        the input sequences, the background and the scanned sequences.
+        Returns None if the result can not be cached"""
+        if self.__scan_digest is None:
+            return None
+        digest = hashlib.sha1()
+        settings = [type(self).__name__, self.version, self.scan_engine,
+                    self.max_width, self.background_order, self.__use_revcomp,
+                    self.arg_mod, params.num_motifs,
+                    self.meme_seed(params.previous_motif_infos)]
+        digest.update(repr(settings).encode('utf-8'))
+        digest.update(self.__scan_digest.encode('utf-8'))
+        if self.__background_file is not None:
+            if self.__background_digest is None:
+                with open(self.__background_file, 'rb') as infile:
+                    self.__background_digest = hashlib.sha1(infile.read()).hexdigest()
+            digest.update(self.__background_digest.encode('utf-8'))
+        else:
+            # the background are the scanned sequences that are not in the cluster
+            digest.update(repr(sorted(params.feature_ids)).encode('utf-8'))
+        for feature_id in sorted(params.feature_ids):
+            if feature_id in params.seqs:
+                digest.update(('>%s\n%s\n' % (feature_id,
+                                                params.seqs[feature_id])).encode('utf-8'))
+        return digest.hexdigest()
 
     def global_background_file(self):
         """returns the global background file used with this meme suite
@@ -59,7 +154,8 @@ class MemeSuite:
 
     def remove_low_complexity(self, seqs):
         """send sequences through dust filter, send only those
-        to dust that are larger than max_width"""
+        to dust that are larger than max_width. With a cache directory,
+        only the sequences that were not masked before are sent to dust"""
         def process_with_dust(seqs):
             """data conversion from and to dust tool"""
             dust_tmp_file = None
@@ -89,10 +185,18 @@ class MemeSuite:
                     seqs_for_dust[feature_id] = seq[1]
         # only non-empty-input gets into dust, dust can not
         # handle empty input
-        if len(seqs_for_dust) > 0:
-            return process_with_dust(seqs_for_dust)
-        else:
+        if len(seqs_for_dust) == 0:
             return {}
+        if self.dust_cache is None:
+            return process_with_dust(seqs_for_dust)
+
+        result, missing = self.dust_cache.lookup(seqs_for_dust)
+        logging.debug("dust: %d cached sequences, %d to mask", len(result), len(missing))
+        if len(missing) > 0:
+            masked = process_with_dust(missing)
+            self.dust_cache.put(missing, masked)
+            result.update(masked)
+        return result
 
     def __call__(self, params):
         """Runs the meme tool. input_seqs is a dictionary of
@@ -107,21 +211,21 @@ class MemeSuite:
         all_seqs = params.used_seqs
 
         def background_file():
-            """decide whether to use global or specific background file"""
+            """decide whether to use global or specific background file,
+            returns the file name and the background model"""
             if self.__background_file is not None:
                 #logging.info("using global background: '%s'", self.__background_file)
-                return self.__background_file
+                return self.__background_file, self.bgmodel
             else:
                 bgseqs = {feature_id: all_seqs[feature_id]
                           for feature_id in all_seqs
                           if feature_id not in feature_ids}
-                # note: the result of make_background_file is a tuple !!
                 return make_background_file(bgseqs, self.__use_revcomp,
-                                            self.background_order)[0]
+                                            self.background_order)
 
         try:
             #logging.info("run_meme() - # seqs = %d", len(input_seqs))
-            bgfile = background_file()
+            bgfile, bgmodel = background_file()
             #logging.info("created background file in %s", bgfile)
             seqfile = self.make_sequence_file(
                 [(feature_id, input_seqs[feature_id])
@@ -132,6 +236,7 @@ class MemeSuite:
 
             # run mast
             meme_outfile = None
+            dbfile = None
             mast_failed = False
             is_last_iteration = params.iteration > params.num_iterations
             if 'keep_memeout' in params.debug or is_last_iteration:
@@ -139,22 +244,30 @@ class MemeSuite:
                                             'meme-out-%04d-%04d' % (params.iteration, params.cluster))
                 with open(meme_outfile, 'w') as outfile:
                     outfile.write(output)
-            else:
+            elif self.scanner is None:
                 with tempfile.NamedTemporaryFile(mode='w+', prefix='meme.out.',
                                                  delete=False) as outfile:
                     meme_outfile = outfile.name
                     outfile.write(output)
 
             #logging.info('wrote meme output to %s', meme_outfile)
-            dbfile = self.make_sequence_file(
-                [(feature_id, locseq[1])
-                 for feature_id, locseq in all_seqs.items()])
-            #logging.info('created mast database in %s', dbfile)
+            if self.scanner is None:
+                dbfile = self.__database_file
+                if dbfile is None:
+                    dbfile = self.make_sequence_file(
+                        [(feature_id, locseq[1])
+                         for feature_id, locseq in all_seqs.items()])
+                #logging.info('created mast database in %s', dbfile)
         except subprocess.CalledProcessError as e:
             logging.error("MEME output: %s", e.output)
             return MemeRunResult([], [], [])
 
         try:
+            if self.scanner is not None:
+                pe_values, annotations = self.scanner.scan(motif_infos, bgmodel,
+                                                           input_seqs.keys())
+                return MemeRunResult(pe_values, annotations, motif_infos)
+
             mast_output = self.mast(meme_outfile, dbfile, bgfile)
             # There is a bug in MAST, catch that here to report to MEME team
             # when it is fixed, we could remove it
@@ -190,12 +303,16 @@ class MemeSuite:
                 except:
                     logging.warn("could not remove tmp file: '%s'", seqfile)
                 try:
-                    if 'keep_memeout' not in params.debug and not is_last_iteration:
+                    if (meme_outfile is not None and 'keep_memeout' not in params.debug
+                        and not is_last_iteration):
                         os.remove(meme_outfile)
                 except:
                     logging.warn("could not remove tmp file: '%s'", meme_outfile)
                 try:
-                    os.remove(dbfile)
+                    # the shared database is kept for the other clusters,
+                    # it is removed in cleanup()
+                    if dbfile is not None and dbfile != self.__database_file:
+                        os.remove(dbfile)
                 except:
                     logging.warn("could not remove tmp file: '%s'", dbfile)
 
@@ -219,11 +336,21 @@ class MemeSuite:
             st.write_sequences_to_fasta_file(outfile, seqs)
         return filename
 
-    def dust(self, fasta_file_path):  # pylint: disable-msg=R0201
+    def dust_command(self):  # pylint: disable-msg=R0201
+        """returns the dust command without the input file"""
+        return ['dust']
+
+    def dust_tool_id(self):
+        """identifies the dust executable and its arguments for the dust
+        cache. dust has no version option, the executable's digest is used"""
+        return '%s %s' % (repr(self.dust_command()),
+                          util.file_digest(util.find_executable(self.dust_command()[0])))
+
+    def dust(self, fasta_file_path):
         """runs the dust command on the specified FASTA file and
         returns a list of sequences. It is assumed that dust has
         a very simple interface: FASTA in, output on stdout"""
-        output = subprocess.check_output(['dust', fasta_file_path])
+        output = subprocess.check_output(self.dust_command() + [fasta_file_path])
         return output.decode('utf-8')
 
     # pylint: disable-msg=W0613,R0201
@@ -241,6 +368,22 @@ class MemeSuite:
 class MemeSuite430(MemeSuite):
     """Version 4.3.0 of MEME"""
 
+    def meme_seed(self, previous_motif_infos):
+        """determines the seed sequence (-cons parameter) for this MEME run
+        uses the PSSM with the smallest score that has an e-value lower
+        than 0.1"""
+        if previous_motif_infos is not None:
+            max_evalue = 0.1
+            min_evalue = 10000000.0
+            min_motif_info = None
+            for motif_info in previous_motif_infos:
+                if motif_info.evalue < min_evalue:
+                    min_evalue = motif_info.evalue
+                    min_motif_info = motif_info
+            if min_motif_info is not None and min_motif_info.evalue < max_evalue:
+                return min_motif_info.consensus_string().upper()
+        return None
+
     def meme(self, infile_path, bgfile_path, num_motifs,
              previous_motif_infos=None, pspfile_path=None):
         """runs the meme command on the specified input file, background file
@@ -252,21 +395,10 @@ class MemeSuite430(MemeSuite):
                    '-maxsize', '9999999', '-nmotifs', str(num_motifs),
                    '-evt', '1e9', '-minw', '6', '-maxw', str(self.max_width),
                    '-mod',  self.arg_mod, '-nostatus', '-text']
-        # if determine the seed sequence (-cons parameter) for this MEME run
-        # uses the PSSM with the smallest score that has an e-value lower
-        # than 0.1
-        if previous_motif_infos is not None:
-            max_evalue = 0.1
-            min_evalue = 10000000.0
-            min_motif_info = None
-            for motif_info in previous_motif_infos:
-                if motif_info.evalue < min_evalue:
-                    min_evalue = motif_info.evalue
-                    min_motif_info = motif_info
-            if min_motif_info is not None and min_motif_info.evalue < max_evalue:
-                cons = min_motif_info.consensus_string().upper()
-                logging.debug("seeding MEME with good motif %s", cons)
-                command.extend(['-cons', cons])
+        cons = self.meme_seed(previous_motif_infos)
+        if cons is not None:
+            logging.debug("seeding MEME with good motif %s", cons)
+            command.extend(['-cons', cons])
 
         if pspfile_path:
             command.extend(['-psp', pspfile_path])
@@ -410,94 +542,125 @@ class MemeMotifInfo:
                  str(self.evalue)))
 
 
+# patterns of the MEME text output, compiled once
+MEME_INFO_LINE = re.compile('MOTIF\s+(\d+)\s')
+MEME_SITES_HEADER = re.compile('[\t]Motif \d+ sites sorted by position p-value')
+MEME_PSSM_HEADER = re.compile('[\t]Motif \d+ position-specific probability matrix')
+MEME_SITE_ROW = re.compile("(\S+)\s+([+-])\s+(\d+)\s+(\S+)\s+(\S+) (\S+) (\S+)?")
+MEME_PSSM_ROW = re.compile("\s+(\S+)\s+(\S+)\s+(\S+)\s+(\S+)")
+MEME_SECTION_END = '----------------------'
+
+# the number of lines between the section headers and the first row
+MEME_SITES_SKIP = 3
+MEME_PSSM_SKIP = 2
+
+
 def read_meme_output(output_text, num_motifs):
     """Reads meme output file into a list of MotifInfo objects"""
-
-    def extract_width(infoline):
-        """extract the width value from the info line"""
-        return int(__extract_regex('width =\s+\d+', infoline))
-
-    def extract_num_sites(infoline):
-        """extract the sites value from the info line"""
-        return int(__extract_regex('sites =\s+\d+', infoline))
-
-    def extract_llr(infoline):
-        """extract the llr value from the info line"""
-        return int(__extract_regex('llr =\s+\d+', infoline))
-
-    def extract_evalue(infoline):
-        """extract the e-value from the info line"""
-        return float(__extract_regex('E-value =\s+\S+', infoline))
-
-    def next_info_line(motif_number, lines):
-        """finds the index of the next info line for the specified motif number
-        1-based """
-        return __next_regex_index('MOTIF\s+' + str(motif_number) + '.*',
-                                  0, lines)
-
-    def next_sites_index(start_index, lines):
-        """returns the next sites index"""
-        return __next_regex_index('[\t]Motif \d+ sites sorted by position ' +
-                                  'p-value', start_index, lines)
-
-    def read_sites(start_index, lines):
-        """reads the sites"""
-        sites_index = next_sites_index(start_index, lines)
-        pattern = re.compile(
-            "(\S+)\s+([+-])\s+(\d+)\s+(\S+)\s+(\S+) (\S+) (\S+)?")
-        current_index = sites_index + 4
-        line = lines[current_index]
-        sites = []
-        while not line.startswith('----------------------'):
-            match = pattern.match(line)
+    return read_meme_output_stream(StringIO(output_text), num_motifs)
+
+
+def read_meme_output_stream(lines, num_motifs):
+    """Reads the MEME text output from an iterable of lines, e.g. an open
+    file or a pipe, in a single pass and returns the MemeMotifInfo objects
+    of the motifs 1 to num_motifs"""
+    motifs = {}
+    motif_number = None
+    info = None
+    sites = None
+    pssm = None
+    rows = None  # the rows of the section that is being read
+    row_pattern = None
+    skip = 0
+
+    for line_number, line in enumerate(lines):
+        line = line.rstrip('\r\n')
+        if skip > 0:
+            skip -= 1
+        elif rows is not None:
+            if line.startswith(MEME_SECTION_END):
+                rows = None
+                continue
+            match = row_pattern.match(line)
             if match is None:
-                logging.error("ERROR in read_sites(), line(#%d) is: '%s'", current_index, line)
-            sites.append((match.group(1), match.group(2), int(match.group(3)),
-                          float(match.group(4)),
-                          match.group(5), match.group(6), match.group(7)))
-            current_index += 1
-            line = lines[current_index]
-        return sites
-
-    def read_pssm(start_index, lines):
-        """reads the PSSM, in this case it's what is called the probability
-        matrix in the meme output"""
-        pssm_index = next_pssm_index(start_index, lines)
-        current_index = pssm_index + 3
-        line = lines[current_index]
-        pattern = re.compile("\s+(\S+)\s+(\S+)\s+(\S+)\s+(\S+)")
-        rows = []
-        while not line.startswith('----------------------'):
-            match = pattern.match(line)
-            if match is None:
-                logging.error("ERROR in read_pssm(), line(#%d) is: '%s'", current_index, line)
-            rows.append([float(match.group(1)), float(match.group(2)),
-                         float(match.group(3)), float(match.group(4))])
-            current_index += 1
-            line = lines[current_index]
-        return rows
-
-    def next_pssm_index(start_index, lines):
-        """determines the next PSSM start index"""
-        return __next_regex_index('[\t]Motif \d+ position-specific ' +
-                                  'probability matrix', start_index, lines)
-
-    def read_motif_info(motif_number, lines):
-        """Reads the MemeMotifInfo with the specified number from the input"""
-        info_line_index = next_info_line(motif_number, lines)
-        info_line = lines[info_line_index]
-        return MemeMotifInfo(read_pssm(info_line_index + 1, lines),
-                             motif_number,
-                             extract_width(info_line),
-                             extract_num_sites(info_line),
-                             extract_llr(info_line),
-                             extract_evalue(info_line),
-                             read_sites(info_line_index + 1, lines))
-
-    lines = output_text.split('\n')
+                logging.error("ERROR in read_meme_output_stream(), line(#%d) is: '%s'",
+                              line_number, line)
+            if row_pattern is MEME_SITE_ROW:
+                rows.append((match.group(1), match.group(2), int(match.group(3)),
+                             float(match.group(4)),
+                             match.group(5), match.group(6), match.group(7)))
+            else:
+                rows.append([float(match.group(1)), float(match.group(2)),
+                             float(match.group(3)), float(match.group(4))])
+        elif line.startswith('MOTIF'):
+            match = MEME_INFO_LINE.match(line)
+            if match is not None:
+                motif_number = int(match.group(1))
+                info = line
+                sites = []
+                pssm = []
+                motifs[motif_number] = (info, sites, pssm)
+        elif motif_number is not None and line.startswith('\t'):
+            if MEME_SITES_HEADER.match(line):
+                rows, row_pattern, skip = sites, MEME_SITE_ROW, MEME_SITES_SKIP
+            elif MEME_PSSM_HEADER.match(line):
+                rows, row_pattern, skip = pssm, MEME_PSSM_ROW, MEME_PSSM_SKIP
+
     result = []
-    for motif_number in xrange(1, num_motifs + 1):
-        result.append(read_motif_info(motif_number, lines))
+    for number in xrange(1, num_motifs + 1):
+        info, sites, pssm = motifs[number]
+        result.append(MemeMotifInfo(pssm, number,
+                                    int(__extract_regex('width =\s+\d+', info)),
+                                    int(__extract_regex('sites =\s+\d+', info)),
+                                    int(__extract_regex('llr =\s+\d+', info)),
+                                    float(__extract_regex('E-value =\s+\S+', info)),
+                                    sites))
+    return result
+
+
+def read_meme_output_xml(output_text, num_motifs):
+    """Reads the MEME XML output (meme.xml) into a list of MemeMotifInfo
+    objects, the sites are in the same format as the ones read from the
+    text output"""
+    root = ET.fromstring(output_text)
+    letters = {letter.get('id'): letter.get('symbol')
+               for letter in root.find('training_set').iter('letter')}
+    seqnames = {sequence.get('id'): sequence.get('name')
+                for sequence in root.find('training_set').iter('sequence')}
+
+    def read_site(contributing_site):
+        """site position in XML is 0-based, in the text output it is 1-based"""
+        site = ''.join([letters[letter_ref.get('letter_id')]
+                        for letter_ref in contributing_site.find('site').iter('letter_ref')])
+        return (seqnames[contributing_site.get('sequence_id')],
+                '+' if contributing_site.get('strand') == 'plus' else '-',
+                int(contributing_site.get('position')) + 1,
+                float(contributing_site.get('pvalue')),
+                contributing_site.findtext('left_flank', ''), site,
+                contributing_site.findtext('right_flank', ''))
+
+    def read_pssm_row(alphabet_array):
+        """the probabilities in the order ACGT"""
+        values = {letters[value.get('letter_id')]: float(value.text)
+                  for value in alphabet_array.iter('value')}
+        return [values['A'], values['C'], values['G'], values['T']]
+
+    result = []
+    for motif in root.find('motifs').iter('motif'):
+        motif_number = len(result) + 1
+        if motif_number > num_motifs:
+            break
+        probabilities = motif.find('probabilities').find('alphabet_matrix')
+        result.append(MemeMotifInfo([read_pssm_row(alphabet_array)
+                                     for alphabet_array in probabilities.iter('alphabet_array')],
+                                    motif_number,
+                                    int(motif.get('width')),
+                                    int(motif.get('sites')),
+                                    int(float(motif.get('llr'))),
+                                    float(motif.get('e_value')),
+                                    [read_site(contributing_site)
+                                     for contributing_site in
+                                     motif.find('contributing_sites').iter('contributing_site')]))
     return result
 
 
@@ -723,48 +886,62 @@ def __next_regex_index(pat, start_index, lines):
     return line_index
 
 
-def make_background_file(bgseqs, use_revcomp, bgorder):
+def make_background_file(bgseqs, use_revcomp, bgorder, dirname=None):
     """create a meme background file and returns its name and the model itself as
-    a tuple"""
+    a tuple. If dirname is specified, the file is written there and named
+    after its contents, so it is only written once"""
     def make_seqs(seqs):
         """prepare the input sequences for feeding into meme.
         This means only taking the unique sequences and their reverse
         complement if desired"""
         meme_input_seqs = []
+        seen = set()
         for locseq in seqs.values():
             seq = locseq[1]
-            if seq not in meme_input_seqs:
+            if seq not in seen:
+                seen.add(seq)
                 meme_input_seqs.append(seq)
             if use_revcomp:
                 revseq = st.revcomp(seq)
-                if revseq not in meme_input_seqs:
+                if revseq not in seen:
+                    seen.add(revseq)
                     meme_input_seqs.append(revseq)
         return meme_input_seqs
 
     filename = None
     bgmodel = st.markov_background(make_seqs(bgseqs), bgorder)
-    with tempfile.NamedTemporaryFile(mode='w+', prefix='memebg',
-                                     delete=False) as outfile:
-        filename = outfile.name
-        #logging.info("make background file '%s'", filename)
-        outfile.write("# %s order Markov background model\n" %
-                      util.order2string(len(bgmodel) - 1))
-        for order_row in bgmodel:
-            for seq, frequency in order_row.items():
-                outfile.write('%s %10s\n' %
-                              (seq, str(round(frequency, 8))))
+    text = StringIO()
+    text.write("# %s order Markov background model\n" %
+               util.order2string(len(bgmodel) - 1))
+    for order_row in bgmodel:
+        for seq, frequency in order_row.items():
+            text.write('%s %10s\n' % (seq, str(round(frequency, 8))))
+
+    if dirname is not None:
+        filename = util.write_content_addressed(dirname, 'memebg', text.getvalue())
+    else:
+        with tempfile.NamedTemporaryFile(mode='w+', prefix='memebg',
+                                         delete=False) as outfile:
+            filename = outfile.name
+            #logging.info("make background file '%s'", filename)
+            outfile.write(text.getvalue())
     return (filename, bgmodel)
 
 
 def global_background_file(organism, gene_aliases, seqtype, bgorder=3,
-                           use_revcomp=True):
+                           use_revcomp=True, seqs=None, dirname=None):
     """returns a background file that was computed on the set of all
-    used sequences"""
-    global_seqs = organism.sequences_for_genes_scan(gene_aliases,
-                                                    seqtype=seqtype)
+    used sequences. seqs can be the already retrieved scan sequences
+    of the genes. The file is written to dirname, which should be the
+    output directory of the run, or to a temporary file"""
+    if seqs is not None:
+        global_seqs = seqs
+    else:
+        global_seqs = organism.sequences_for_genes_scan(gene_aliases,
+                                                        seqtype=seqtype)
     logging.debug("Computing global background file on seqtype '%s' " +
                   "(%d sequences)", seqtype, len(global_seqs))
-    return make_background_file(global_seqs, use_revcomp, bgorder)
+    return make_background_file(global_seqs, use_revcomp, bgorder, dirname=dirname)
 
 
 USER_TEST_FASTA_PATH = 'cmonkey/default_config/fasta_test.fa'
@@ -0,0 +1,151 @@
+# vi: sw=4 ts=4 et:
+"""meme_cache.py - persistent cache of MEME/MAST and dust results
+
+The results of MEME runs are stored on disk, keyed by a hash of everything
+the result depends on (see MemeSuite.cache_key()). Clusters with a sequence
+set that was seen before, in an earlier iteration, in another cluster, or
+in an earlier or resumed run on the same data, can reuse the stored result
+instead of running MEME again.
+The cache is bounded in size, the least recently used results are evicted
+first.
+The dust filter output of each sequence is cached in the same way, keyed
+by the dust tool and the sequence, so the sequences of a genome are only
+masked once.
+
+This file is part of cMonkey Python. Please see README and LICENSE for
+more information and licensing details.
+"""
+import os
+import logging
+import hashlib
+import cmonkey.util as util
+
+# Python2/Python3 compatibility
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+RESULT_SUFFIX = '.pkl'
+DUST_CACHE_DIR = 'dust'
+
+
+class MemeResultCache:
+    """A directory of pickled MemeRunResult objects or other results, one
+    file per key.
+    The modification time of a file is its last use, eviction removes
+    the oldest files until the cache fits into max_size bytes"""
+
+    def __init__(self, dirname, max_size):
+        """creates the cache in dirname, max_size is the size limit in bytes"""
+        self.dirname = dirname
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+    def __path(self, key):
+        return os.path.join(self.dirname, key + RESULT_SUFFIX)
+
+    def get(self, key):
+        """returns the result stored for key or None"""
+        path = self.__path(key)
+        try:
+            with open(path, 'rb') as infile:
+                result = pickle.load(infile)
+            os.utime(path, None)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            # missing, evicted by another run or unreadable
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        """stores the result for key"""
+        util.write_atomic(self.__path(key), lambda outfile: pickle.dump(result, outfile))
+
+    def size(self):
+        """returns the total size of the stored results in bytes"""
+        return sum([size for _, size, _ in self.__entries()])
+
+    def __entries(self):
+        """returns (mtime, size, path) for all stored results"""
+        result = []
+        for name in os.listdir(self.dirname):
+            if name.endswith(RESULT_SUFFIX):
+                path = os.path.join(self.dirname, name)
+                try:
+                    stat = os.stat(path)
+                    result.append((stat.st_mtime, stat.st_size, path))
+                except OSError:
+                    pass
+        return result
+
+    def evict(self):
+        """removes the least recently used results until the cache
+        fits into max_size, returns the number of removed results"""
+        entries = sorted(self.__entries())
+        total = sum([size for _, size, _ in entries])
+        num_removed = 0
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                logging.warn("could not remove cached MEME result: '%s'", path)
+            total -= size
+            num_removed += 1
+        return num_removed
+
+    def reset_stats(self):
+        """resets the hit and miss counters"""
+        self.hits = 0
+        self.misses = 0
+
+
+def sequence_digest(seq):
+    """returns the key of a sequence in the dust cache"""
+    return hashlib.sha1(seq.encode('utf-8')).hexdigest()
+
+
+class DustCache:
+    """The masked sequences of the dust filter, one file per sequence in a
+    size bounded MemeResultCache. The key also covers the dust executable
+    and its arguments, so masks of another dust are not reused. Runs that
+    share the cache directory write separate files, so they do not lose
+    each other's entries"""
+
+    def __init__(self, dirname, tool_id, max_size):
+        """creates the cache in a subdirectory of dirname, tool_id identifies
+        the dust executable and arguments, max_size is the size limit in bytes"""
+        self.tool_id = tool_id
+        self.store = MemeResultCache(os.path.join(dirname, DUST_CACHE_DIR), max_size)
+
+    def __key(self, seq):
+        return sequence_digest('%s\n%s' % (self.tool_id, seq))
+
+    def lookup(self, seqs):
+        """seqs is a dictionary of (feature_id : sequence). Returns a pair
+        of the masked sequences that were found and the unmasked
+        sequences that were not found, both keyed by feature id"""
+        found = {}
+        missing = {}
+        for feature_id, seq in seqs.items():
+            masked_seq = self.store.get(self.__key(seq))
+            if masked_seq is not None:
+                found[feature_id] = masked_seq
+            else:
+                missing[feature_id] = seq
+        return found, missing
+
+    def put(self, seqs, masked_seqs):
+        """stores the masked sequences, seqs and masked_seqs are
+        dictionaries of (feature_id : sequence)"""
+        for feature_id, masked_seq in masked_seqs.items():
+            if feature_id in seqs:
+                self.store.put(self.__key(seqs[feature_id]), masked_seq)
+        self.store.evict()
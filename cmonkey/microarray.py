@@ -10,6 +10,7 @@ import numpy as np
 import logging
 import cmonkey.datamatrix as dm
 import cmonkey.util as util
+import cmonkey.membership as memb
 import cmonkey.scoring as scoring
 
 try:
@@ -45,91 +46,92 @@ def seed_column_members(data_matrix, row_membership, num_clusters,
     return column_members
 
 
-def compute_row_scores(membership, matrix, num_clusters, config_params):
+# upper bound for the number of elements in the temporary
+# genes x columns x clusters block of the row scoring kernel
+ROW_SCORE_BLOCK_SIZE = 1 << 22
+
+
+def compute_row_scores(membership, matrix, num_clusters, config_params,
+                       valid=None):
     """for each cluster 1, 2, .. num_clusters compute the row scores
-    for the each row name in the input name matrix"""
+    for the each row name in the input name matrix.
+    valid is an optional precomputed mask of the non-NaN values of the
+    matrix"""
     start_time = util.current_millis()
-    cluster_row_scores = __compute_row_scores_for_clusters(
-        membership, matrix, num_clusters, config_params)
+    row_members, col_members = cluster_member_matrices(membership, matrix,
+                                                       num_clusters)
+    values = np.empty((matrix.num_rows, num_clusters))
+    compute_fused_row_scores(matrix.values, row_members, col_members, values,
+                             valid)
     # TODO: replace the nan/inf-Values with the quantile-thingy in the R-version
-
-    logging.debug("__compute_row_scores_for_clusters() in %f s.",
+    logging.debug("compute_fused_row_scores() in %f s.",
                   (util.current_millis() - start_time) / 1000.0)
 
-    # rearrange result into a DataMatrix, where rows are indexed by gene
-    # and columns represent clusters
-    start_time = util.current_millis()
-    values = np.zeros((matrix.num_rows, num_clusters))
-
-    # note that cluster is 0 based on a matrix
-    for cluster in xrange(num_clusters):
-        row_scores = cluster_row_scores[cluster]
-        values[:, cluster] = row_scores
-    result = dm.DataMatrix(matrix.num_rows, num_clusters,
-                           row_names=matrix.row_names,
-                           values=values)
-    logging.debug("made result matrix in %f s.",
-                  (util.current_millis() - start_time) / 1000.0)
-    return result
-
-ROW_SCORE_MATRIX = None
-ROW_SCORE_MEMBERSHIP = None
-
-
-def __compute_row_scores_for_clusters(membership, matrix, num_clusters,
-                                      config_params):
-    """compute the pure row scores for the specified clusters
-    without nowmalization"""
-    # note that we set the data into globals before we fork it off
-    # to save memory and pickling time
-    global ROW_SCORE_MATRIX, ROW_SCORE_MEMBERSHIP
-    ROW_SCORE_MATRIX = matrix
-    ROW_SCORE_MEMBERSHIP = membership
-
-    if config_params['multiprocessing']:
-        with util.get_mp_pool(config_params) as pool:
-            result = pool.map(compute_row_scores_for_cluster, xrange(1, num_clusters + 1))
-    else:
-        result = []
-        for cluster in range(1, num_clusters + 1):
-            result.append(compute_row_scores_for_cluster(cluster))
-    # cleanup
-    ROW_SCORE_MATRIX = None
-    ROW_SCORE_MEMBERSHIP = None
-    return result
-
-
-def compute_row_scores_for_cluster(cluster):
-    """This function computes the row score for a cluster"""
-    global ROW_SCORE_MATRIX, ROW_SCORE_MEMBERSHIP
-    membership = ROW_SCORE_MEMBERSHIP
-    matrix = ROW_SCORE_MATRIX
-
-    rnames = membership.rows_for_cluster(cluster)
-    cnames = membership.columns_for_cluster(cluster)
-    sm1 = matrix.submatrix_by_name(row_names=rnames, column_names=cnames)
-
-    if sm1.num_columns > 1:
-        matrix_filtered = matrix.submatrix_by_name(column_names=cnames)
-        row_scores_for_cluster = __compute_row_scores_for_submatrix(
-            matrix_filtered, sm1)
-        return row_scores_for_cluster
-    else:
-        return None
-
-
-def __compute_row_scores_for_submatrix(matrix, submatrix):
-    """For a given matrix, compute the row scores. The second submatrix is
-    used to calculate the column means on and should be derived from
-    datamatrix filtered by the row names and column names of a specific
-    cluster.
-    matrix should be filtered by the columns of a specific cluster in
-    order for the column means to be applied properly.
-    The result is a DataMatrix with one row containing all the row scores"""
-    rm = util.row_means(np.square(matrix.values - util.column_means(submatrix.values)))
+    # rows are indexed by gene and columns represent clusters
+    return dm.DataMatrix(matrix.num_rows, num_clusters,
+                         row_names=matrix.row_names,
+                         values=values)
+
+
+def cluster_member_matrices(membership, matrix, num_clusters):
+    """returns the boolean |rows| x |clusters| and |columns| x |clusters|
+    membership indicators in the row and column order of matrix.
+    Members that are not in the matrix are ignored"""
+    row_positions = np.array(matrix.row_indexes_for(membership.row_names),
+                             dtype=np.int64)
+    col_positions = np.array(matrix.column_indexes_for(membership.col_names),
+                             dtype=np.int64)
+    row_members = memb.member_indicator(membership.row_membs, row_positions,
+                                        matrix.num_rows, num_clusters)
+    col_members = memb.member_indicator(membership.col_membs, col_positions,
+                                        len(matrix.column_names), num_clusters)
+    return row_members, col_members
+
+
+def compute_fused_row_scores(values, row_members, col_members, result,
+                             valid=None, block_size=ROW_SCORE_BLOCK_SIZE):
+    """computes the row scores of all clusters at once and writes them
+    into the preallocated |rows| x |clusters| result array.
+    For each cluster this is the log of the mean squared deviation of every
+    row from the cluster's column means over the cluster's columns. NaN
+    values are ignored, clusters without rows or with less than 2 columns
+    have NaN scores.
+    The deviations are computed in blocks of columns, so the temporary
+    arrays have at most block_size elements"""
+    num_rows, num_cols = values.shape
+    num_clusters = row_members.shape[1]
+    if valid is None:
+        valid = ~np.isnan(values)
+    zeroed = np.where(valid, values, 0.0)
+    valid_f = valid.astype(np.float64)
+    row_members_f = row_members.astype(np.float64)
+
+    # masked column means of the member rows, NaN for columns without values
+    with np.errstate(divide='ignore', invalid='ignore'):
+        colmeans = np.dot(zeroed.T, row_members_f) / np.dot(valid_f.T, row_members_f)
+    weights = col_members & ~np.isnan(colmeans)
+    colmeans[~weights] = 0.0
+    weights = weights.astype(np.float64)
+
+    sums = np.zeros((num_rows, num_clusters))
+    step = max(1, block_size // max(1, num_rows * num_clusters))
+    for start in xrange(0, num_cols, step):
+        block = slice(start, start + step)
+        diff = zeroed[:, block, np.newaxis] - colmeans[np.newaxis, block, :]
+        np.square(diff, out=diff)
+        diff *= valid_f[:, block, np.newaxis]
+        diff *= weights[np.newaxis, block, :]
+        sums += diff.sum(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.divide(sums, np.dot(valid_f, weights), out=result)
     # we clip the values to make sure the argument to log will be
     # sufficiently above 0 to avoid errors
-    return np.log(np.clip(rm, 1e-20, 1000.0) + 1e-99)
+    np.clip(result, 1e-20, 1000.0, out=result)
+    result += 1e-99
+    np.log(result, out=result)
+    result[:, (row_members.sum(axis=0) == 0) | (col_members.sum(axis=0) <= 1)] = np.nan
+    return result
 
 
 class RowScoringFunction(scoring.ScoringFunctionBase):
@@ -140,13 +142,16 @@ class RowScoringFunction(scoring.ScoringFunctionBase):
         scoring.ScoringFunctionBase.__init__(self, "Rows", organism, membership,
                                              ratios, config_params)
         self.run_log = scoring.RunLog("row_scoring", config_params)
+        # the ratios do not change during a run
+        self.__valid = ~np.isnan(ratios.values)
 
     def do_compute(self, iteration_result, ref_matrix=None):
         """the row scoring function"""
         return compute_row_scores(self.membership,
                                   self.ratios,
                                   self.num_clusters(),
-                                  self.config_params)
+                                  self.config_params,
+                                  self.__valid)
 
     def run_logs(self):
         """return the run logs"""
@@ -7,6 +7,7 @@ This file is part of cMonkey Python. Please see README and LICENSE for
 more information and licensing details.
 """
 import logging
+import math
 import numpy as np
 import tempfile
 import os
@@ -14,11 +15,14 @@ import collections
 import sys
 import subprocess
 import sqlite3
+import threading
+import multiprocessing as mp
 
 import cmonkey.scoring as scoring
 import cmonkey.datamatrix as dm
 import cmonkey.weeder as weeder
 import cmonkey.meme as meme
+import cmonkey.meme_cache as meme_cache
 import cmonkey.seqtools as st
 import cmonkey.util as util
 
@@ -57,25 +61,39 @@ def unique_filter(seqs, feature_ids):
     return unique_seqs
 
 
-def get_remove_low_complexity_filter(meme_suite):
-    """Factory method that returns a low complexity filter"""
-    def remove_low_complexity(seqs, feature_ids):
-        """low-complexity filter that depends on meme"""
-        return meme_suite.remove_low_complexity(seqs)
-    return remove_low_complexity
+class RemoveLowComplexityFilter:
+    """low-complexity filter that depends on meme. The filters are classes
+    rather than closures so they can be sent to the worker processes"""
+    def __init__(self, meme_suite):
+        self.meme_suite = meme_suite
 
+    def __call__(self, seqs, feature_ids):
+        return self.meme_suite.remove_low_complexity(seqs)
 
-def get_remove_atgs_filter(distance):
-    """returns a remove ATG filter"""
-    def remove_atgs_filter(seqs, feature_ids):
-        """a filter removes the ATG's from the sequence, this
-        just masks a window of 4 letters with N's"""
+
+class RemoveATGsFilter:
+    """a filter removes the ATG's from the sequence, this
+    just masks a window of 4 letters with N's"""
+    def __init__(self, distance):
+        self.distance = distance
+
+    def __call__(self, seqs, feature_ids):
+        distance = self.distance
         for feature_id in seqs:
             chars = [c for c in seqs[feature_id]]
             chars[distance[1]:distance[1] + 4] = "NNNN"
             seqs[feature_id] = "".join(chars)
         return seqs
-    return remove_atgs_filter
+
+
+def get_remove_low_complexity_filter(meme_suite):
+    """Factory method that returns a low complexity filter"""
+    return RemoveLowComplexityFilter(meme_suite)
+
+
+def get_remove_atgs_filter(distance):
+    """returns a remove ATG filter"""
+    return RemoveATGsFilter(distance)
 
 
 def compute_mean_score(pvalue_matrix, membership, organism):
@@ -90,12 +108,6 @@ def compute_mean_score(pvalue_matrix, membership, organism):
         values.extend(pvalues[row_indexes, cluster - 1])
     return np.mean(values)  # median can result in 0 if there are a lot of 0
 
-# Readonly structure to avoid passing it to the forked child processes for efficiency.
-# non-serializable parameters go here, too
-SEQUENCE_FILTERS = None
-ORGANISM = None
-MEMBERSIP = None
-
 
 def pvalues2matrix(all_pvalues, num_clusters, gene_names, reverse_map):
     """converts a map from {cluster: {feature: pvalue}} to a scoring matrix
@@ -115,6 +127,188 @@ def pvalues2matrix(all_pvalues, num_clusters, gene_names, reverse_map):
     return matrix
 
 
+class MotifJobCostModel:
+    """Estimates the wall time of a MEME/MAST job from the number of its
+    sequences n and their total length l. The model
+    log(t) = a + b log(n) + c log(l) is fitted to the timings of the
+    previous jobs, until there are enough timings, the cost is l^2, which
+    is roughly how MEME scales"""
+
+    def __init__(self, min_timings=10, max_timings=2000):
+        self.min_timings = min_timings
+        self.max_timings = max_timings
+        self.timings = []
+        self.coeffs = None
+
+    def add_timing(self, num_seqs, seq_length, millis):
+        """adds the wall time of a job in milliseconds"""
+        if num_seqs > 0 and seq_length > 0:
+            self.timings.append((num_seqs, seq_length, max(millis, 1)))
+            self.timings = self.timings[-self.max_timings:]
+
+    def fit(self):
+        """fits the model to the timings"""
+        if len(self.timings) < self.min_timings:
+            return
+        timings = np.log(np.array(self.timings, dtype=np.float64))
+        design = np.column_stack([np.ones(len(timings)), timings[:, 0], timings[:, 1]])
+        coeffs, _, rank, _ = np.linalg.lstsq(design, timings[:, 2], rcond=None)
+        # all jobs of the same size do not determine the model
+        if rank == design.shape[1]:
+            self.coeffs = coeffs
+
+    def estimate(self, num_seqs, seq_length):
+        """returns the estimated cost of a job, in milliseconds if the model
+        was fitted"""
+        if num_seqs == 0 or seq_length == 0:
+            return 0.0
+        if self.coeffs is None:
+            return float(seq_length) ** 2
+        return math.exp(self.coeffs[0] + self.coeffs[1] * math.log(num_seqs) +
+                        self.coeffs[2] * math.log(seq_length))
+
+
+def job_size(params):
+    """returns the number of sequences and their total length for the
+    MEME job of a cluster"""
+    return len(params.seqs), sum([len(seq) for seq in params.seqs.values()])
+
+
+class GeneSequenceTable:
+    """The search sequences of all genes of a run for a sequence type.
+    The feature ids, the search sequences and the filtered sequences are
+    determined once, so the sequences of a cluster are only looked up"""
+
+    def __init__(self, organism, genes, seqtype, sequence_filters):
+        """builds the table for the genes, the sequence filters are applied
+        to all sequences at once and may not depend on the other sequences
+        of a cluster"""
+        self.feature_ids = {}
+        for gene in genes:
+            feature_ids = organism.feature_ids_for([gene])
+            if len(feature_ids) > 0:
+                self.feature_ids[gene] = feature_ids[0]
+        all_feature_ids = sorted(set(self.feature_ids.values()))
+        self.search_seqs = organism.sequences_for_genes_search(all_feature_ids,
+                                                               seqtype=seqtype)
+        self.filtered_seqs = dict(self.search_seqs)
+        for sequence_filter in sequence_filters:
+            self.filtered_seqs = sequence_filter(self.filtered_seqs, all_feature_ids)
+
+    def seqs_for(self, genes):
+        """returns the filtered, unique sequences and the feature ids for
+        the genes, the same as applying the filters to the genes' sequences"""
+        feature_ids = [self.feature_ids[gene] for gene in sorted(genes)
+                       if gene in self.feature_ids]
+        seqs = unique_filter(self.search_seqs, feature_ids)
+        return ({feature_id: self.filtered_seqs[feature_id] for feature_id in seqs
+                 if feature_id in self.filtered_seqs}, feature_ids)
+
+    def seqs_for_cluster(self, cluster, membership):
+        """returns the sequences and the feature ids of a cluster's genes"""
+        seqs, feature_ids = self.seqs_for(membership.rows_for_cluster(cluster))
+        if len(seqs) == 0:
+            logging.warn('Cluster %i with %i genes: no sequences!',
+                         cluster, len(seqs))
+        return seqs, feature_ids
+
+
+# seconds between the checks for a cancelled batch while waiting for results
+CANCEL_POLL_INTERVAL = 1.0
+
+
+class MotifJobBatch:
+    """The MEME jobs of a motif iteration. The jobs are either run in the
+    calling thread or started in the background, so the following
+    iterations can proceed with the previous motif scores"""
+
+    def __init__(self, iteration, iteration_result, params, results, cache_keys,
+                 estimates, run_params):
+        self.iteration = iteration
+        self.iteration_result = iteration_result
+        self.params = params
+        self.results = results  # results that were not computed, e.g. from the cache
+        self.cache_keys = cache_keys
+        self.estimates = estimates
+        self.run_params = run_params
+        self.computed = None
+        self.__thread = None
+        self.__results = None
+        self.__cancelled = False
+        self.__error = None
+
+    def run(self, config_params):
+        """runs the jobs in the calling thread"""
+        if config_params[scoring.KEY_MULTIPROCESSING]:
+            with util.get_mp_pool(config_params) as pool:
+                self.computed = list(pool.imap_unordered(timed_cluster_score,
+                                                         self.run_params, chunksize=1))
+        else:
+            self.computed = [timed_cluster_score(p) for p in self.run_params]
+
+    def start(self, pool=None):
+        """runs the jobs in the background. With a pool, the jobs are handed
+        to the pool here and a background thread collects the results,
+        otherwise the background thread runs them. The pool should not be
+        the run's pool, the queued jobs would hold up the scoring"""
+        self.__cancelled = False
+        if pool is not None:
+            self.__results = pool.imap_unordered(timed_cluster_score, self.run_params, 1)
+        self.__thread = threading.Thread(target=self.__run_in_background,
+                                         name='motif-jobs-%d' % self.iteration)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def __run_in_background(self):
+        try:
+            computed = []
+            while len(computed) < len(self.run_params) and not self.__cancelled:
+                if self.__results is not None:
+                    try:
+                        computed.append(self.__results.next(CANCEL_POLL_INTERVAL))
+                    except mp.TimeoutError:
+                        pass
+                else:
+                    computed.append(timed_cluster_score(self.run_params[len(computed)]))
+            if not self.__cancelled:
+                self.computed = computed
+        except Exception as e:
+            logging.exception("motif jobs of iteration %d failed", self.iteration)
+            self.__error = e
+        finally:
+            self.__results = None
+
+    def __getstate__(self):
+        """a checkpoint keeps the completed results, jobs that were still
+        running have to be started again after restoring"""
+        state = self.__dict__.copy()
+        state['_MotifJobBatch__thread'] = None
+        state['_MotifJobBatch__results'] = None
+        return state
+
+    def done(self):
+        """returns True if the jobs are completed"""
+        return self.__thread is None or not self.__thread.is_alive()
+
+    def wait(self):
+        """waits until the jobs are completed, errors in the background
+        thread are raised here"""
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+        if self.__error is not None:
+            raise self.__error
+
+    def cancel(self):
+        """stops waiting for the jobs. Jobs that were handed to a pool are
+        stopped with the pool, a job that runs in the background thread
+        is finished first"""
+        self.__cancelled = True
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+
 class MotifScoringFunctionBase(scoring.ScoringFunctionBase):
     """Base class for motif scoring functions that use MEME
     This class of scoring function has 2 schedules:
@@ -131,7 +325,8 @@ class MotifScoringFunctionBase(scoring.ScoringFunctionBase):
         if config_params['MEME']['global_background'] == 'True':
             background_file, bgmodel = meme.global_background_file(
                 self.organism, self.ratios.row_names, self.seqtype,
-                bgorder=int(self.config_params['MEME']['background_order']))
+                bgorder=int(self.config_params['MEME']['background_order']),
+                seqs=self.used_seqs, dirname=config_params['output_dir'])
 
             # store background in results database
             conn = sqlite3.connect(config_params['out_database'], 15, isolation_level='DEFERRED')
@@ -155,7 +350,9 @@ class MotifScoringFunctionBase(scoring.ScoringFunctionBase):
         else:
             logging.error("MEME version %s currently not supported !", meme_version)
             raise Exception("unsupported MEME version: '%s'" % meme_version)
-        self.__sequence_filters = [unique_filter, get_remove_low_complexity_filter(self.meme_suite),
+        # unique_filter depends on the cluster's sequences and is applied in
+        # GeneSequenceTable.seqs_for(), the other filters once per run
+        self.__sequence_filters = [get_remove_low_complexity_filter(self.meme_suite),
                                    get_remove_atgs_filter(search_distance)]
 
     def __init__(self, id, organism, membership, ratios, seqtype, config_params=None):
@@ -164,6 +361,9 @@ class MotifScoringFunctionBase(scoring.ScoringFunctionBase):
                                              ratios, config_params=config_params)
         # attributes accessible by subclasses
         self.seqtype = seqtype
+        used_genes = sorted(ratios.row_names)
+        self.used_seqs = organism.sequences_for_genes_scan(
+            used_genes, seqtype=self.seqtype)
         self.__setup_meme_suite(config_params)
         self.num_motif_func = util.get_iter_fun(config_params['MEME'], "nmotifs",
                                                 config_params['num_iterations'])
@@ -176,9 +376,13 @@ class MotifScoringFunctionBase(scoring.ScoringFunctionBase):
         self.update_log = scoring.RunLog("motif-score-" + seqtype, config_params)
         self.motif_log = scoring.RunLog("motif-motif-" + seqtype, config_params)
 
-        used_genes = sorted(ratios.row_names)
-        self.used_seqs = organism.sequences_for_genes_scan(
-            used_genes, seqtype=self.seqtype)
+        self.meme_suite.set_scan_sequences(self.used_seqs)
+
+        start_time = util.current_millis()
+        self.gene_seqs = GeneSequenceTable(organism, used_genes, seqtype,
+                                           self.__sequence_filters)
+        logging.debug("prepared the '%s' sequences of %d genes in %d ms.",
+                      seqtype, len(used_genes), util.current_millis() - start_time)
 
         logging.debug("building reverse map...")
         start_time = util.current_millis()
@@ -187,6 +391,26 @@ class MotifScoringFunctionBase(scoring.ScoringFunctionBase):
                       util.current_millis() - start_time)
 
         self.__last_results = None  # caches the results of the previous meme run
+        self.__cost_model = MotifJobCostModel()
+
+        # asynchronous mode: MEME runs in the background and the motif scores may
+        # lag behind the membership by at most max_staleness iterations
+        self.__max_staleness = int(config_params['MEME'].get('max_staleness', 0))
+        self.__pending_jobs = None
+        # the background jobs get their own workers, so they do not hold up the
+        # run's pool. They are started here, before the run starts any threads
+        self.__pool = None
+        if self.__max_staleness > 0 and config_params[scoring.KEY_MULTIPROCESSING]:
+            self.__pool = util.WorkerPool(config_params.get('num_cores', None))
+            self.__pool.start()
+
+        # persistent cache of MEME results, shared by all runs with the same cache_dir
+        self.__result_cache = None
+        cache_size = int(config_params['MEME'].get('cache_size', 0))
+        if cache_size > 0:
+            self.__result_cache = meme_cache.MemeResultCache(
+                os.path.join(config_params['cache_dir'], 'meme_results'),
+                cache_size * 1024 * 1024)
 
     def run_logs(self):
         return [self.update_log, self.motif_log]
@@ -235,24 +459,67 @@ class MotifScoringFunctionBase(scoring.ScoringFunctionBase):
     def last_cached(self):
         return self.last_result
 
+    def checkpoint_state(self):
+        """the motif scores, the previous MEME results and the MEME jobs
+        that run in the background"""
+        return {'cached_result': self.last_result,
+                'all_pvalues': self.all_pvalues,
+                'last_iteration_result': self.__last_iteration_result,
+                'last_motif_infos': self.__last_motif_infos,
+                'last_results': self.__last_results,
+                'cost_model': self.__cost_model,
+                'pending_jobs': self.__pending_jobs}
+
+    def restore_checkpoint_state(self, state):
+        self.last_result = state['cached_result']
+        self.all_pvalues = state['all_pvalues']
+        self.__last_iteration_result = state['last_iteration_result']
+        self.__last_motif_infos = state['last_motif_infos']
+        self.__last_results = state['last_results']
+        self.__cost_model = state['cost_model']
+        self.__pending_jobs = state['pending_jobs']
+        if self.__pending_jobs is not None and self.__pending_jobs.computed is None:
+            logging.info("restarting the '%s' MEME jobs of iteration %d", self.seqtype,
+                         self.__pending_jobs.iteration)
+            self.__pending_jobs.start(self.__pool)
+
+    def shutdown(self):
+        """stops the background MEME jobs and their workers and removes
+        the files that the MEME suite shares between the jobs"""
+        if self.__pool is not None:
+            self.__pool.shutdown(terminate=True)
+            self.__pool = None
+        if self.__pending_jobs is not None:
+            self.__pending_jobs.cancel()
+        self.meme_suite.cleanup()
+
     def __compute(self, iteration_result, force, ref_matrix=None):
         """compute method for the specified iteration
         Note: will return None if not computed yet and the result of a previous
         scoring if the function is not supposed to actually run in this iteration
         """
         iteration = iteration_result['iteration']
+        if self.__pending_jobs is not None:
+            self.__collect_pending_jobs(iteration, force)
+
         if force or self.motif_in_iteration(iteration):  # meme.iter in R
             logging.debug("Running Motifing for sequence type '%s'...", self.seqtype)
             # running MEME and store the result for the non-motifing iterations
             # to reuse
             # Note: currently, iteration results are only computed here
             num_motifs = int(self.num_motif_func(iteration))
-            self.__last_iteration_result = {'iteration': iteration}
-            self.all_pvalues = self.compute_pvalues(self.__last_iteration_result,
-                                                    num_motifs, force)
-            with open(os.path.join(self.config_params['output_dir'],
-                                   'motif_pvalues_last.pkl'), 'wb') as outfile:
-                pickle.dump(self.__last_iteration_result, outfile)
+            if (self.__max_staleness > 0 and not force and
+                iteration < self.config_params['num_iterations']):
+                self.__pending_jobs = self.__prepare_motif_jobs({'iteration': iteration},
+                                                                num_motifs, force)
+                self.__pending_jobs.start(self.__pool)
+                logging.debug("started %d MEME jobs of iteration %d in the background",
+                              len(self.__pending_jobs.run_params), iteration)
+            else:
+                self.__last_iteration_result = {'iteration': iteration}
+                self.all_pvalues = self.compute_pvalues(self.__last_iteration_result,
+                                                        num_motifs, force)
+                self.__write_last_iteration_result()
 
         if self.all_pvalues is not None and (force or self.run_in_iteration(iteration)):  # mot.iter in R
             logging.debug("UPDATING MOTIF SCORES in iteration %d with scaling: %f",
@@ -282,6 +549,34 @@ class MotifScoringFunctionBase(scoring.ScoringFunctionBase):
             self.last_result, self.membership, self.organism)
         return self.last_result
 
+    def __write_last_iteration_result(self):
+        with open(os.path.join(self.config_params['output_dir'],
+                               'motif_pvalues_last.pkl'), 'wb') as outfile:
+            pickle.dump(self.__last_iteration_result, outfile)
+
+    def __collect_pending_jobs(self, iteration, force):
+        """merges the results of the background MEME jobs if they are completed.
+        It waits for them if the motif scores would otherwise be more than
+        max_staleness iterations old, before the next MEME run and before
+        the last iteration"""
+        jobs = self.__pending_jobs
+        staleness = iteration - jobs.iteration
+        if not (jobs.done() or force or self.motif_in_iteration(iteration) or
+                staleness >= self.__max_staleness or
+                iteration >= self.config_params['num_iterations']):
+            return
+        start_time = util.current_millis()
+        jobs.wait()
+        self.__pending_jobs = None
+        self.__last_iteration_result = jobs.iteration_result
+        self.all_pvalues = self.__merge_motif_jobs(jobs)
+        self.__write_last_iteration_result()
+        self.last_result = pvalues2matrix(self.all_pvalues, self.num_clusters(),
+                                          self.gene_names(), self.reverse_map)
+        logging.info("merged the '%s' motifs of iteration %d in iteration %d "
+                     "(staleness: %d, waited %d ms)", self.seqtype, jobs.iteration,
+                     iteration, staleness, util.current_millis() - start_time)
+
     def compute_pvalues(self, iteration_result, num_motifs, force):
         """Compute motif scores.
         The result is a dictionary from cluster -> (feature_id, pvalue)
@@ -293,29 +588,21 @@ class MotifScoringFunctionBase(scoring.ScoringFunctionBase):
         (seqs, feature_ids, distance) -> seqs
         These filters are applied in the order they appear in the list.
         """
-        global SEQUENCE_FILTERS, ORGANISM, MEMBERSHIP
-
-        cluster_pvalues = {}
+        jobs = self.__prepare_motif_jobs(iteration_result, num_motifs, force)
+        jobs.run(self.config_params)
+        return self.__merge_motif_jobs(jobs)
+
+    def __prepare_motif_jobs(self, iteration_result, num_motifs, force):
+        """extracts the cluster sequences from the current membership and
+        returns the MEME jobs for the clusters that changed and whose results
+        are not in the cache"""
         min_cluster_rows_allowed = self.config_params['memb.min_cluster_rows_allowed']
         max_cluster_rows_allowed = self.config_params['memb.max_cluster_rows_allowed']
-        use_multiprocessing = self.config_params[scoring.KEY_MULTIPROCESSING]
 
-        # extract the sequences for each cluster, slow
+        # look up the sequences for each cluster
         start_time = util.current_millis()
-        SEQUENCE_FILTERS = self.__sequence_filters
-        ORGANISM = self.organism
-        MEMBERSHIP = self.membership
-
-        cluster_seqs_params = [(cluster, self.seqtype) for cluster in xrange(1, self.num_clusters() + 1)]
-        if use_multiprocessing:
-            with util.get_mp_pool(self.config_params) as pool:
-                seqs_list = pool.map(cluster_seqs, cluster_seqs_params)
-        else:
-            seqs_list = [cluster_seqs(p) for p in cluster_seqs_params]
-
-        SEQUENCE_FILTERS = None
-        ORGANISM = None
-        MEMBERSHIP = None
+        seqs_list = [self.gene_seqs.seqs_for_cluster(cluster, self.membership)
+                     for cluster in xrange(1, self.num_clusters() + 1)]
         logging.debug("prepared sequences in %d ms.", util.current_millis() - start_time)
 
         # Make the parameters, this is fast enough
@@ -363,61 +650,100 @@ class MotifScoringFunctionBase(scoring.ScoringFunctionBase):
             if oldlen - newlen > 0:
                 logging.debug("%d clusters did not change !!!", oldlen - newlen)
 
-        # compute and store motif results
+        # look up the results of sequence sets that were seen before
+        results, cache_keys = self.__lookup_cached_results(params)
+        # Schedule the MEME jobs longest first, one job at a time, so a large
+        # cluster that is started last does not leave the other workers idle
+        estimates = {cluster: self.__cost_model.estimate(*job_size(params[cluster]))
+                     for cluster in params if cluster not in results}
+        run_params = [params[cluster]
+                      for cluster in sorted(estimates, key=lambda c: -estimates[c])]
+        return MotifJobBatch(iteration_result['iteration'], iteration_result, params,
+                             results, cache_keys, estimates, run_params)
+
+    def __merge_motif_jobs(self, jobs):
+        """stores the results of the completed MEME jobs and returns the
+        motif p-values of all clusters"""
+        cluster_pvalues = {}
+        iteration_result = jobs.iteration_result
+        params = jobs.params
+        results = jobs.results
+        for cluster, pvalues, run_result, millis in jobs.computed:
+            results[cluster] = (pvalues, run_result)
+            if run_result is not None:
+                num_seqs, seq_length = job_size(params[cluster])
+                self.__cost_model.add_timing(num_seqs, seq_length, millis)
+                iteration_result[cluster]['meme-run'] = {'num_seqs': num_seqs,
+                                                         'seq_length': seq_length,
+                                                         'estimated_cost': jobs.estimates[cluster],
+                                                         'wall_time': millis}
+        self.__cost_model.fit()
+        self.__store_cached_results(jobs.cache_keys, results)
+
         self.__last_motif_infos = {}
         if self.__last_results is None:
             self.__last_results = {}
 
-        if use_multiprocessing:
-            with util.get_mp_pool(self.config_params) as pool:
-                results = pool.map(compute_cluster_score, params.values())
-                results = {r[0]: r[1:] for r in results}  # indexed by cluster
-
-                for cluster in xrange(1, self.num_clusters() + 1):
-                    if cluster in results:
-                        pvalues, run_result = results[cluster]
-                        self.__last_results[cluster] = (params[cluster].feature_ids,
-                                                        pvalues, run_result)
-                    else:
-                        feature_ids, pvalues, run_result = self.__last_results[cluster]
-
-                    cluster_pvalues[cluster] = pvalues
-                    if run_result:
-                        self.__last_motif_infos[cluster] = run_result.motif_infos
-                    iteration_result[cluster]['motif-info'] = meme_json(run_result)
-                    iteration_result[cluster]['pvalues'] = pvalues
-        else:
-            for cluster in xrange(1, self.num_clusters() + 1):
-                if cluster in params:
-                    _, pvalues, run_result = compute_cluster_score(params[cluster])
-                    self.__last_results[cluster] = (params[cluster].feature_ids,
-                                                    pvalues, run_result)
-                else:
-                    _, pvalues, run_result = self.__last_results[cluster]
+        for cluster in xrange(1, self.num_clusters() + 1):
+            if cluster in results:
+                pvalues, run_result = results[cluster]
+                self.__last_results[cluster] = (params[cluster].feature_ids,
+                                                pvalues, run_result)
+            else:
+                _, pvalues, run_result = self.__last_results[cluster]
 
-                cluster_pvalues[cluster] = pvalues
-                if run_result:
-                    self.__last_motif_infos[cluster] = run_result.motif_infos
-                iteration_result[cluster]['motif-info'] = meme_json(run_result)
-                iteration_result[cluster]['pvalues'] = pvalues
+            cluster_pvalues[cluster] = pvalues
+            if run_result:
+                self.__last_motif_infos[cluster] = run_result.motif_infos
+            iteration_result[cluster]['motif-info'] = meme_json(run_result)
+            iteration_result[cluster]['pvalues'] = pvalues
 
         return cluster_pvalues
 
-
-def cluster_seqs(params):
-    """Retrieves the sequences for a cluster. Designed to run in in pool.map()"""
-    global SEQUENCE_FILTERS, ORGANISM, MEMBERSHIP
-    cluster, seqtype = params
-    genes = sorted(MEMBERSHIP.rows_for_cluster(cluster))
-    feature_ids = ORGANISM.feature_ids_for(genes)
-    seqs = ORGANISM.sequences_for_genes_search(
-        feature_ids, seqtype=seqtype)
-    for sequence_filter in SEQUENCE_FILTERS:
-        seqs = sequence_filter(seqs, feature_ids)
-    if len(seqs) == 0:
-        logging.warn('Cluster %i with %i genes: no sequences!',
-                     cluster, len(seqs))
-    return (seqs, feature_ids)
+    def __lookup_cached_results(self, params):
+        """looks up the MEME results of the clusters in params in the
+        result cache. Returns a pair of dictionaries
+        - cluster -> (pvalues, run_result) for the cached results
+        - cluster -> cache key for the results that need to be stored"""
+        results = {}
+        cache_keys = {}
+        if self.__result_cache is None:
+            return results, cache_keys
+        self.__result_cache.reset_stats()
+        for cluster, cluster_params in params.items():
+            nseqs = len(cluster_params.seqs)
+            if (nseqs < cluster_params.min_cluster_rows or
+                nseqs > cluster_params.max_cluster_rows):
+                continue
+            key = cluster_params.meme_runner.cache_key(cluster_params)
+            if key is None:
+                continue
+            # the MEME output files are written in the last iteration and in debug mode
+            if (cluster_params.iteration <= cluster_params.num_iterations and
+                'keep_memeout' not in cluster_params.debug):
+                run_result = self.__result_cache.get(key)
+                if run_result is not None:
+                    pvalues = {feature_id: pvalue
+                               for feature_id, pvalue, evalue in run_result.pe_values}
+                    results[cluster] = (pvalues, run_result)
+                    continue
+            cache_keys[cluster] = key
+        return results, cache_keys
+
+    def __store_cached_results(self, cache_keys, results):
+        """stores the MEME results of the clusters in cache_keys, evicts
+        the least recently used results and logs the cache statistics"""
+        if self.__result_cache is None:
+            return
+        for cluster, key in cache_keys.items():
+            _, run_result = results[cluster]
+            # empty results can be caused by MEME or MAST errors
+            if run_result is not None and len(run_result.motif_infos) > 0:
+                self.__result_cache.put(key, run_result)
+        num_evicted = self.__result_cache.evict()
+        logging.info("MEME result cache (%s): %d hits, %d misses, %d evicted",
+                     self.seqtype, self.__result_cache.hits, self.__result_cache.misses,
+                     num_evicted)
 
 
 def meme_json(run_result):
@@ -466,6 +792,14 @@ def compute_cluster_score(params):
     return params.cluster, pvalues, run_result
 
 
+def timed_cluster_score(params):
+    """compute_cluster_score() that also returns the wall time of the job in
+    milliseconds"""
+    start_time = util.current_millis()
+    cluster, pvalues, run_result = compute_cluster_score(params)
+    return cluster, pvalues, run_result, util.current_millis() - start_time
+
+
 class MemeScoringFunction(MotifScoringFunctionBase):
     """Scoring function for motifs"""
 
@@ -525,6 +859,10 @@ class WeederRunner:
         self.config_params = config_params
         self.__remove_tempfiles = remove_tempfiles
 
+    def cache_key(self, params):  # pylint: disable-msg=W0613,R0201
+        """Weeder results are not cached"""
+        return None
+
     def __call__(self, params):
         """call the runner like a function"""
         with tempfile.NamedTemporaryFile(prefix='weeder.fasta',
@@ -541,11 +879,7 @@ class WeederRunner:
                 logging.debug('no PSSMS generated, skipping cluster')
                 return meme.MemeRunResult([], {}, [])
 
-            dbfile = self.meme_suite.make_sequence_file(
-                [(feature_id, locseq[1])
-                 for feature_id, locseq in params.used_seqs.items()])
             logging.debug("# PSSMS created: %d %s", len(pssms), str([i.consensus_motif() for i in pssms]))
-            logging.debug("run MAST on '%s', dbfile: '%s'", meme_outfile, dbfile)
 
             motif_infos = []
             for i in xrange(len(pssms)):
@@ -555,6 +889,17 @@ class WeederRunner:
                                                       len(pssm.sites),
                                                       None, pssm.e_value,
                                                       pssm.sites))
+            if self.meme_suite.scanner is not None:
+                pe_values, annotations = self.meme_suite.scanner.scan(
+                    motif_infos, self.meme_suite.bgmodel, params.seqs.keys())
+                return meme.MemeRunResult(pe_values, annotations, motif_infos)
+
+            dbfile = self.meme_suite.database_file()
+            if dbfile is None:
+                dbfile = self.meme_suite.make_sequence_file(
+                    [(feature_id, locseq[1])
+                     for feature_id, locseq in params.used_seqs.items()])
+            logging.debug("run MAST on '%s', dbfile: '%s'", meme_outfile, dbfile)
             mast_out = self.meme_suite.mast(meme_outfile, dbfile,
                                             self.meme_suite.global_background_file())
             if 'keep_mastout' in self.config_params['debug']:
@@ -576,7 +921,8 @@ class WeederRunner:
                         except:
                             logging.warn("could not remove tmp file:'%s'", tmpName)
                 try:
-                    if dbfile:
+                    # the shared database is kept for the other runs
+                    if dbfile and dbfile != self.meme_suite.database_file():
                         os.remove(dbfile)
                 except:
                     logging.warn("could not remove tmp file:'%s'", dbfile)
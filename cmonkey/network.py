@@ -5,11 +5,13 @@ This file is part of cMonkey Python. Please see README and LICENSE for
 more information and licensing details.
 """
 import numpy as np
+import scipy.sparse
 import logging
 import os.path
 
 import cmonkey.util as util
 import cmonkey.datamatrix as dm
+import cmonkey.membership as memb
 import cmonkey.scoring as scoring
 
 # Python2/Python3 compatibility
@@ -33,6 +35,8 @@ class Network:
         self.__compute_edges_with_source()
 
     def __compute_edges_with_source(self):
+        self.__adjacency = None
+        self.__adjacency_nodes = None
         self.edges_with_source = {}
         for edge in self.edges:
             if edge[0] not in self.edges_with_source:
@@ -100,6 +104,26 @@ class Network:
         else:
             return []
 
+    def adjacency(self, nodes):
+        """returns the symmetric |nodes| x |nodes| adjacency matrix of the
+        edge scores in CSR format. Edges with a node that is not in nodes
+        are ignored. The matrix is compiled once and cached for the
+        same node list"""
+        if self.__adjacency is None or self.__adjacency_nodes != nodes:
+            index = {node: i for i, node in enumerate(nodes)}
+            edges = [(index[n0], index[n1], score) for n0, n1, score in self.edges
+                     if n0 in index and n1 in index]
+            sources = np.array([edge[0] for edge in edges], dtype=np.int64)
+            targets = np.array([edge[1] for edge in edges], dtype=np.int64)
+            scores = np.array([edge[2] for edge in edges], dtype=np.float64)
+            # scores of duplicate edges are summed up
+            self.__adjacency = scipy.sparse.coo_matrix(
+                (np.concatenate([scores, scores]),
+                 (np.concatenate([sources, targets]), np.concatenate([targets, sources]))),
+                shape=(len(nodes), len(nodes))).tocsr()
+            self.__adjacency_nodes = list(nodes)
+        return self.__adjacency
+
     def __repr__(self):
         return "Network: %s\n# edges: %d\n" % (self.name,
                                                len(self.edges))
@@ -152,38 +176,19 @@ class Network:
         return Network(name, network_edges, weight, 0)
 
 
-COMPUTE_NETWORK = None
-ALL_GENES = None
-NETWORK_SCORE_MEMBERSHIP = None
-
-
-def compute_network_scores(cluster):
-    """Generic method to compute network scores"""
-    global COMPUTE_NETWORK, ALL_GENES, NETWORK_SCORE_MEMBERSHIP
-    network = COMPUTE_NETWORK
-
-    genes = sorted(NETWORK_SCORE_MEMBERSHIP.rows_for_cluster(cluster))
-    gene_scores = {}
-
-    for gene in genes:
-        # TODO: optimization: we can use numpy arrays for the scores array
-        # and then sum
-        edges = network.edges_with_node(gene)
-        for edge in edges:
-            other_gene = edge[0]
-            if other_gene == gene:
-                other_gene = edge[1]
-            if other_gene in ALL_GENES:
-                if other_gene not in gene_scores:
-                    gene_scores[other_gene] = []
-                gene_scores[other_gene].append(edge[2])
-
-    final_gene_scores = {}
-    for gene, scores in gene_scores.items():
-        final_gene_scores[gene] = sum(scores) / len(genes)
-        final_gene_scores[gene] = -np.log(final_gene_scores[gene] + 1)
-    return final_gene_scores
-
+def compute_network_scores(adjacency, row_members, num_members):
+    """Generic method to compute network scores. adjacency is the
+    |genes| x |genes| adjacency matrix of a network, row_members the
+    |genes| x |clusters| membership indicator and num_members the number
+    of genes in each cluster.
+    The score of a gene in a cluster is -log(x / n + 1), where x is the sum
+    of the scores of the edges to the cluster genes and n the number of
+    cluster genes. The result is the |genes| x |clusters| score array"""
+    sums = np.asarray(adjacency.dot(row_members.astype(np.float64)))
+    num_members = np.asarray(num_members, dtype=np.float64)
+    # empty clusters have no network scores
+    sums[:, num_members == 0] = 0.0
+    return -np.log(sums / np.maximum(num_members, 1.0) + 1)
 
 
 class ScoringFunction(scoring.ScoringFunctionBase):
@@ -220,6 +225,16 @@ class ScoringFunction(scoring.ScoringFunctionBase):
 
         return result
 
+    def checkpoint_state(self):
+        state = scoring.ScoringFunctionBase.checkpoint_state(self)
+        state['score_means'] = getattr(self, 'score_means', None)
+        return state
+
+    def restore_checkpoint_state(self, state):
+        scoring.ScoringFunctionBase.restore_checkpoint_state(self, state)
+        if state['score_means'] is not None:
+            self.score_means = state['score_means']
+
     def networks(self):
         """networks are cached"""
         if self.__networks is None:
@@ -232,85 +247,56 @@ class ScoringFunction(scoring.ScoringFunctionBase):
                                      self.gene_names())
         return self.__networks
 
-    def __update_score_means(self, network_scores):
-        """returns the score means, adjusted to the current cluster setup"""
-        # a dictionary that holds the network score means for
-        # each cluster, separated for each network
-        if network_scores:
-            score_means = {network.name: self.__compute_cluster_score_means(network_scores[network.name])
-                           for network in self.networks()}
-            return {network: np.average(np.array(list(cluster_score_means.values())))
-                    for network, cluster_score_means in score_means.items()}
-        return {}
-
     def do_compute(self, iteration_result, ref_matrix=None):
         """compute method, iteration is the 0-based iteration number"""
 
         matrix = dm.DataMatrix(len(self.gene_names()), self.num_clusters(),
                                self.gene_names())
+        row_positions = np.array(self.ratios.row_indexes_for(self.membership.row_names),
+                                 dtype=np.int64)
+        row_members = memb.member_indicator(self.membership.row_membs, row_positions,
+                                            self.ratios.num_rows, self.num_clusters())
+        num_members = [self.membership.num_row_members(cluster)
+                       for cluster in xrange(1, self.num_clusters() + 1)]
         network_scores = {}
         for network in self.networks():
             logging.debug("Compute scores for network '%s', WEIGHT: %f",
                           network.name, network.weight)
             start_time = util.current_millis()
-            network_score = self.__compute_network_cluster_scores(network)
+            network_score = compute_network_scores(network.adjacency(self.gene_names()),
+                                                   row_members, num_members)
             network_scores[network.name] = network_score
-            self.__update_score_matrix(matrix, network_score, network.weight)
+            matrix.values += network_score * network.weight
             elapsed = util.current_millis() - start_time
             logging.debug("NETWORK '%s' SCORING TIME: %f s.",
                           network.name, (elapsed / 1000.0))
 
         # compute and store score means
-        self.score_means = self.__update_score_means(network_scores)
+        self.score_means = self.__update_score_means(network_scores, row_positions)
         return matrix
 
-    def __compute_network_cluster_scores(self, network):
-        """computes the cluster scores for the given network"""
-        global COMPUTE_NETWORK, ALL_GENES, NETWORK_SCORE_MEMBERSHIP
-        result = {}
-        use_multiprocessing = self.config_params[
-            scoring.KEY_MULTIPROCESSING]
-        # Set the huge memory objects into globals
-        # These are readonly anyways, but using Manager.list() or something
-        # similar brings this down to a crawl
-        COMPUTE_NETWORK = network
-        ALL_GENES = set(self.gene_names())  # optimization: O(1) lookup
-        NETWORK_SCORE_MEMBERSHIP = self.membership
-
-        if use_multiprocessing:
-            with util.get_mp_pool(self.config_params) as pool:
-                map_results = pool.map(compute_network_scores, xrange(1, self.num_clusters() + 1))
-            for cluster in xrange(1, self.num_clusters() + 1):
-                result[cluster] = map_results[cluster - 1]
-        else:
-            for cluster in xrange(1, self.num_clusters() + 1):
-                result[cluster] = compute_network_scores(cluster)
-        # cleanup
-        COMPUTE_NETWORK = None
-        ALL_GENES = None
-        NETWORK_SCORE_MEMBERSHIP = None
-        return result
+    def __update_score_means(self, network_scores, row_positions):
+        """returns the score means, adjusted to the current cluster setup"""
+        # a dictionary that holds the network score means for
+        # each cluster, separated for each network
+        if network_scores:
+            score_means = {network.name: self.__compute_cluster_score_means(
+                network_scores[network.name], row_positions)
+                           for network in self.networks()}
+            return {network: np.average(np.array(list(cluster_score_means.values())))
+                    for network, cluster_score_means in score_means.items()}
+        return {}
 
-    def __update_score_matrix(self, matrix, network_score, weight):
-        """add values into the result score matrix"""
-        mvalues = matrix.values
-        gene_names = self.gene_names()
-        for cluster in xrange(1, self.num_clusters() + 1):
-            cluster_genes = set(network_score[cluster].keys())
-            for row_index in xrange(self.ratios.num_rows):
-                gene = gene_names[row_index]
-                if gene in cluster_genes:
-                    weighted_score = network_score[cluster][gene] * weight
-                    mvalues[row_index][cluster - 1] += weighted_score
-
-    def __compute_cluster_score_means(self, network_score):
-        """compute the score means on the given network score"""
+    def __compute_cluster_score_means(self, network_score, row_positions):
+        """compute the score means on the given network score, cluster
+        members that are not in the ratios have a score of 0"""
         result = {}
         for cluster in xrange(1, self.num_clusters() + 1):
-            cluster_scores = [network_score[cluster][gene]
-                              if gene in network_score[cluster] else 0.0
-                              for gene in self.rows_for_cluster(cluster)]
-            result[cluster] = util.trim_mean(cluster_scores, 0.05)
+            positions = row_positions[self.membership.row_indexes_for_cluster(cluster)]
+            cluster_scores = np.zeros(len(positions))
+            valid = positions >= 0
+            cluster_scores[valid] = network_score[positions[valid], cluster - 1]
+            result[cluster] = util.trim_mean(cluster_scores.tolist(), 0.05)
         return result
 
 
@@ -0,0 +1,284 @@
+# vi: sw=4 ts=4 et:
+"""numerics.py - native NumPy/SciPy numerics backend
+
+This module contains pure NumPy/SciPy implementations of the R functions
+that cMonkey used to call through rpy2. The functions have the same
+signatures as their counterparts in the util module and are selected
+by setting numerics_backend = numpy in the [General] section of the
+configuration.
+
+Tolerances with respect to the R implementations:
+
+  - density(): uses the same linear binning and FFT convolution as
+    R's density.default() (512 grid points, Gaussian kernel, cut = 4
+    bandwidths, pre-4.4 grid coordinates), results agree within 1e-11
+  - rrank(), rrank_matrix(), rorder(), mad(), phyper(): exact up to
+    floating point rounding, rrank_matrix() returns -1 for the NaN values
+    that R ranks as NA
+  - sd_rnorm(), rnorm(), runif(), kmeans(): statistically equivalent,
+    but draw from NumPy's random number generator, so the values are not
+    identical to the R stream for the same seed
+
+This file is part of cMonkey Python. Please see README and LICENSE for
+more information and licensing details.
+"""
+import math
+import numpy as np
+import scipy.stats
+import scipy.cluster.vq
+
+# R's density() always works on at least 512 grid points
+DENSITY_GRID_SIZE = 512
+
+# number of points density() returns in cMonkey
+DENSITY_NUM_POINTS = 256
+
+# scale factor R's mad() uses for consistency with the normal distribution
+MAD_CONSTANT = 1.4826
+
+
+def bin_dist(values, weight, lo, up, n):
+    """Linear binning of the values into 2 * n bins, equivalent to R's
+    internal BinDist() function. Only the first n bins receive weight,
+    the upper half is zero-padding for the FFT"""
+    result = np.zeros(2 * n)
+    xdelta = (up - lo) / (n - 1)
+    xpos = (values - lo) / xdelta
+    ix = np.floor(xpos).astype(np.int64)
+    fx = xpos - ix
+
+    inside = (ix >= 0) & (ix <= n - 2)
+    result += np.bincount(ix[inside], weight * (1.0 - fx[inside]), 2 * n)
+    result += np.bincount(ix[inside] + 1, weight * fx[inside], 2 * n)
+    result[0] += np.sum(weight * fx[ix == -1])
+    result[n - 1] += np.sum(weight * (1.0 - fx[ix == n - 1]))
+    return result
+
+
+def density_estimate(cluster_values, bandwidth, dmin, dmax,
+                     num_points=DENSITY_NUM_POINTS):
+    """Gaussian kernel density estimate of cluster_values evaluated on
+    num_points equally spaced points in [dmin, dmax], equivalent to
+    R's density(cluster_values, bw=bandwidth, adjust=2, from=dmin, to=dmax,
+    n=num_points, na.rm=T)$y"""
+    values = np.asarray(cluster_values, dtype=np.float64)
+    values = values[np.isfinite(values)]
+    n = DENSITY_GRID_SIZE
+    bw = 2.0 * bandwidth
+    lo = dmin - 4.0 * bw
+    up = dmax + 4.0 * bw
+    binned = bin_dist(values, 1.0 / len(values), lo, up, n)
+
+    kords = np.linspace(0.0, 2.0 * (up - lo), 2 * n)
+    kords[n + 1:] = -kords[n - 1:0:-1]
+    kords = scipy.stats.norm.pdf(kords, scale=bw)
+    # numpy's inverse FFT is already normalized by the input length
+    kords = np.fft.ifft(np.fft.fft(binned) * np.conj(np.fft.fft(kords)))
+    kords = np.maximum(0.0, kords.real[:n])
+    xords = np.linspace(lo, up, n)
+    return np.interp(np.linspace(dmin, dmax, num_points), xords, kords)
+
+
+def approx(x, y, xout):
+    """linear interpolation with R's approx() default rule=1: values
+    outside of [min(x), max(x)] and NaN values result in NaN"""
+    xout = np.asarray(xout, dtype=np.float64)
+    result = np.interp(xout, x, y)
+    result[~((xout >= x[0]) & (xout <= x[-1]))] = np.nan
+    return result
+
+
+def density(kvalues, cluster_values, bandwidth, dmin, dmax):
+    """generic function to compute density scores"""
+    dens = density_estimate(cluster_values, bandwidth, dmin, dmax)
+    dx = np.linspace(dmin, dmax, DENSITY_NUM_POINTS)
+    p = approx(dx, np.cumsum(dens[::-1])[::-1], kvalues)
+    return p / np.nansum(p)
+
+
+def interp_uniform(xout, xmin, xmax, y):
+    """Row-wise linear interpolation of y, which is sampled at equally
+    spaced points between xmin and xmax. xout has one column per row of y,
+    xmin and xmax have one entry per row of y. Values outside the range
+    and NaN values result in NaN"""
+    num_points = y.shape[1]
+    pos = (xout - xmin) / ((xmax - xmin) / (num_points - 1))
+    outside = ~((pos >= 0.0) & (pos <= num_points - 1))
+    pos[outside] = 0.0
+    index = np.minimum(np.floor(pos).astype(np.int64), num_points - 2)
+    frac = pos - index
+    rows = np.arange(y.shape[0])[:, np.newaxis]
+    result = y[rows, index] * (1.0 - frac) + y[rows, index + 1] * frac
+    result[outside] = np.nan
+    return result
+
+
+def density_matrix(kvalues, members, bandwidths, dmin, dmax):
+    """Batched version of density() for all clusters at once.
+    Column k of the result is density(kvalues[:, k], kvalues[members[:, k], k],
+    bandwidths[k], dmin[k], dmax[k]). All clusters are binned with a single
+    bincount() and convolved with a single 2-dimensional FFT on their
+    own 512 point grid"""
+    num_rows, num_clusters = kvalues.shape
+    n = DENSITY_GRID_SIZE
+    bw = 2.0 * np.asarray(bandwidths, dtype=np.float64)
+    lo = dmin - 4.0 * bw
+    up = dmax + 4.0 * bw
+    xdelta = (up - lo) / (n - 1)
+
+    # linear binning of the members, each cluster has its own 2n bins
+    members = members & np.isfinite(kvalues)
+    num_members = members.sum(axis=0)
+    weights = 1.0 / np.maximum(num_members, 1)
+    member_rows, member_clusters = np.nonzero(members)
+    xpos = ((kvalues[member_rows, member_clusters] - lo[member_clusters]) /
+            xdelta[member_clusters])
+    ix = np.floor(xpos).astype(np.int64)
+    fx = xpos - ix
+    w = weights[member_clusters]
+    offsets = member_clusters * (2 * n)
+    size = num_clusters * 2 * n
+
+    inside = (ix >= 0) & (ix <= n - 2)
+    binned = np.bincount(offsets[inside] + ix[inside],
+                         w[inside] * (1.0 - fx[inside]), size)
+    binned += np.bincount(offsets[inside] + ix[inside] + 1,
+                          w[inside] * fx[inside], size)
+    left = ix == -1
+    binned += np.bincount(offsets[left], w[left] * fx[left], size)
+    right = ix == n - 1
+    binned += np.bincount(offsets[right] + n - 1, w[right] * (1.0 - fx[right]), size)
+    binned = binned.reshape(num_clusters, 2 * n)
+
+    kords = np.outer(2.0 * (up - lo), np.linspace(0.0, 1.0, 2 * n))
+    kords[:, n + 1:] = -kords[:, n - 1:0:-1]
+    kords = scipy.stats.norm.pdf(kords, scale=bw[:, np.newaxis])
+    kords = np.fft.ifft(np.fft.fft(binned, axis=1) * np.conj(np.fft.fft(kords, axis=1)),
+                        axis=1)
+    kords = np.maximum(0.0, kords.real[:, :n])
+
+    dx = (dmin[:, np.newaxis] +
+          np.outer(dmax - dmin, np.linspace(0.0, 1.0, DENSITY_NUM_POINTS)))
+    dens = interp_uniform(dx, lo[:, np.newaxis], up[:, np.newaxis], kords)
+    cumdens = np.cumsum(dens[:, ::-1], axis=1)[:, ::-1]
+    p = interp_uniform(kvalues.T, dmin[:, np.newaxis], dmax[:, np.newaxis], cumdens)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (p / np.nansum(p, axis=1)[:, np.newaxis]).T
+
+
+def set_seed(value):
+    """seeds NumPy's random number generator"""
+    np.random.seed(value)
+
+
+def runif(num_values):
+    """returns num_values uniformly distributed values in [0, 1)"""
+    return np.random.uniform(0.0, 1.0, num_values)
+
+
+def rnorm(num_values, std_deviation):
+    """returns num_values normally distributed values with mean 0"""
+    return np.random.normal(0.0, 1.0, num_values) * std_deviation
+
+
+def phyper(q, m, n, k, lower_tail=False):
+    """hypergeometric distribution function with R's phyper() parameters"""
+    q = np.asarray(q, dtype=np.float64)
+    m = np.asarray(m, dtype=np.float64)
+    n = np.asarray(n, dtype=np.float64)
+    k = np.asarray(k, dtype=np.float64)
+    if lower_tail:
+        return scipy.stats.hypergeom.cdf(q, m + n, m, k)
+    else:
+        return scipy.stats.hypergeom.sf(q, m + n, m, k)
+
+
+def rrank(values):
+    """rank with ties='min' and na='keep'"""
+    return scipy.stats.rankdata(np.asarray(values, dtype=np.float64),
+                                method='min', nan_policy='omit')
+
+
+def mad(values):
+    """median absolute deviation, na.rm=False"""
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0 or np.any(np.isnan(values)):
+        return np.nan
+    return MAD_CONSTANT * np.median(np.abs(values - np.median(values)))
+
+
+def sd_rnorm(values, num_rnorm_values, fuzzy_coeff):
+    """computes standard deviation on values and then draws
+    num_rnorm_values normally distributed values with that
+    standard deviation"""
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if len(values) > 1:
+        # like R's sd(), infinite values result in NaN
+        with np.errstate(invalid='ignore'):
+            sdval = np.std(values, ddof=1) * fuzzy_coeff
+    else:
+        sdval = np.nan
+    return rnorm(num_rnorm_values, sdval)
+
+
+def rrank_matrix(npmatrix):
+    """ranks all values of a matrix in row-major order, ties='min',
+    the result is 0-based. NaN values are not ranked and get the rank -1,
+    where R's rank(na='keep') returns NA"""
+    values = npmatrix.ravel()
+    isvalue = ~np.isnan(values)
+    ranks = np.full(len(values), -1, dtype=np.int32)
+    ranks[isvalue] = scipy.stats.rankdata(values[isvalue], method='min') - 1
+    return ranks
+
+
+def rorder(values, result_size):
+    """equivalent of R's order(values, decreasing=T)[1:result_size],
+    the result is 1-based and ties are kept in input order"""
+    values = np.asarray(values, dtype=np.float64)
+    # negating keeps the sort stable for ties and NaN values last
+    return np.argsort(-values, kind='stable')[:result_size] + 1
+
+
+def rvec(rvecstr):
+    """evaluates an R vector expression built from c(), rep() and seq()
+    and arithmetic, as they are used in the scaling and nmotifs settings"""
+    def c(*args):
+        return np.concatenate([np.atleast_1d(arg) for arg in args])
+
+    def rep(value, times):
+        return np.repeat(np.atleast_1d(value), int(times))
+
+    def seq(start, end, length=None, by=None):
+        if length is not None:
+            return np.linspace(start, end, int(math.ceil(length)))
+        if by is None:
+            by = 1.0 if end >= start else -1.0
+        num_values = int(math.floor((end - start) / by + 1e-10)) + 1
+        return start + np.arange(num_values) * by
+
+    expr = rvecstr.replace('length.out', 'length')
+    return np.atleast_1d(eval(expr, {'__builtins__': {}},
+                              {'c': c, 'rep': rep, 'seq': seq}))
+
+
+def kmeans(values, num_clusters, max_iterations=20, num_starts=2):
+    """k-means clustering of the rows of values, returning the 1-based
+    cluster numbers for each row. The best of num_starts runs wins"""
+    best_labels = None
+    best_distortion = None
+    for _ in range(num_starts):
+        seed = np.random.randint(0, 2147483647)
+        centroids, labels = scipy.cluster.vq.kmeans2(values, num_clusters,
+                                                      iter=max_iterations,
+                                                      minit='++', seed=seed)
+        distortion = np.sum(np.square(values - centroids[labels]))
+        if best_distortion is None or distortion < best_distortion:
+            best_distortion = distortion
+            best_labels = labels
+    return best_labels + 1
+
+
+__all__ = ['density', 'density_matrix', 'phyper', 'rrank', 'mad', 'sd_rnorm', 'rrank_matrix',
+           'rorder', 'rvec', 'kmeans']
@@ -24,6 +24,8 @@ class RsatSpeciesInfo:
     def __init__(self, rsatdb, kegg_organism, species, taxonomy_id):
         """determine RSAT information using the RSAT database object"""
         self.__rsatdb = rsatdb
+        self.__feature_table = None
+        self.__contig_arrays = {}
 
         # in many cases, the fuzzy match delivers the correct RSAT organism
         # name, but there are exceptions
@@ -45,12 +47,31 @@ class RsatSpeciesInfo:
     def get_features(self):
         return self.__rsatdb.get_features(self.species)
 
+    def get_feature_table(self):
+        """returns the indexed feature table, it is built once per run"""
+        if self.__feature_table is None:
+            if hasattr(self.__rsatdb, 'get_feature_table'):
+                self.__feature_table = self.__rsatdb.get_feature_table(self.species)
+            else:
+                self.__feature_table = st.FeatureTable.create_from_text(self.get_features())
+        return self.__feature_table
+
     def get_feature_names(self):
         return self.__rsatdb.get_feature_names(self.species)
 
     def get_contig_sequence(self, contig):
         return self.__rsatdb.get_contig_sequence(self.species, contig)
 
+    def get_contig_array(self, contig):
+        """returns the contig sequence as a uint8 array, it is loaded once per run"""
+        if contig not in self.__contig_arrays:
+            if hasattr(self.__rsatdb, 'get_contig_array'):
+                array = self.__rsatdb.get_contig_array(self.species, contig)
+            else:
+                array = st.contig_array(self.get_contig_sequence(contig))
+            self.__contig_arrays[contig] = array
+        return self.__contig_arrays[contig]
+
     def go_species(self):
         return self.species.replace('_', ' ')
 
@@ -157,46 +178,16 @@ class RSATOrganism(OrganismBase):
             self.read_features(self.feature_ids_for(genes)))
 
     def read_features(self, feature_ids):
-        """Returns a list containing the features for the specified feature
-        ids"""
-
-        def read_feature(line):
-            """Creates and adds a feature and associated contig from current
-            DelimitedFile line"""
-            contig = line[3]
-            is_reverse = False
-            if line[6] == 'R':
-                is_reverse = True
-
-            # note that feature positions can sometimes start with a '>'
-            # or '<', so make sure it is stripped away
-            return st.Feature(line[0], line[1], line[2],
-                              st.Location(contig,
-                                          int(line[4].lstrip('<>')),
-                                          int(line[5].lstrip('<>')),
-                                          is_reverse))
-
-        features = {}
-        dfile = util.dfile_from_text(self.__rsat_info.get_features(), comment='--')
-        for line in dfile.lines:
-            feature_id = line[0]
-            if feature_id in feature_ids:
-                features[feature_id] = read_feature(line)
-        return features
+        """Returns a dictionary containing the features for the specified
+        feature ids"""
+        return self.__rsat_info.get_feature_table().features_for(feature_ids)
 
     def read_sequences(self, features, distance, extractor):
         """for each feature, extract and set its sequence"""
-        def unique_contigs():
-            """extract the unique contigs from the input features"""
-            result = []
-            for feature in features.values():
-                if feature.location.contig not in result:
-                    result.append(feature.location.contig)
-            return result
-
         sequences = {}
-        contig_seqs = {contig: self.__rsat_info.get_contig_sequence(contig)
-                       for contig in unique_contigs()}
+        contig_seqs = {contig: self.__rsat_info.get_contig_array(contig)
+                       for contig in set([feature.location.contig
+                                          for feature in features.values()])}
 
         for key, feature in features.items():
             location = feature.location
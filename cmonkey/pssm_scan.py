@@ -0,0 +1,233 @@
+# vi: sw=4 ts=4 et:
+"""pssm_scan.py - in-process PSSM scanner
+
+This is an alternative to running MAST on each cluster's MEME output.
+All sequences of a run are encoded once, the motifs are scored on both
+strands with log-odds matrices against the background and the p-values
+are computed like MAST does:
+
+- position p-values from the exact score distribution of the motif's
+  integer-scaled log-odds matrix under the 0-order background
+- sequence p-values from the best position p-value and the number of
+  positions in the sequence
+- combined p-values of all motifs with the QFAST product formula,
+  E-values are the combined p-values times the number of sequences
+
+This file is part of cMonkey Python. Please see README and LICENSE for
+more information and licensing details.
+"""
+import math
+import numpy as np
+
+try:
+    xrange
+except NameError:
+    xrange = range
+
+
+# letter codes, all other characters are mapped to N
+ALPHABET = 'ACGT'
+CODE_N = 4
+SCALE_RANGE = 100
+
+# like in Pssm.to_logodds_string(), zero probabilities are replaced
+MIN_PROBABILITY = 1e-2
+
+
+def __make_letter_codes():
+    """returns the table that maps characters to letter codes"""
+    result = np.full(256, CODE_N, dtype=np.int8)
+    for code, letter in enumerate(ALPHABET):
+        result[ord(letter)] = code
+        result[ord(letter.lower())] = code
+    return result
+
+LETTER_CODES = __make_letter_codes()
+
+
+def encode(seq):
+    """returns the letter codes of a sequence string"""
+    return LETTER_CODES[np.frombuffer(seq.encode('ascii', 'replace'), dtype=np.uint8)]
+
+
+class SequenceTable:
+    """The encoded sequences of a run. The sequences are stored as rows
+    of a |sequences| x |longest sequence| code matrix that is padded with N"""
+
+    def __init__(self, seqs):
+        """creates the table from a list of (name, sequence) pairs"""
+        self.names = [name for name, _ in seqs]
+        self.lengths = np.array([len(seq) for _, seq in seqs], dtype=np.int64)
+        max_length = self.lengths.max() if len(seqs) > 0 else 0
+        self.codes = np.full((len(seqs), max_length), CODE_N, dtype=np.int8)
+        for row, (_, seq) in enumerate(seqs):
+            self.codes[row, :len(seq)] = encode(seq)
+        self.__index = {name: row for row, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def row_for(self, name):
+        """returns the row of the named sequence or None"""
+        return self.__index.get(name, None)
+
+
+def background_frequencies(bgmodel):
+    """returns the A, C, G, T frequencies of the 0-order part of a Markov
+    background model"""
+    if not bgmodel:
+        return np.full(4, 0.25)
+    freqs = np.array([bgmodel[0].get(letter, 0.0) for letter in ALPHABET])
+    if freqs.sum() <= 0.0:
+        return np.full(4, 0.25)
+    return freqs / freqs.sum()
+
+
+def scaled_score_matrix(pssm, bgfreqs, scale_range=SCALE_RANGE):
+    """returns the integer log-odds matrix of a probability matrix with the
+    columns A, C, G, T and N. Each row is shifted to a minimum of 0 and the
+    rows are scaled so that the total score range is scale_range, like in
+    MAST. N scores the background average of a row"""
+    probs = np.array(pssm, dtype=np.float64)
+    probs[probs <= 0.0] = MIN_PROBABILITY
+    logodds = np.log2(probs / bgfreqs)
+    logodds -= logodds.min(axis=1)[:, np.newaxis]
+    total_range = logodds.max(axis=1).sum()
+    scale = scale_range / total_range if total_range > 0 else 0.0
+    result = np.zeros((len(probs), 5), dtype=np.int64)
+    result[:, :4] = np.round(logodds * scale)
+    result[:, CODE_N] = np.round(np.dot(result[:, :4], bgfreqs))
+    return result
+
+
+def score_pvalues(scores, bgfreqs):
+    """returns the p-values P(S >= s) for each possible score s of the
+    integer score matrix, under the 0-order background"""
+    dist = np.ones(1)
+    for row in scores:
+        row_dist = np.zeros(row[:4].max() + 1)
+        np.add.at(row_dist, row[:4], bgfreqs)
+        dist = np.convolve(dist, row_dist)
+    return np.minimum(np.cumsum(dist[::-1])[::-1], 1.0)
+
+
+def reverse_score_matrix(scores):
+    """returns the score matrix of the reverse complement strand"""
+    result = scores[::-1].copy()
+    result[:, :4] = result[:, 3::-1]
+    return result
+
+
+def window_scores(codes, scores):
+    """returns the scores of all windows in the code matrix"""
+    width = len(scores)
+    num_windows = codes.shape[1] - width + 1
+    result = np.zeros((codes.shape[0], max(num_windows, 0)), dtype=np.int64)
+    for i in xrange(width):
+        result += scores[i][codes[:, i:i + num_windows]]
+    return result
+
+
+def qfast(num_values, product):
+    """returns the p-value of a product of num_values independent uniform
+    p-values, Bailey and Gribskov (1998)"""
+    if product <= 0.0:
+        return 0.0
+    if num_values <= 1 or product >= 1.0:
+        return min(product, 1.0)
+    log_product = -math.log(product)
+    term = 1.0
+    total = 1.0
+    for i in xrange(1, num_values):
+        term *= log_product / i
+        total += term
+    return min(product * total, 1.0)
+
+
+class PssmScanner:
+    """Scans motifs on all sequences of a run and returns the same
+    (pe_values, annotations) pair as the MAST output readers"""
+
+    def __init__(self, seqs, max_evalue=1500.0, max_hit_pvalue=0.99):
+        """seqs is a list of (name, sequence) pairs, the sequences are
+        encoded once. Sequences with E-values above max_evalue are not
+        reported, hits need a position p-value below max_hit_pvalue"""
+        self.table = SequenceTable(seqs)
+        self.max_evalue = max_evalue
+        self.max_hit_pvalue = max_hit_pvalue
+
+    def motif_pvalues(self, pssm, bgfreqs):
+        """returns the forward and reverse position p-values of a motif
+        as |sequences| x |windows| arrays (invalid windows have a p-value
+        of 1) and the number of windows of each sequence"""
+        scores = scaled_score_matrix(pssm, bgfreqs)
+        tail = score_pvalues(scores, bgfreqs)
+        width = len(scores)
+        num_windows = np.maximum(self.table.lengths - width + 1, 0)
+        result = []
+        for strand_scores in [scores, reverse_score_matrix(scores)]:
+            pvalues = tail[np.minimum(window_scores(self.table.codes, strand_scores),
+                                      len(tail) - 1)]
+            pvalues[np.arange(pvalues.shape[1]) >= num_windows[:, np.newaxis]] = 1.0
+            result.append(pvalues)
+        return result[0], result[1], num_windows
+
+    def scan(self, motif_infos, bgmodel, genes):
+        """scans the motifs of a MEME run. Returns a pair (pevalues, annotations)
+        - pevalues is [(gene, pval, eval)]
+        - annotations is a dictionary gene -> [(pval, pos, motifnum)], hits
+          are only reported for the input genes"""
+        pevalues = []
+        annotations = {}
+        if len(motif_infos) == 0 or len(self.table) == 0:
+            return pevalues, annotations
+
+        bgfreqs = background_frequencies(bgmodel)
+        num_seqs = len(self.table)
+        seq_pvalues = np.ones((len(motif_infos), num_seqs))
+        strand_pvalues = []
+        for m, motif_info in enumerate(motif_infos):
+            forward, reverse, num_windows = self.motif_pvalues(motif_info.pssm, bgfreqs)
+            if forward.shape[1] > 0:
+                best = np.minimum(forward.min(axis=1), reverse.min(axis=1))
+                # probability of the best of 2 * windows positions
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    seq_pvalues[m] = -np.expm1(2 * num_windows * np.log1p(-best))
+                seq_pvalues[m, num_windows == 0] = 1.0
+            strand_pvalues.append((forward, reverse))
+
+        products = np.prod(seq_pvalues, axis=0)
+        combined = np.array([qfast(len(motif_infos), p) for p in products])
+        evalues = combined * num_seqs
+        genes = set(genes)
+        for row in np.argsort(combined, kind='mergesort'):
+            if evalues[row] > self.max_evalue:
+                continue
+            name = self.table.names[row]
+            pevalues.append((name, float(combined[row]), float(evalues[row])))
+            annotations[name] = []
+            if name in genes:
+                annotations[name] = self.__hits(row, motif_infos, strand_pvalues)
+        return pevalues, annotations
+
+    def __hits(self, row, motif_infos, strand_pvalues):
+        """the best non-overlapping hits in a sequence, as
+        (pvalue, position, motif number), reverse strand hits have
+        negative motif numbers. Positions are counted like in the MAST
+        output reader"""
+        candidates = []
+        for m, motif_info in enumerate(motif_infos):
+            width = len(motif_info.pssm)
+            for sign, pvalues in zip([1, -1], strand_pvalues[m]):
+                positions = np.nonzero(pvalues[row] < self.max_hit_pvalue)[0]
+                candidates.extend([(pvalues[row, pos], pos, width, sign * motif_info.motif_num)
+                                   for pos in positions.tolist()])
+        candidates.sort(key=lambda candidate: candidate[0])
+        occupied = np.zeros(self.table.lengths[row], dtype=bool)
+        hits = []
+        for pvalue, pos, width, motif_num in candidates:
+            if not occupied[pos:pos + width].any():
+                occupied[pos:pos + width] = True
+                # MAST positions are 1-based, the reader adds 2 like R cmonkey
+                hits.append((float(pvalue), pos + 3, motif_num))
+        return sorted(hits, key=lambda hit: hit[1])
@@ -0,0 +1,191 @@
+# vi: sw=4 ts=4 et:
+"""result_writer.py - buffered writing of iteration results
+
+The rows of an iteration's results are collected per table and written
+with a single executemany() per table in one transaction, instead of one
+execute() per row member, PSSM row, annotation and site.
+The rows are tuples that are created when they are buffered, so they can
+be written by a BackgroundWriter while the next iteration is computed.
+
+This file is part of cMonkey Python. Please see README and LICENSE for
+more information and licensing details.
+"""
+import collections
+import logging
+import sqlite3
+import threading
+from functools import partial
+
+# Python2/Python3 compatibility
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+
+# connection settings for the output database: with a write-ahead log,
+# readers like the cmviewer do not block the writer and synchronous=NORMAL
+# only syncs at checkpoints. The page cache size is in KiB if negative
+CONNECTION_PRAGMAS = [('journal_mode', 'WAL'), ('synchronous', 'NORMAL'),
+                      ('cache_size', -65536)]
+
+
+def configure_connection(conn, pragmas=CONNECTION_PRAGMAS):
+    """applies the pragmas to the connection"""
+    for name, value in pragmas:
+        result = conn.execute('pragma %s = %s' % (name, value)).fetchone()
+        if name == 'journal_mode' and result is not None and \
+                str(result[0]).lower() != str(value).lower():
+            logging.warn("could not set the journal mode of the output database to %s", value)
+
+
+def connect(path):
+    """returns a configured connection to the output database"""
+    conn = sqlite3.connect(path, 15, isolation_level='DEFERRED')
+    configure_connection(conn)
+    return conn
+
+
+def write_statements(conn, statements):
+    """executes the (sql, rows) pairs in one transaction"""
+    with conn:
+        for sql, rows in statements:
+            conn.executemany(sql, rows)
+
+
+class BackgroundWriter:
+    """Runs the database writes of a run in a thread that has its own
+    connection. Tasks are functions of the connection. submit() blocks while
+    max_pending tasks are waiting, so a slow file system holds up the run
+    instead of filling the memory. An error in a task stops the writes and
+    is raised by the next call to submit(), wait() or close()"""
+
+    def __init__(self, path, max_pending=2):
+        self.path = path
+        self.__queue = queue.Queue(max_pending)
+        self.__error = None
+        self.__thread = threading.Thread(target=self.__run, name='result-writer')
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def __run(self):
+        conn = None
+        try:
+            conn = connect(self.path)
+        except Exception as e:
+            logging.exception("could not open the output database")
+            self.__error = e
+        while True:
+            task = self.__queue.get()
+            try:
+                if task is None:
+                    break
+                if self.__error is None:
+                    task(conn)
+            except Exception as e:
+                logging.exception("error writing to the output database")
+                self.__error = e
+            finally:
+                self.__queue.task_done()
+        if conn is not None:
+            conn.close()
+
+    def __check_error(self):
+        if self.__error is not None:
+            raise self.__error
+
+    def submit(self, task):
+        """queues the task"""
+        self.__check_error()
+        if self.__thread is None:
+            raise ValueError('the writer is closed')
+        self.__queue.put(task)
+
+    def wait(self):
+        """waits until all queued tasks are done"""
+        self.__queue.join()
+        self.__check_error()
+
+    def close(self):
+        """runs the queued tasks and stops the writer thread"""
+        if self.__thread is not None:
+            self.__queue.put(None)
+            self.__thread.join()
+            self.__thread = None
+        self.__check_error()
+
+
+class ResultWriter:
+    """Buffers the statements to run on the output database. The insert rows
+    are grouped by table and columns and written in flush(), either on the
+    connection or in the background writer. Row ids that other rows refer to
+    are reserved with next_rowid() before the rows are written"""
+
+    def __init__(self, conn, background=None):
+        self.conn = conn
+        self.background = background
+        self.__statements = collections.OrderedDict()  # sql -> [row]
+        self.__next_rowids = {}
+        self.__statstypes = {}
+
+    def execute(self, sql, row):
+        """buffers a statement"""
+        self.__statements.setdefault(sql, []).append(row)
+
+    def insert(self, table, columns, row):
+        """buffers a row for table, columns is a tuple of column names"""
+        self.insert_many(table, columns, [row])
+
+    def insert_many(self, table, columns, rows):
+        """buffers the rows for table, columns is a tuple of column names"""
+        sql = 'insert into %s (%s) values (%s)' % (table, ','.join(columns),
+                                                   ','.join(['?'] * len(columns)))
+        self.__statements.setdefault(sql, []).extend(rows)
+
+    def num_rows(self):
+        """returns the number of buffered rows"""
+        return sum([len(rows) for rows in self.__statements.values()])
+
+    def next_rowid(self, table):
+        """reserves the next row id in table. The ids continue after the
+        largest row id when the table is first used, this writer has to be
+        the only one that inserts into table"""
+        if table not in self.__next_rowids:
+            max_rowid = self.conn.execute('select max(rowid) from %s' % table).fetchone()[0]
+            self.__next_rowids[table] = 1 if max_rowid is None else max_rowid + 1
+        rowid = self.__next_rowids[table]
+        self.__next_rowids[table] += 1
+        return rowid
+
+    def statstype_id(self, category, name):
+        """returns the row id of a statstypes entry, the entries are only
+        read again if an entry is not known yet"""
+        key = (category, name)
+        if key not in self.__statstypes:
+            cursor = self.conn.execute('select rowid, category, name from statstypes')
+            self.__statstypes = {(row[1], row[2]): row[0] for row in cursor.fetchall()}
+        return self.__statstypes[key]
+
+    def flush(self):
+        """writes all buffered statements in one transaction"""
+        statements = list(self.__statements.items())
+        self.__statements.clear()
+        if len(statements) > 0:
+            self.run(partial(write_statements, statements=statements))
+
+    def run(self, task):
+        """runs a function of the connection after the flushed statements"""
+        if self.background is not None:
+            self.background.submit(task)
+        else:
+            task(self.conn)
+
+    def wait(self):
+        """waits until the flushed statements are written"""
+        if self.background is not None:
+            self.background.wait()
+
+    def close(self):
+        """writes the flushed statements and stops the background writer"""
+        if self.background is not None:
+            self.background.close()
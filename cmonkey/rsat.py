@@ -9,12 +9,9 @@ import re
 import os
 
 import cmonkey.util as util
+import cmonkey.seqtools as st
 import cmonkey.patches as patches
 
-try:
-    from StringIO import StringIO
-except ImportError:
-    from io import StringIO
 
 class RsatFiles:
     """This class implements the same service functions as RsatDatabase, but
@@ -47,6 +44,9 @@ class RsatFiles:
         with open(path) as infile:
             return infile.read()
 
+    def get_feature_table(self, organism, original=True):
+        return st.FeatureTable.create_from_text(self.get_features(organism, original))
+
     def get_feature_names(self, organism, original=True):
         if original:
             path = os.path.join(self.dirname, self.feature_name + '_names.tab')
@@ -61,9 +61,12 @@ class RsatFiles:
         else:
             path = os.path.join(self.dirname, organism + '_' + contig)
         with open(path) as infile:
-            seqstr = infile.read().upper().decode('utf-8')
+            seqstr = infile.read().upper()
             return join_contig_sequence(seqstr)
 
+    def get_contig_array(self, organism, contig, original=True):
+        return st.contig_array(self.get_contig_sequence(organism, contig, original))
+
 
 class RsatDatabase:
     """abstract interface to access an RSAT mirror"""
@@ -150,50 +153,49 @@ class RsatDatabase:
         #Later parts assume that the features file will have the following columns
         fieldOrder = ['id', 'type', 'name', 'contig', 'start_pos', 'end_pos', 'strand']
 
-        uCache = uCache.split('\n')
         #Remove any blank lines
-        while "" in uCache:
-            uCache.remove("")
+        uCache = [line for line in uCache.split('\n') if line != ""]
 
         idxs = {} #Dictionary to store field idxs
         targIdx = [] #The ordered list of columns for output
-        outString = "" #This will be the new data
+        outLines = [] #This will be the new data
         for line in uCache:
-            try:
-                line = line + '\n'
-            except:
-                continue
-
             lineParts = line.split()
             if lineParts[0] == '--':
                 if lineParts[1] == 'field':
                         idxs[lineParts[3]] = lineParts[2]
                         if lineParts[3] in fieldOrder:
                                 newIdx = str(fieldOrder.index(lineParts[3]) + 1)
-                                outString = outString + lineParts[0] + " " + lineParts[1] + " " + newIdx + '\t' + lineParts[3] + '\n'
+                                outLines.append(lineParts[0] + " " + lineParts[1] + " " + newIdx + '\t' + lineParts[3])
                 else:
-                        outString = outString + line
+                        outLines.append(line)
             else:
-                lineParts = line.strip().split('\t')
-                if len(lineParts) == 1:
-                    lineParts = line.split()
-
                 if (len(targIdx) == 0):
                         #Create the targIdx
                         for curField in fieldOrder:
                                 targIdx.append(int(idxs[curField])-1)
-                outline = ""
                 lineParts = line.split('\t')  #Resplit to fix empty fields
-                for curTarg in targIdx:
-                        outline = outline + lineParts[curTarg].strip() + '\t'
                 #Some RSAT files have a contig with ':'s instead of '_'s
-                outline = outline.replace(':','_')
-                #Now strip trailing \t
-                outline = ''.join(outline.rsplit('\t', 1))
-                outString = outString + outline + '\n'
+                outLines.append('\t'.join([lineParts[curTarg].strip()
+                                           for curTarg in targIdx]).replace(':', '_'))
 
         #To Do: Overwrite cache file & add early check to see if we need the sub
-        return outString
+        return ''.join([line + '\n' for line in outLines])
+
+    def get_feature_table(self, organism):
+        """returns the specified organism's features as an indexed table.
+        The table is stored in the cache directory, so the feature file
+        is only parsed once. It is rebuilt when the downloaded feature
+        file is newer"""
+        features_file = "/".join([self.cache_dir, organism + '_' + self.feature_name])
+        cache_file = features_file + '.npz'
+        if (os.path.exists(cache_file) and
+            (not os.path.exists(features_file) or
+             os.path.getmtime(cache_file) >= os.path.getmtime(features_file))):
+            return st.FeatureTable.load(cache_file)
+        table = st.FeatureTable.create_from_text(self.get_features(organism))
+        table.save(cache_file)
+        return table
 
     def get_feature_names(self, organism):
         """returns the specified organism's feature name file contents"""
@@ -223,14 +225,25 @@ class RsatDatabase:
             logging.error("using the parameter --rsat_base_url")
         return join_contig_sequence(seqstr)
 
+    def get_contig_array(self, organism, contig):
+        """returns the specified contig sequence as a memory-mapped uint8
+        array. The array is stored in the cache directory, so the contig
+        file is only parsed once. It is rebuilt when the downloaded contig
+        file is newer"""
+        contig_file = "/".join([self.cache_dir, organism + '_' + contig])
+        cache_file = contig_file + '.npy'
+        if (os.path.exists(cache_file) and
+            (not os.path.exists(contig_file) or
+             os.path.getmtime(cache_file) >= os.path.getmtime(contig_file))):
+            return st.load_contig_array(cache_file)
+        st.save_contig_array(cache_file,
+                             st.contig_array(self.get_contig_sequence(organism, contig)))
+        return st.load_contig_array(cache_file)
+
 
 def join_contig_sequence(seqstr):
     """we take the safer route and assume that the input could
     be separated out into lines"""
-    buf = StringIO(seqstr)
-    result = ''
-    for line in buf:
-        result += line.strip()
-    return result
+    return ''.join([line.strip() for line in seqstr.split('\n')])
 
 __all__ = ['RsatDatabase']
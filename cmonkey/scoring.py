@@ -14,6 +14,7 @@ import cmonkey.util as util
 import cmonkey.membership as memb
 import cmonkey.BSCM as BSCM
 import numpy as np
+import scipy.sparse
 import gc
 import sqlite3
 
@@ -117,6 +118,22 @@ class ScoringFunctionBase:
             with open(self.pickle_path(), 'wb') as outfile:
                 pickle.dump(result, outfile)
 
+    def checkpoint_state(self):
+        """returns the state that is needed to continue a run from a
+        checkpoint without recomputing the scores. Functions with more
+        state than their last result extend this dictionary"""
+        return {'cached_result': self.last_cached()}
+
+    def restore_checkpoint_state(self, state):
+        """restores the state returned by checkpoint_state()"""
+        if state['cached_result'] is not None:
+            self.store_result(state['cached_result'])
+
+    def shutdown(self):
+        """releases the resources of the function, called when the run is
+        cleaned up, also after an error"""
+        pass
+
     def current_score_means(self, result_matrix):
         """This function can be overridden by custom functions to provide their
         own score means. The default version computes the means of the result
@@ -220,89 +237,105 @@ class ColumnScoringFunction(ScoringFunctionBase):
             self.BSCM_obj = BSCM.BSCM(ratios, verbose=False, useChi2=config_params['use_chi2']) #How to pass verbose and so on? More parameters?
             #Note: Ratios normalized upstream during loading by config.py module
         self.run_log = RunLog("column_scoring", config_params)
+        # the ratios do not change during a run
+        self.__valid = ~np.isnan(ratios.values)
 
     def do_compute(self, iteration_result, ref_matrix=None):
         """compute method, iteration is the 0-based iteration number"""
         return compute_column_scores(self.membership, self.ratios,
-                                     self.num_clusters(), self.config_params, 
-                                     self.BSCM_obj)
+                                     self.num_clusters(), self.config_params,
+                                     self.BSCM_obj, self.__valid)
                                      
     def get_BSCM(self):
         """Return the background sampled coherence matrix object"""
         return self.BSCM_obj
 
+    def checkpoint_state(self):
+        """the background variances of the BSCM are kept, the ratios
+        are not stored again"""
+        state = ScoringFunctionBase.checkpoint_state(self)
+        if self.BSCM_obj is not None:
+            state['bscm_variances'] = self.BSCM_obj.allVars
+        return state
 
-def compute_column_scores(membership, matrix, num_clusters,
-                          config_params, BSCM_obj=None):
-    """Computes the column scores for the specified number of clusters"""
+    def restore_checkpoint_state(self, state):
+        ScoringFunctionBase.restore_checkpoint_state(self, state)
+        if self.BSCM_obj is not None and 'bscm_variances' in state:
+            self.BSCM_obj.allVars = state['bscm_variances']
 
-    def compute_substitution(cluster_column_scores):
-        """calculate substitution value for missing column scores"""
-        membership_values = []
-        for cluster in xrange(1, num_clusters + 1):
-            columns = membership.columns_for_cluster(cluster)
-            column_scores = cluster_column_scores[cluster - 1]
-            if column_scores is not None:
-                colnames, scores = column_scores
-                for col in xrange(len(colnames)):
-                    if colnames[col] in columns:
-                        membership_values.append(scores[col])
-        return util.quantile(membership_values, 0.95)
-
-    def make_submatrix(cluster):
-        row_names = membership.rows_for_cluster(cluster)
-        if len(row_names) > 1:
-            return matrix.submatrix_by_name(row_names=row_names)
-        else:
-            return None
 
-    cluster_column_scores = [] #To be filled or overwritten
+def compute_column_scores(membership, matrix, num_clusters,
+                          config_params, BSCM_obj=None, valid=None):
+    """Computes the column scores for the specified number of clusters.
+    The result is a |conditions| x |clusters| DataMatrix, valid is an
+    optional precomputed mask of the non-NaN values of the matrix"""
+    row_positions = np.array(matrix.row_indexes_for(membership.row_names),
+                             dtype=np.int64)
+    col_positions = np.array(matrix.column_indexes_for(membership.col_names),
+                             dtype=np.int64)
+    row_members = memb.member_indicator(membership.row_membs, row_positions,
+                                        matrix.num_rows, num_clusters)
+    col_members = memb.member_indicator(membership.col_membs, col_positions,
+                                        len(matrix.column_names), num_clusters)
+    # only clusters with more than one row have column scores
+    scored = np.array([membership.num_row_members(cluster) > 1
+                       for cluster in xrange(1, num_clusters + 1)], dtype=bool)
+
     if BSCM_obj is None:
-        if config_params['multiprocessing']:
-            with util.get_mp_pool(config_params) as pool:
-                    cluster_column_scores = pool.map(compute_column_scores_submatrix, map(make_submatrix, xrange(1, num_clusters + 1)))
-        else:
-            for cluster in xrange(1, num_clusters + 1):
-                cluster_column_scores.append(compute_column_scores_submatrix(
-                    make_submatrix(cluster)))
+        scores = compute_cluster_column_scores(matrix.values, row_members, valid)
     else: #if BSCM_obj exists
         num_cores = 1
         if not config_params['num_cores'] is None:
             num_cores = config_params['num_cores']
 
+        scores = np.empty((len(matrix.column_names), num_clusters))
         for cluster in xrange(1, num_clusters + 1):
-            if make_submatrix(cluster) is None:
-                cluster_column_scores.append(None)
-            else:
-                cur_column_scores = BSCM_obj.getPvals(make_submatrix(cluster).row_names, num_cores=num_cores)
-                exp_names = cur_column_scores.keys()
-                exp_scores = np.array(cur_column_scores.values() )
-                cluster_column_scores.append((exp_names, exp_scores))
-
-    substitution = compute_substitution(cluster_column_scores)
-
-    # Convert scores into a matrix that have the clusters as columns
-    # and conditions in the rows
-    result = dm.DataMatrix(matrix.num_columns, num_clusters,
-                           row_names=matrix.column_names)
-    rvalues = result.values
-    for cluster in xrange(num_clusters):
-        column_scores = cluster_column_scores[cluster]
-
-        if column_scores is not None:
-            _, scores = column_scores
-            scores[np.isnan(scores)] = substitution
-
-        for row_index in xrange(matrix.num_columns):
-            if column_scores is None:
-                rvalues[row_index, cluster] = substitution
-            else:
-                _, scores = column_scores
-                rvalues[row_index, cluster] = scores[row_index]
+            if scored[cluster - 1]:
+                row_names = [matrix.row_names[i]
+                             for i in np.nonzero(row_members[:, cluster - 1])[0]]
+                pvals = BSCM_obj.getPvals(row_names, num_cores=num_cores)
+                scores[:, cluster - 1] = [pvals[name] for name in matrix.column_names]
+    scores[:, ~scored] = np.nan
+
+    # missing column scores are substituted with the 95% quantile of the
+    # scores of the cluster columns
+    substitution = util.quantile(scores[col_members & scored], 0.95)
+    scores[np.isnan(scores)] = substitution
+
+    result = dm.DataMatrix(len(matrix.column_names), num_clusters,
+                           row_names=matrix.column_names, values=scores)
     result.fix_extreme_values()
     return result
 
 
+def compute_cluster_column_scores(values, row_members, valid=None):
+    """computes the column scores of all clusters at once, row_members
+    is the boolean |rows| x |clusters| membership indicator. The result is
+    the |columns| x |clusters| array of the scores that
+    compute_column_scores_submatrix() computes on the cluster submatrices,
+    NaN values are ignored.
+    The sums and sums of squares of the cluster columns are computed with
+    a sparse cluster x row indicator, values are centered on the column
+    means first to keep the variances accurate"""
+    if valid is None:
+        valid = ~np.isnan(values)
+    valid_f = valid.astype(np.float64)
+    indicator = scipy.sparse.csr_matrix(row_members.T.astype(np.float64))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shift = np.where(valid, values, 0.0).sum(axis=0) / valid_f.sum(axis=0)
+    shift[np.isnan(shift)] = 0.0
+    centered = np.where(valid, values - shift, 0.0)
+
+    counts = indicator.dot(valid_f)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = indicator.dot(centered) / counts
+        variances = np.maximum(indicator.dot(np.square(centered)) / counts -
+                               np.square(means), 0.0)
+    colmeans = means + shift
+    return (variances / (np.abs(colmeans) + 0.01)).T
+
+
 def compute_column_scores_submatrix(matrix):
     """For a given matrix, compute the column scores.
     This is used to compute the column scores of the sub matrices that
@@ -483,6 +516,23 @@ class ScoringFunctionCombiner:
         return combine(result_matrices, score_scalings, self.membership,
                        iteration, self.config_params)
 
+    def checkpoint_state(self):
+        """returns the states of the contained functions"""
+        return [scoring_function.checkpoint_state()
+                for scoring_function in self.scoring_functions]
+
+    def restore_checkpoint_state(self, state):
+        """restores the states of the contained functions"""
+        if len(state) != len(self.scoring_functions):
+            raise ValueError('the checkpoint does not match the scoring functions')
+        for scoring_function, function_state in zip(self.scoring_functions, state):
+            scoring_function.restore_checkpoint_state(function_state)
+
+    def shutdown(self):
+        """shuts down the contained functions"""
+        for scoring_function in self.scoring_functions:
+            scoring_function.shutdown()
+
     def combine_cached(self, iteration):
         """Combine the cached results of the contained scoring function.
         This is used by the post adjustment"""
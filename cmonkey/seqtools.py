@@ -10,7 +10,10 @@ import logging
 import random
 import string
 import collections
-from cmonkey.util import DelimitedFile
+import hashlib
+import numpy as np
+import cmonkey.util as util
+from cmonkey.util import DelimitedFile, dfile_from_text
 
 try:
     xrange
@@ -61,6 +64,76 @@ def read_features_from_file(filename):
     return features
 
 
+class FeatureTable:
+    """An indexed table of the features of an organism. The feature
+    attributes are stored in arrays and a feature id maps to its position
+    in the arrays, so a lookup of k features is O(k). The table is
+    stored in a compact binary file in the cache directory, so the
+    feature file is only parsed once"""
+
+    FIELDS = ['ids', 'ftypes', 'names', 'contigs', 'starts', 'ends', 'reverse']
+
+    def __init__(self, ids, ftypes, names, contigs, starts, ends, reverse):
+        """creates a table from the feature attribute arrays"""
+        self.ids = np.asarray(ids, dtype=str)
+        self.ftypes = np.asarray(ftypes, dtype=str)
+        self.names = np.asarray(names, dtype=str)
+        self.contigs = np.asarray(contigs, dtype=str)
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.asarray(ends, dtype=np.int64)
+        self.reverse = np.asarray(reverse, dtype=bool)
+        # if a feature id occurs more than once, the last one wins
+        self.__index = {feature_id: i for i, feature_id in enumerate(self.ids.tolist())}
+
+    def __len__(self):
+        return len(self.__index)
+
+    def __contains__(self, feature_id):
+        return feature_id in self.__index
+
+    def feature(self, feature_id):
+        """returns the Feature for the specified id"""
+        i = self.__index[feature_id]
+        return Feature(str(self.ids[i]), str(self.ftypes[i]), str(self.names[i]),
+                       Location(str(self.contigs[i]), int(self.starts[i]),
+                                int(self.ends[i]), bool(self.reverse[i])))
+
+    def features_for(self, feature_ids):
+        """returns a dictionary of the Features for the specified ids,
+        ids that are not in the table are ignored"""
+        return {feature_id: self.feature(feature_id)
+                for feature_id in feature_ids if feature_id in self.__index}
+
+    def save(self, path):
+        """writes the table to the specified path, the file is replaced
+        atomically"""
+        util.write_atomic(path, lambda outfile: np.savez_compressed(
+            outfile, **{field: getattr(self, field) for field in FeatureTable.FIELDS}))
+
+    @classmethod
+    def load(cls, path):
+        """reads a table that was written with save()"""
+        with np.load(path, allow_pickle=False) as infile:
+            return cls(*[infile[field] for field in FeatureTable.FIELDS])
+
+    @classmethod
+    def create_from_text(cls, text):
+        """parses the contents of an RSAT feature file with the columns
+        id, type, name, contig, start, end and strand"""
+        columns = [[] for _ in FeatureTable.FIELDS]
+        for line in dfile_from_text(text, comment='--').lines:
+            if len(line) < 7:
+                continue
+            # note that feature positions can sometimes start with a '>'
+            # or '<', so make sure it is stripped away
+            values = [line[0], line[1], line[2], line[3],
+                      int(line[4].lstrip('<>')), int(line[5].lstrip('<>')),
+                      line[6] == 'R']
+            for column, value in zip(columns, values):
+                column.append(value)
+        return cls(*columns)
+
+
 def extract_upstream(source, location, distance):
     """Extract a subsequence of the specified  size from the source sequence
     Depending on the strand orientation, the sequence is cut around either
@@ -101,7 +174,8 @@ def subsequence(sequence, start, stop, reverse=False):
     """extracts a subsequence from a longer genomic sequence by coordinates.
     If reverse is True, the result string's reverse complement is
     calculated. Not that the start/stop positions are shifted to comply with
-    the original cMonkey's behavior
+    the original cMonkey's behavior. The sequence can be a string or
+    a contig array (see contig_array())
     """
     if start < 1:
         start = 1
@@ -109,6 +183,10 @@ def subsequence(sequence, start, stop, reverse=False):
     if stop > lseq:
         stop = lseq + 1
     result = sequence[start - 1:stop - 1]
+    if isinstance(result, np.ndarray):
+        if reverse:
+            result = REVCOMP_BYTES[result[::-1]]
+        return result.tobytes().decode('latin-1')
     if reverse:
         result = revcomp(result)
     return result
@@ -117,55 +195,161 @@ def subsequence(sequence, start, stop, reverse=False):
 REV_DICT = {'A': 'T', 'G': 'C', 'C': 'G', 'T': 'A'}
 
 
+def __make_revcomp_tables():
+    """returns the complement translation tables for unicode strings, for
+    str and for bytes, characters are converted to upper case. On Python 2,
+    str.translate() takes a 256 character table instead of a dictionary"""
+    chars = [chr(code) for code in xrange(256)]
+    complements = [REV_DICT.get(char.upper(), char.upper()) for char in chars]
+    if str is bytes:
+        str_table = ''.join(complements)
+        table = {ord(char): complement.decode('latin-1')
+                 for char, complement in zip(chars, complements)}
+    else:
+        table = {ord(char): complement for char, complement in zip(chars, complements)}
+        str_table = table
+    # some characters are upper cased to multiple characters or characters
+    # outside of latin-1, they are kept in the bytes table
+    bytes_table = np.array([ord(complement)
+                            if len(complement) == 1 and ord(complement) < 256 else ord(char)
+                            for char, complement in zip(chars, complements)],
+                           dtype=np.uint8)
+    return table, str_table, bytes_table
+
+REVCOMP_TABLE, REVCOMP_STR_TABLE, REVCOMP_BYTES = __make_revcomp_tables()
+
+
 def revcomp(sequence):
     """compute the reverse complement of the input string"""
-    return "".join([__revchar(c) for c in sequence[::-1]])
+    if isinstance(sequence, str):
+        return sequence[::-1].translate(REVCOMP_STR_TABLE)
+    return sequence[::-1].translate(REVCOMP_TABLE)
 
 
-def __revchar(nucleotide):
-    """for a nucleotide character, return its complement"""
-    nucleotide = nucleotide.upper()
-    if nucleotide in REV_DICT:
-        return REV_DICT[nucleotide]
-    else:
-        return nucleotide
+def contig_array(sequence):
+    """returns a contig sequence string as a uint8 array, which is the format
+    that contigs are cached in"""
+    return np.frombuffer(sequence.encode('latin-1'), dtype=np.uint8)
+
+
+def save_contig_array(path, array):
+    """writes a contig array to path atomically"""
+    util.write_atomic(path, lambda outfile: np.save(outfile, array))
+
+
+def load_contig_array(path):
+    """returns the contig array stored in path, memory-mapped"""
+    return np.load(path, mmap_mode='r')
 
 
 def subseq_counts(seqs, subseq_len):
     """return a dictionary containing for each subsequence of length
     subseq_len their respective count in the input sequences"""
-    counts = {}
-    for seq in seqs:
-        for index in xrange(0, len(seq) - subseq_len + 1):
-            subseq = seq[index:index + subseq_len]
-            if not subseq in counts:
-                counts[subseq] = 0
-            counts[subseq] += 1
-    return counts
+    return kmer_counts(seqs, subseq_len)[subseq_len - 1]
 
 
 def subseq_frequencies(seqs, subseq_len):
     """return a dictionary containing for each subsequence of
     length subseq_len their respective frequency within the
     input sequences"""
-    result = {}
-    counts = subseq_counts(seqs, subseq_len)
-    total = sum([count for count in counts.values()])
-    for subseq, count in counts.items():
-        result[subseq] = float(count) / float(total)
+    return counts_to_frequencies(subseq_counts(seqs, subseq_len))
+
+
+def counts_to_frequencies(counts):
+    """converts a dictionary of subsequence counts to frequencies"""
+    total = float(sum(counts.values()))
+    return {subseq: count / total for subseq, count in counts.items()}
+
+
+# 2-bit codes of the nucleotides, all other characters are mapped to
+# NUCLEOTIDE_CODE_OTHER
+NUCLEOTIDES = 'ACGT'
+NUCLEOTIDE_CODE_OTHER = 4
+
+
+def __make_nucleotide_codes():
+    result = np.full(256, NUCLEOTIDE_CODE_OTHER, dtype=np.int8)
+    for code, nucleotide in enumerate(NUCLEOTIDES):
+        result[ord(nucleotide)] = code
     return result
 
+NUCLEOTIDE_CODES = __make_nucleotide_codes()
+
+
+def kmer_names(length):
+    """returns the k-mers of the specified length in the order of their
+    integer codes"""
+    return [''.join(kmer) for kmer in it.product(NUCLEOTIDES, repeat=length)]
+
+
+def kmer_counts(seqs, max_length):
+    """counts the subsequences of the lengths 1,..,max_length in one pass.
+    The sequences are concatenated into a 2-bit code array with separators,
+    the k-mer codes are computed with a rolling hash and counted with
+    np.bincount. Subsequences that contain other characters than ACGT
+    are counted separately. Returns a list of dictionaries subsequence -> count,
+    containing only the observed subsequences"""
+    text = '\x00'.join(seqs)
+    codes = NUCLEOTIDE_CODES[np.frombuffer(text.encode('latin-1', 'replace'),
+                                           dtype=np.uint8)].astype(np.int64)
+    valid = codes != NUCLEOTIDE_CODE_OTHER
+    hashes = np.zeros(len(codes), dtype=np.int64)
+    hashes_valid = np.ones(len(codes), dtype=bool)
+    result = []
+    for length in xrange(1, max_length + 1):
+        num_windows = max(len(codes) - length + 1, 0)
+        hashes = hashes[:num_windows] * 4 + codes[length - 1:length - 1 + num_windows]
+        hashes_valid = hashes_valid[:num_windows] & valid[length - 1:length - 1 + num_windows]
+        counts = np.bincount(hashes[hashes_valid], minlength=4 ** length)
+        names = kmer_names(length)
+        result.append({names[code]: int(counts[code]) for code in np.nonzero(counts)[0]})
+
+    # subsequences with other characters, e.g. X
+    for seq in seqs:
+        if len(seq) > 0 and not valid_nucleotides(seq):
+            other = [pos for pos, char in enumerate(seq) if char not in NUCLEOTIDES]
+            for length in xrange(1, max_length + 1):
+                counts = result[length - 1]
+                starts = set()
+                for pos in other:
+                    starts.update(xrange(max(pos - length + 1, 0),
+                                         min(pos, len(seq) - length) + 1))
+                for start in sorted(starts):
+                    subseq = seq[start:start + length]
+                    counts[subseq] = counts.get(subseq, 0) + 1
+    return result
+
+
+def valid_nucleotides(seq):
+    """returns True if the sequence only consists of A, C, G and T"""
+    return __NON_NUCLEOTIDE.search(seq) is None
+
+__NON_NUCLEOTIDE = re.compile('[^ACGT]')
+
+
+# models of the recently used sequence sets
+MARKOV_BACKGROUND_CACHE_SIZE = 32
+__markov_background_cache = collections.OrderedDict()
+
 
 def markov_background(seqs, order):
     """computes the markov background model of the specified
     order for the given input sequences. This is implemented
     by gathering the frequencies of subsequences of length
-    1,..,(order + 1)"""
-    result = []
+    1,..,(order + 1). The models of the recently used sequence
+    sets are cached. The degenerate residues are replaced before the
+    lookup, so the random replacements are drawn as without the cache"""
     seqs = replace_degenerate_residues(seqs)
-    for subseq_len in xrange(1, (order + 2)):
-        result.append(subseq_frequencies(seqs, subseq_len))
-    return result
+    key = (order, hashlib.sha1('\n'.join(seqs).encode('utf-8')).hexdigest())
+    if key in __markov_background_cache:
+        model = __markov_background_cache.pop(key)
+    else:
+        counts = kmer_counts(seqs, order + 1)
+        model = [counts_to_frequencies(order_counts) for order_counts in counts]
+    __markov_background_cache[key] = model
+    if len(__markov_background_cache) > MARKOV_BACKGROUND_CACHE_SIZE:
+        __markov_background_cache.popitem(last=False)
+    return [dict(frequencies) for frequencies in model]
 
 
 def all_kmers(length, seqs, seq=[], pos=0, choices=['A', 'C', 'G', 'T']):
@@ -184,23 +368,26 @@ def all_kmers(length, seqs, seq=[], pos=0, choices=['A', 'C', 'G', 'T']):
             all_kmers(length, seqs, seq, pos + 1, choices)
 
 
+DEGENERATE_REPLACEMENTS = {'R': ['G', 'A'], 'Y': ['T', 'C'], 'K': ['G', 'T'],
+                           'M': ['A', 'C'], 'S': ['G', 'C'], 'W': ['A', 'T'],
+                           'N': ['G', 'A', 'T', 'C'],
+                           ' ': [' ']}
+__DEGENERATE_RESIDUE = re.compile('[^ACGTX]')
+
+
 def replace_degenerate_residues(seqs):
     """gets rid of funny characters in gene sequences by employing a
     replacement strategy"""
-    replacements = {'R': ['G', 'A'], 'Y': ['T', 'C'], 'K': ['G', 'T'],
-                    'M': ['A', 'C'], 'S': ['G', 'C'], 'W': ['A', 'T'],
-                    'N': ['G', 'A', 'T', 'C'],
-                    ' ': [' ']}
-
-    pat = re.compile('[ACGTX]*([^ACGTX])[ACGTX]*')
     result = []
     for seq in seqs:
         seq = seq.strip()  # For some reasons, there were cases with newlines in the beginning
-        for match in pat.finditer(seq):
-            replace_chars = replacements[seq[match.start(1)]]
-            replace_char = replace_chars[random.randint(
-                0, len(replace_chars) - 1)]
-            seq = seq[:match.start(1)] + replace_char + seq[match.end(1):]
+        positions = [match.start() for match in __DEGENERATE_RESIDUE.finditer(seq)]
+        if len(positions) > 0:
+            chars = list(seq)
+            for pos in positions:
+                replace_chars = DEGENERATE_REPLACEMENTS[chars[pos]]
+                chars[pos] = replace_chars[random.randint(0, len(replace_chars) - 1)]
+            seq = ''.join(chars)
         result.append(seq)
     return result
 
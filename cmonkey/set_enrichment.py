@@ -91,18 +91,6 @@ class SetType:
         return result
 
 
-# global variables that are shared by the child processe
-# when running in multiprocessing. This is an attempt to avoid
-# that the scoring function slows itself down by using to much
-# memory
-SET_MATRIX = None
-SET_MEMBERSHIP = None
-SET_SET_TYPE = None
-SET_SYNONYMS = None
-CANONICAL_ROWNAMES = None
-CANONICAL_ROW_INDEXES = None
-
-
 def read_set_types(config_params, thesaurus, input_genes):
     """Reads sets from a JSON file. We also ensure that genes
     are stored in canonical form in the set, so that set operations based on
@@ -185,6 +173,8 @@ class ScoringFunction(scoring.ScoringFunctionBase):
         self.__set_types = read_set_types(config_params, organism.thesaurus(),
                                           ratios.row_names)
         self.run_log = scoring.RunLog('set_enrichment', config_params)
+        self.__canonical_rownames = None
+        self.__canonical_row_indexes = None
 
     def bonferroni_cutoff(self):
         """Bonferroni cutoff value"""
@@ -195,27 +185,34 @@ class ScoringFunction(scoring.ScoringFunctionBase):
         Note: will return None if not computed yet and the result of a previous
         scoring if the function is not supposed to actually run in this iteration
         """
-        global SET_MATRIX, SET_MEMBERSHIP, SET_SET_TYPE, SET_SYNONYMS, CANONICAL_ROWNAMES, CANONICAL_ROW_INDEXES
         logging.info("Compute scores for set enrichment...")
         start_time = util.current_millis()
         matrix = dm.DataMatrix(len(self.gene_names()), self.num_clusters(),
                                self.gene_names())
         use_multiprocessing = self.config_params[scoring.KEY_MULTIPROCESSING]
-        SET_MATRIX = self.ratios
-        SET_MEMBERSHIP = self.membership
-        SET_SYNONYMS = self.organism.thesaurus()
+        synonyms = self.organism.thesaurus()
 
-        if CANONICAL_ROWNAMES is None:
-            CANONICAL_ROWNAMES = set(map(lambda n: SET_SYNONYMS[n] if n in SET_SYNONYMS else n,
-                                         self.ratios.row_names))
+        if self.__canonical_rownames is None:
+            self.__canonical_rownames = set(map(lambda n: synonyms[n] if n in synonyms else n,
+                                                self.ratios.row_names))
 
-        if CANONICAL_ROW_INDEXES is None:
-            CANONICAL_ROW_INDEXES = {}
+        if self.__canonical_row_indexes is None:
+            self.__canonical_row_indexes = {}
             for index, row in enumerate(self.ratios.row_names):
-                if row in SET_SYNONYMS:
-                    CANONICAL_ROW_INDEXES[SET_SYNONYMS[row]] = index
+                if row in synonyms:
+                    self.__canonical_row_indexes[synonyms[row]] = index
                 else:
-                    CANONICAL_ROW_INDEXES[row] = index
+                    self.__canonical_row_indexes[row] = index
+
+        # everything except the membership is read-only and only sent
+        # to the workers once
+        util.broadcast('set_enrichment.matrix', self.ratios, force=False)
+        util.broadcast('set_enrichment.synonyms', synonyms, force=False)
+        util.broadcast('set_enrichment.canonical_rownames', self.__canonical_rownames,
+                       force=False)
+        util.broadcast('set_enrichment.canonical_row_indexes', self.__canonical_row_indexes,
+                       force=False)
+        util.broadcast_membership(self.membership)
 
         ref_min_score = np.nanpercentile(ref_matrix.values, 10.0)
         logging.info('REF_MIN_SCORE: %f', ref_min_score)
@@ -226,7 +223,7 @@ class ScoringFunction(scoring.ScoringFunctionBase):
                                      'setEnrichment_pvalue.csv')
 
         for set_type in self.__set_types:
-            SET_SET_TYPE = set_type
+            util.broadcast('set_enrichment.set_type', set_type, force=False)
             logging.info("PROCESSING SET TYPE '%s'", set_type.name)
             start1 = util.current_millis()
             cutoff = self.bonferroni_cutoff()
@@ -270,12 +267,6 @@ class ScoringFunction(scoring.ScoringFunctionBase):
 
         logging.info("SET ENRICHMENT FINISHED IN %f s.\n",
                      (util.current_millis() - start_time) / 1000.0)
-        # cleanup
-        SET_SET_TYPE = None
-        SET_MATRIX = None
-        SET_MEMBERSHIP = None
-        SET_SYNONYMS = None
-
         return matrix
 
     def run_logs(self):
@@ -285,10 +276,14 @@ class ScoringFunction(scoring.ScoringFunctionBase):
 
 def compute_cluster_score(args):
     """Computes the cluster score for a given set type"""
-    global SET_MATRIX, SET_MEMBERSHIP, SET_SET_TYPE, SET_SYNONYMS, CANONICAL_ROWNAMES, CANONICAL_ROW_INDEXES
     cluster, cutoff, ref_min_score = args
-    return compute_cluster_score_plain(cluster, cutoff, ref_min_score, SET_MATRIX, SET_MEMBERSHIP,
-                                       SET_SET_TYPE, SET_SYNONYMS, CANONICAL_ROWNAMES, CANONICAL_ROW_INDEXES)
+    return compute_cluster_score_plain(cluster, cutoff, ref_min_score,
+                                       util.shared('set_enrichment.matrix'),
+                                       util.shared('membership'),
+                                       util.shared('set_enrichment.set_type'),
+                                       util.shared('set_enrichment.synonyms'),
+                                       util.shared('set_enrichment.canonical_rownames'),
+                                       util.shared('set_enrichment.canonical_row_indexes'))
 
 def compute_cluster_score_plain(cluster, cutoff, ref_min_score, SET_MATRIX, SET_MEMBERSHIP, SET_SET_TYPE,
                                 SET_SYNONYMS, CANONICAL_ROWNAMES, CANONICAL_ROW_INDEXES):
@@ -8,6 +8,7 @@ import operator
 import collections
 from collections import defaultdict
 import math
+import random
 import numpy as np
 import scipy.stats
 
@@ -24,12 +25,28 @@ except NameError:
 
 
 import os
-import rpy2.robjects as robjects
 import gzip
 import shelve
 import time
 import logging
 import multiprocessing as mp
+import shutil
+import tempfile
+import hashlib
+
+# Python2/Python3 compatibility
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+import cmonkey.numerics as numerics
+
+# rpy2 is only required for the 'r' numerics backend
+try:
+    import rpy2.robjects as robjects
+except ImportError:
+    robjects = None
 
 # RSAT organism finding is an optional feature, which we can skip in case that
 # the user imports all the features through own text files
@@ -265,6 +282,68 @@ def get_url_cached(url, cache_filename):
             outfile.write(read_url(url))
 
 
+def current_umask():
+    """returns the file mode creation mask of the process, it can only be
+    read by setting it"""
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+# read once at startup: setting the mask while other threads create
+# files would change their permissions
+UMASK = current_umask()
+
+
+def write_atomic(path, writer, mode='wb'):
+    """writes the file path with writer, a function of the file object.
+    The data is written to a uniquely named temporary file in the same
+    directory that replaces path when it is complete, so readers never
+    see a partially written file and concurrent writers do not share a
+    temporary file. The file gets the permissions of a file created with
+    open(), so other users can read shared cache files"""
+    handle, tmp_path = tempfile.mkstemp(prefix='tmp', dir=os.path.dirname(path) or '.')
+    try:
+        with os.fdopen(handle, mode) as outfile:
+            writer(outfile)
+        os.chmod(tmp_path, 0o666 & ~UMASK)
+        os.rename(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_content_addressed(dirname, prefix, text):
+    """writes text to a file in dirname that is named after prefix and
+    the SHA-1 digest of text and returns its path. If the file already
+    exists, it has the same contents and is reused"""
+    digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+    path = os.path.join(dirname, '%s-%s' % (prefix, digest))
+    if not os.path.exists(path):
+        write_atomic(path, lambda outfile: outfile.write(text), mode='w')
+    return path
+
+
+def find_executable(name):
+    """returns the path of the executable name in the PATH or None"""
+    for dirname in os.environ.get('PATH', '').split(os.pathsep):
+        path = os.path.join(dirname, name)
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return None
+
+
+def file_digest(path):
+    """returns the SHA-1 digest of the file's contents, None if path is None"""
+    if path is None:
+        return None
+    digest = hashlib.sha1()
+    with open(path, 'rb') as infile:
+        for chunk in iter(lambda: infile.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
 class ThesaurusBasedMap:  # pylint: disable-msg=R0903
     """wrapping a thesaurus and a feature id based map for a flexible
     lookup container that can use any valid gene alias"""
@@ -331,8 +410,34 @@ def trim_mean(values, trim):
 ######################################################################
 ### RPY2 abstraction
 ######################################################################
+NUMERICS_BACKENDS = {'r', 'numpy'}
+
+# The numerics backend determines whether the statistics functions below
+# call into R through rpy2 ('r') or use the NumPy/SciPy implementations
+# in the numerics module ('numpy')
+NUMERICS_BACKEND = 'r' if robjects is not None else 'numpy'
+
+
+def set_numerics_backend(backend):
+    """selects the numerics backend, this needs to happen before worker
+    processes are forked"""
+    global NUMERICS_BACKEND
+    if backend not in NUMERICS_BACKENDS:
+        raise Exception("unknown numerics backend: '%s'" % backend)
+    if backend == 'r' and robjects is None:
+        raise Exception("numerics backend 'r' requires rpy2")
+    NUMERICS_BACKEND = backend
+
+
+def use_r():
+    """returns True if the R numerics backend is active"""
+    return NUMERICS_BACKEND == 'r'
+
+
 def density(kvalues, cluster_values, bandwidth, dmin, dmax):
     """generic function to compute density scores"""
+    if not use_r():
+        return numerics.density(kvalues, cluster_values, bandwidth, dmin, dmax)
     kwargs = {'bw': bandwidth, 'adjust': 2, 'from': dmin,
               'to': dmax, 'n': 256, 'na.rm': True}
     rdens = robjects.r("""
@@ -345,20 +450,59 @@ def density(kvalues, cluster_values, bandwidth, dmin, dmax):
                  robjects.FloatVector(kvalues), **kwargs)
 
 
+def density_matrix(kvalues, members, bandwidths, dmin, dmax):
+    """computes the density scores for all columns of kvalues at once,
+    the cluster values of column k are the values where members[:, k]
+    is True"""
+    if not use_r():
+        return numerics.density_matrix(kvalues, members, bandwidths, dmin, dmax)
+    result = np.zeros(kvalues.shape)
+    for k in xrange(kvalues.shape[1]):
+        result[:, k] = density(kvalues[:, k], kvalues[members[:, k], k],
+                               bandwidths[k], dmin[k], dmax[k])
+    return result
+
+
 def r_set_seed(value):
     """calls R's set.seed()"""
-    set_seed = robjects.r['set.seed']
-    set_seed(value)
+    if not use_r():
+        numerics.set_seed(value)
+    else:
+        set_seed = robjects.r['set.seed']
+        set_seed(value)
+
+
+def random_states():
+    """returns the states of the Python, NumPy and, with the R numerics
+    backend, the R random number generators"""
+    result = {'python': random.getstate(), 'numpy': np.random.get_state(), 'r': None}
+    if use_r():
+        seed = robjects.r('if (exists(".Random.seed", envir=globalenv())) .Random.seed else NULL')
+        if seed is not robjects.NULL:
+            result['r'] = [int(value) for value in seed]
+    return result
+
+
+def set_random_states(states):
+    """restores the random number generator states returned by random_states()"""
+    random.setstate(states['python'])
+    np.random.set_state(states['numpy'])
+    if use_r() and states['r'] is not None:
+        robjects.globalenv['.Random.seed'] = robjects.IntVector(states['r'])
 
 
 def r_runif(value):
     """calls R's set.seed()"""
+    if not use_r():
+        return numerics.runif(value)
     runif = robjects.r['runif']
     return runif(value)
 
 
 def rnorm(num_values, std_deviation):
     """returns the result of R's rnorm function"""
+    if not use_r():
+        return numerics.rnorm(num_values, std_deviation)
     r_rnorm = robjects.r['rnorm']
     kwargs = {'sd': std_deviation}
     return r_rnorm(num_values, **kwargs)
@@ -366,6 +510,8 @@ def rnorm(num_values, std_deviation):
 
 def phyper(q, m, n, k, lower_tail=False):
     """calls the R function phyper"""
+    if not use_r():
+        return numerics.phyper(q, m, n, k, lower_tail)
     r_phyper = robjects.r['phyper']
     kwargs = {'lower.tail': lower_tail}
     return r_phyper(robjects.FloatVector(q),
@@ -376,6 +522,8 @@ def phyper(q, m, n, k, lower_tail=False):
 
 def rrank(values):
     """invokes the R function rank"""
+    if not use_r():
+        return numerics.rrank(values)
     r_rank = robjects.r['rank']
     kwargs = {'ties': 'min', 'na': 'keep'}
     return r_rank(robjects.FloatVector(values), **kwargs)
@@ -383,6 +531,8 @@ def rrank(values):
 
 def mad(values):
     """invokes the R function mad"""
+    if not use_r():
+        return numerics.mad(values)
     r_mad = robjects.r['mad']
     kwargs = {'na.rm': False}
     return r_mad(robjects.FloatVector(values), **kwargs)
@@ -392,6 +542,8 @@ def sd_rnorm(values, num_rnorm_values, fuzzy_coeff):
     """computes standard deviation on values and then calls rnorm to
     generate the num_rnorm_values. This combines stddev and rnorm
     in one function for reducing rpy2 call overhead"""
+    if not use_r():
+        return numerics.sd_rnorm(values, num_rnorm_values, fuzzy_coeff)
     func = robjects.r("""
       sd_rnorm <- function(values, num_out_values, fuzzy_coeff) {
         sdval <- sd(values, na.rm=T) * fuzzy_coeff
@@ -403,6 +555,8 @@ def sd_rnorm(values, num_rnorm_values, fuzzy_coeff):
 
 
 def rrank_matrix(npmatrix):
+    if not use_r():
+        return numerics.rrank_matrix(npmatrix)
     func = robjects.r("""
       rank_mat <- function(values, nrow, ncol) {
         xr <- t(matrix(values, nrow=nrow, ncol=ncol, byrow=T))
@@ -425,16 +579,34 @@ def order_fast(values, result_size, reverse=True):
 
 def rorder(values, result_size):
     """call the R version of order"""
+    if not use_r():
+        return numerics.rorder(values, result_size)
     r_order = robjects.r['order']
     kwargs = {'decreasing': True}
     res = r_order(robjects.FloatVector(values), **kwargs)
     return res[:result_size]
 
 
+def kmeans(npmatrix, num_clusters):
+    """k-means clustering of the matrix rows, returns the 1-based
+    cluster number for each row"""
+    if not use_r():
+        return numerics.kmeans(npmatrix, num_clusters)
+    num_rows = npmatrix.shape[0]
+    matrix_values = robjects.r.matrix(
+        robjects.FloatVector(npmatrix.ravel()), nrow=num_rows, byrow=True)
+    r_kmeans = robjects.r['kmeans']
+    kwargs = {'centers': num_clusters, 'iter.max': 20, 'nstart': 2}
+    return r_kmeans(matrix_values, **kwargs)[0]
+
+
 def get_rvec_fun(rvecstr):
     """make scaling function based on an R vector expression string"""
     def scale(iteration):
-        rvec = robjects.r(rvecstr)
+        if use_r():
+            rvec = robjects.r(rvecstr)
+        else:
+            rvec = numerics.rvec(rvecstr)
         if iteration > len(rvec):
             return rvec[-1]
         else:
@@ -491,22 +663,160 @@ def which_multiple(elems):
     return {elem for elem, count in result.items() if count > 1}
 
 
+######################################################################
+### Worker pool
+######################################################################
+
+# Shared state of this process: key -> (version, value). In the parent
+# process it is set by broadcast(), in the workers it is synchronized
+# before a task runs
+SHARED_STATE = {}
+SHARED_STATE_VERSION = 0
+
+# The worker pool of the current run, see CMonkeyRun
+RUN_POOL = None
+
+
+# key -> tag of the broadcast value
+SHARED_STATE_TAGS = {}
+
+
+def broadcast(key, value, force=True, tag=None):
+    """Makes value available to all worker tasks under the given key.
+    The workers receive the value once per version. With force=False,
+    broadcasting the object that is already shared under key does not
+    create a new version, which is useful for read-only data such as the
+    ratios matrix. Objects that change in place can provide a tag that
+    changes with them, the object is then only sent again if the tag
+    changed"""
+    global SHARED_STATE_VERSION
+    if (key in SHARED_STATE and SHARED_STATE[key][1] is value and
+        (not force or (tag is not None and SHARED_STATE_TAGS.get(key) == tag))):
+        return
+    SHARED_STATE_VERSION += 1
+    SHARED_STATE[key] = (SHARED_STATE_VERSION, value)
+    SHARED_STATE_TAGS[key] = tag
+
+
+def broadcast_membership(membership):
+    """broadcasts the membership under the key 'membership', it is only sent
+    to the workers again when it was modified"""
+    broadcast('membership', membership, tag=getattr(membership, 'changes', None))
+
+
+def shared(key):
+    """returns the value that was broadcast under key"""
+    return SHARED_STATE[key][1]
+
+
+def sync_shared_state(published):
+    """worker side: loads the values whose version differs from the one
+    we have. published maps key -> (version, path)"""
+    for key, (version, path) in published.items():
+        if key not in SHARED_STATE or SHARED_STATE[key][0] != version:
+            with open(path, 'rb') as infile:
+                SHARED_STATE[key] = (version, pickle.load(infile))
+
+
+def run_task(task):
+    """worker side: executes a task from WorkerPool.map()"""
+    fun, published, arg = task
+    sync_shared_state(published)
+    return fun(arg)
+
+
+class WorkerPool:
+    """A process pool that is started on the first map() and then reused
+    until shutdown(). Workers do not rely on the state they inherited when
+    they were forked, state changes made with broadcast() are written to
+    the state directory once per version and picked up by each worker
+    before it runs its next task"""
+    def __init__(self, num_cores=None):
+        self.num_cores = num_cores
+        self.__pool = None
+        self.__state_dir = None
+        self.__published = {}
+
+    def __publish(self):
+        """writes the shared state versions that the workers did not see yet"""
+        if self.__state_dir is None:
+            self.__state_dir = tempfile.mkdtemp(prefix='cmonkey-state-')
+        for key, (version, value) in SHARED_STATE.items():
+            if key in self.__published and self.__published[key][0] == version:
+                continue
+            path = os.path.join(self.__state_dir, '%s-%d.pkl' % (key, version))
+            with open(path, 'wb') as outfile:
+                pickle.dump(value, outfile, pickle.HIGHEST_PROTOCOL)
+            if key in self.__published and self.__published[key][1] is not None:
+                os.remove(self.__published[key][1])
+            self.__published[key] = (version, path)
+
+    def start(self):
+        """starts the workers, otherwise they are started on the first map().
+        A pool that is used next to other threads has to be started before
+        them, a forked process inherits the locks that other threads hold"""
+        if self.__pool is None:
+            self.__pool = mp.Pool(self.num_cores)
+            if mp.get_start_method() == 'fork':
+                # forked workers start out with the current state
+                for key, (version, value) in SHARED_STATE.items():
+                    self.__published[key] = (version, None)
+
+    def __tasks(self, fun, iterable):
+        """starts the workers if necessary, publishes the shared state and
+        returns the tasks for the arguments in iterable"""
+        self.start()
+        self.__publish()
+        published = dict(self.__published)
+        return [(fun, published, arg) for arg in iterable]
+
+    def map(self, fun, iterable):
+        """parallel map of fun over iterable, fun has to be a module level
+        function"""
+        tasks = self.__tasks(fun, iterable)
+        return self.__pool.map(run_task, tasks)
+
+    def imap_unordered(self, fun, iterable, chunksize=1):
+        """like map(), but the tasks are handed out chunksize at a time in
+        the order of iterable and the results are returned as they complete"""
+        tasks = self.__tasks(fun, iterable)
+        return self.__pool.imap_unordered(run_task, tasks, chunksize)
+
+    def shutdown(self, terminate=False):
+        """stops the workers and removes the state files. With terminate,
+        the workers are stopped without finishing the queued tasks"""
+        if self.__pool is not None:
+            if terminate:
+                self.__pool.terminate()
+            else:
+                self.__pool.close()
+            self.__pool.join()
+            self.__pool = None
+        if self.__state_dir is not None:
+            shutil.rmtree(self.__state_dir, True)
+            self.__state_dir = None
+        self.__published = {}
+
+
 class get_mp_pool:
-    """pool manager"""
+    """pool manager, returns the pool of the current run if there is one,
+    otherwise a pool that is shut down when the block exits"""
     def __init__(self, config_params={}):
         """use the configuration to return a pool with user-defined number of cores
         if possible"""
-        if 'num_cores' in config_params:
-            self.pool = mp.Pool(config_params['num_cores'])
+        if RUN_POOL is not None:
+            self.pool = RUN_POOL
+            self.owned = False
         else:
-            self.pool = mp.Pool()
+            self.pool = WorkerPool(config_params.get('num_cores', None))
+            self.owned = True
 
     def __enter__(self):
         return self.pool
 
     def __exit__(self, type, value, tb):
-        self.pool.close()
-        self.pool.join()
+        if self.owned:
+            self.pool.shutdown()
 
 __all__ = ['DelimitedFile', 'best_matching_links', 'quantile',
            'DocumentNotFound', 'CMonkeyURLopener', 'read_url',
@@ -11,6 +11,7 @@ import xmlrunner
 import orig_membership_test as omembtest
 import datamatrix_test as dmtest
 import util_test as ut
+import numerics_test as nt
 import organism_test as ot
 import seqtools_test as stt
 import thesaurus_test as tht
@@ -18,7 +19,13 @@ import operon_nw_test as opnwt
 import network_test as nwt
 import microarray_test as mat
 import meme_test as met
+import meme_cache_test as mct
+import motif_test as mot
+import result_writer_test as rwrt
+import membership_history_test as mht
+import checkpoint_test as cpt
 import pssm_test as pt
+import pssm_scan_test as pst
 import combiner_test as ct
 import read_wee_test as rwt
 
@@ -38,18 +45,25 @@ if __name__ == '__main__':
     SUITE.append(unittest.TestLoader().loadTestsFromTestCase(dmtest.NoChangeFilterTest))
     SUITE.append(unittest.TestLoader().loadTestsFromTestCase(dmtest.CenterScaleFilterTest))
     SUITE.append(unittest.TestLoader().loadTestsFromTestCase(dmtest.QuantileNormalizeTest))
+    SUITE.append(unittest.TestLoader().loadTestsFromTestCase(dmtest.SharedDataMatrixTest))
+    SUITE.append(unittest.TestLoader().loadTestsFromTestCase(dmtest.ClusterResidualsTest))
 
     SUITE.append(unittest.TestLoader().loadTestsFromTestCase(ut.DelimitedFileTest))
     SUITE.append(unittest.TestLoader().loadTestsFromTestCase(ut.UtilsTest))
     SUITE.append(unittest.TestLoader().loadTestsFromTestCase(ut.LevenshteinDistanceTest))
     SUITE.append(unittest.TestLoader().loadTestsFromTestCase(ut.BestMatchingLinksTest))
     SUITE.append(unittest.TestLoader().loadTestsFromTestCase(ut.Order2StringTest))
+    SUITE.append(unittest.TestLoader().loadTestsFromTestCase(ut.WorkerPoolTest))
+
+    SUITE.append(unittest.TestLoader().loadTestsFromTestCase(nt.NumericsTest))
+    SUITE.append(unittest.TestLoader().loadTestsFromTestCase(nt.NumericsParityTest))
 
     SUITE.append(unittest.TestLoader().loadTestsFromTestCase(ot.MicrobeTest))
 
     SUITE.append(unittest.TestLoader().loadTestsFromTestCase(stt.SeqtoolsTest))
     SUITE.append(unittest.TestLoader().loadTestsFromTestCase(stt.FastaTest))
     SUITE.append(unittest.TestLoader().loadTestsFromTestCase(stt.LocationTest))
+    SUITE.append(unittest.TestLoader().loadTestsFromTestCase(stt.FeatureTableTest))
 
     SUITE.append(unittest.TestLoader().loadTestsFromTestCase(tht.DelimitedFileFactoryTest))
 
@@ -62,8 +76,20 @@ if __name__ == '__main__':
     SUITE.append(unittest.TestLoader().loadTestsFromTestCase(mat.ComputeArrayScoresTest))
 
     SUITE.append(unittest.TestLoader().loadTestsFromTestCase(met.MemeTest))
+    SUITE.append(unittest.TestLoader().loadTestsFromTestCase(met.MemeSuiteFilesTest))
+    SUITE.append(unittest.TestLoader().loadTestsFromTestCase(mct.MemeResultCacheTest))
+    SUITE.append(unittest.TestLoader().loadTestsFromTestCase(mct.DustCacheTest))
+    SUITE.append(unittest.TestLoader().loadTestsFromTestCase(mot.MotifJobCostModelTest))
+    SUITE.append(unittest.TestLoader().loadTestsFromTestCase(mot.MotifJobBatchTest))
+    SUITE.append(unittest.TestLoader().loadTestsFromTestCase(mot.GeneSequenceTableTest))
+    SUITE.append(unittest.TestLoader().loadTestsFromTestCase(rwrt.ResultWriterTest))
+    SUITE.append(unittest.TestLoader().loadTestsFromTestCase(rwrt.BackgroundWriterTest))
+    SUITE.append(unittest.TestLoader().loadTestsFromTestCase(mht.MembershipHistoryTest))
+    SUITE.append(unittest.TestLoader().loadTestsFromTestCase(cpt.CheckpointTest))
+    SUITE.append(unittest.TestLoader().loadTestsFromTestCase(cpt.ScoringCheckpointStateTest))
 
     SUITE.append(unittest.TestLoader().loadTestsFromTestCase(pt.PssmTest))
+    SUITE.append(unittest.TestLoader().loadTestsFromTestCase(pst.PssmScanTest))
     SUITE.append(unittest.TestLoader().loadTestsFromTestCase(ct.CombinerTest))
     SUITE.append(unittest.TestLoader().loadTestsFromTestCase(rwt.ReadWeeTest))
     SUITE.append(unittest.TestLoader().loadTestsFromTestCase(se_test.DiscreteEnrichmentSetTest))
@@ -0,0 +1,122 @@
+"""checkpoint_test.py - unit tests for the checkpoint module
+
+This file is part of cMonkey Python. Please see README and LICENSE for
+more information and licensing details.
+"""
+import unittest
+import os
+import pickle
+import random
+import shutil
+import sqlite3
+import tempfile
+import numpy as np
+import cmonkey.checkpoint as checkpoint
+import cmonkey.membership as memb
+import cmonkey.scoring as scoring
+import cmonkey.util as util
+
+
+CONFIG_PARAMS = {'memb.clusters_per_row': 2, 'memb.clusters_per_col': 2,
+                 'num_clusters': 3, 'output_dir': 'out'}
+
+
+def make_membership():
+    return memb.OrigMembership(['R1', 'R2', 'R3'], ['C1', 'C2'],
+                               {'R1': [1, 2], 'R2': [2], 'R3': [3]},
+                               {'C1': [1, 3], 'C2': [2]}, CONFIG_PARAMS)
+
+
+class CheckpointTest(unittest.TestCase):  # pylint: disable-msg=R0904
+    """Test class for the checkpoint module"""
+
+    def setUp(self):  # pylint: disable-msg=C0103
+        self.dirname = tempfile.mkdtemp()
+        self.path = checkpoint.checkpoint_path(self.dirname)
+
+    def tearDown(self):  # pylint: disable-msg=C0103
+        shutil.rmtree(self.dirname)
+
+    def test_write_and_load(self):
+        """the written state is loaded, missing files are no checkpoint"""
+        self.assertIsNone(checkpoint.load(self.path))
+        checkpoint.write_file(None, self.path, checkpoint.dumps({'iteration': 100}))
+        self.assertEquals(100, checkpoint.load(self.path)['iteration'])
+        self.assertEquals([checkpoint.CHECKPOINT_FILE], os.listdir(self.dirname))
+
+    def test_load_unusable(self):
+        """checkpoints of another version and truncated files are ignored"""
+        with open(self.path, 'wb') as outfile:
+            pickle.dump({'version': checkpoint.CHECKPOINT_VERSION + 1, 'iteration': 100},
+                        outfile)
+        self.assertIsNone(checkpoint.load(self.path))
+        data = checkpoint.dumps({'iteration': 100})
+        with open(self.path, 'wb') as outfile:
+            outfile.write(data[:len(data) // 2])
+        self.assertIsNone(checkpoint.load(self.path))
+
+    def test_restore_membership(self):
+        """the tables are replaced and the cluster indexes rebuilt"""
+        membership = make_membership()
+        state = checkpoint.membership_state(membership)
+        membership.replace_row_cluster('R1', 0, 3)
+        self.assertEquals(['R1', 'R3'], sorted(membership.rows_for_cluster(3)))
+        checkpoint.restore_membership(membership, state)
+        self.assertEquals({'R3'}, membership.rows_for_cluster(3))
+        self.assertEquals({'R1'}, membership.rows_for_cluster(1))
+
+        state['row_names'] = ['R1', 'R2', 'R4']
+        self.assertRaises(ValueError, checkpoint.restore_membership, membership, state)
+
+    def test_discard_results_after(self):
+        """the rows of later iterations are removed"""
+        conn = sqlite3.connect(':memory:')
+        conn.execute('create table run_infos (last_iteration int)')
+        conn.execute('insert into run_infos values (300)')
+        for table in checkpoint.ITERATION_TABLES + ['motif_infos']:
+            conn.execute('create table %s (iteration int)' % table)
+            conn.executemany('insert into %s values (?)' % table, [(100,), (200,), (300,)])
+        conn.execute('create table meme_motif_sites (motif_info_id int)')
+        conn.execute('create table tomtom_results (motif_info_id1 int)')
+        conn.executemany('insert into meme_motif_sites values (?)', [(1,), (2,), (3,)])
+        conn.executemany('insert into tomtom_results values (?)', [(1,), (3,)])
+
+        checkpoint.discard_results_after(conn, 200)
+        for table in checkpoint.ITERATION_TABLES + ['motif_infos']:
+            self.assertEquals([(100,), (200,)], conn.execute(
+                'select iteration from %s order by iteration' % table).fetchall())
+        self.assertEquals([(1,), (2,)], conn.execute(
+            'select motif_info_id from meme_motif_sites order by motif_info_id').fetchall())
+        self.assertEquals([(1,)], conn.execute('select * from tomtom_results').fetchall())
+        self.assertEquals((200,), conn.execute('select * from run_infos').fetchone())
+        conn.close()
+
+    def test_random_states(self):
+        """the generators continue with the same numbers"""
+        states = util.random_states()
+        expected = (random.random(), np.random.rand())
+        random.random()
+        np.random.rand()
+        util.set_random_states(states)
+        self.assertEquals(expected, (random.random(), np.random.rand()))
+
+
+class ScoringCheckpointStateTest(unittest.TestCase):  # pylint: disable-msg=R0904
+    """Test class for the checkpoint states of the scoring functions"""
+
+    def make_function(self, id):
+        return scoring.ScoringFunctionBase(id, None, None, None, CONFIG_PARAMS)
+
+    def test_combiner_state(self):
+        """the cached results of the functions are restored"""
+        functions = [self.make_function('Rows'), self.make_function('Networks')]
+        functions[0].store_result(np.ones((3, 3)))
+        combiner = scoring.ScoringFunctionCombiner(None, None, functions, CONFIG_PARAMS)
+        state = combiner.checkpoint_state()
+
+        functions = [self.make_function('Rows'), self.make_function('Networks')]
+        combiner = scoring.ScoringFunctionCombiner(None, None, functions, CONFIG_PARAMS)
+        combiner.restore_checkpoint_state(state)
+        self.assertTrue(np.array_equal(np.ones((3, 3)), functions[0].last_cached()))
+        self.assertFalse(hasattr(functions[1], 'cached_result'))
+        self.assertRaises(ValueError, combiner.restore_checkpoint_state, state[:1])
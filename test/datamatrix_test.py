@@ -10,6 +10,7 @@ import numpy as np
 import cmonkey.util as util
 import os
 import pandas
+import pickle
 
 
 class DataMatrixTest(unittest.TestCase):  # pylint: disable-msg=R0904
@@ -303,6 +304,72 @@ class DataMatrixTest(unittest.TestCase):  # pylint: disable-msg=R0904
 
 
 
+class ClusterResidualsTest(unittest.TestCase):  # pylint: disable-msg=R0904
+    """Test class for residual() and ClusterResiduals"""
+
+    def setUp(self):  # pylint: disable-msg=C0103
+        values = np.arange(30, dtype=np.float64).reshape(5, 6) ** 1.5
+        values[1, 2] = np.nan
+        values[3, :] = np.nan
+        self.matrix = dm.DataMatrix(5, 6, ['R%d' % i for i in range(5)],
+                                    ['C%d' % i for i in range(6)], values=values)
+
+    def test_residual(self):
+        """the residual equals the one of the submatrix"""
+        self.assertAlmostEqual(4049.38271604938,
+                               dm.residual(np.array([[1000, -4000, 7000],
+                                                     [-2000, 5000, -8000],
+                                                     [3000, -6000, 9000]], dtype=np.float64)))
+        submatrix = self.matrix.submatrix_by_name(row_names=['R0', 'R1', 'R3', 'R4'])
+        self.assertAlmostEqual(submatrix.residual(), dm.residual(submatrix.values))
+
+    def test_cluster_residuals(self):
+        """the residuals are only computed for changed clusters"""
+        residuals = dm.ClusterResiduals(self.matrix)
+        expected = self.matrix.submatrix_by_name(row_names=['R0', 'R1', 'R4']).residual()
+        self.assertAlmostEqual(expected, residuals.residual(1, [0, 1, 4], np.arange(6)))
+        self.assertEquals(1.0, residuals.residual(2, [2], np.arange(6)))
+        self.assertAlmostEqual(expected, residuals.residual(1, [0, 1, 4], np.arange(6)))
+        self.assertEquals(1, residuals.num_computed)
+        residuals.residual(1, [0, 4], np.arange(6))
+        self.assertEquals(2, residuals.num_computed)
+
+
+class SharedDataMatrixTest(unittest.TestCase):  # pylint: disable-msg=R0904
+    """Test class for SharedDataMatrix"""
+
+    def setUp(self):  # pylint: disable-msg=C0103
+        self.matrix = dm.SharedDataMatrix(dm.DataMatrix(2, 3, ['R1', 'R2'], ['C1', 'C2', 'C3'],
+                                                        values=[[1.0, 2.0, 3.0],
+                                                                [4.0, 5.0, np.nan]]))
+
+    def tearDown(self):  # pylint: disable-msg=C0103
+        self.matrix.unlink()
+
+    def test_create(self):
+        """the shared matrix has the values and names of the original"""
+        self.assertEquals(['R1', 'R2'], self.matrix.row_names)
+        self.assertEquals(3, self.matrix.num_columns)
+        self.assertEquals([4.0, 5.0], self.matrix.row_values(1)[:2].tolist())
+        submatrix = self.matrix.submatrix_by_name(row_names=['R2'], column_names=['C2'])
+        self.assertEquals([[5.0]], submatrix.values.tolist())
+
+    def test_pickle(self):
+        """unpickled copies map the values of the original"""
+        copy = pickle.loads(pickle.dumps(self.matrix))
+        self.assertTrue(len(pickle.dumps(self.matrix)) < 1000)
+        self.assertEquals(self.matrix.row_names, copy.row_names)
+        self.assertEquals(3.0, copy.values[0, 2])
+        self.assertTrue(np.isnan(copy.values[1, 2]))
+        self.matrix.values[0, 0] = 42.0
+        self.assertEquals(42.0, copy.values[0, 0])
+        # only the original removes the file
+        copy.unlink()
+        self.assertTrue(os.path.exists(self.matrix.path))
+        self.matrix.unlink()
+        self.assertFalse(os.path.exists(self.matrix.path))
+
+
 class MockDelimitedFile:  # pylint: disable-msg=R0903
     """Mock DelimitedFile"""
 
@@ -447,6 +514,15 @@ class QuantileNormalizeTest(unittest.TestCase): # pylint: disable-msg=R0904
         self.assertTrue((qm1.values == [[2, 1], [3, 4]]).all())
         self.assertTrue((qm2.values == [[4, 3], [2, 1]]).all())
 
+    def test_qm_result_matrices_nan(self):
+        """NaN values are not ranked and stay NaN"""
+        m1 = dm.DataMatrix(2, 2, values=[[1, np.nan], [3, 2]])
+        tmp_mean = np.array([1.0, 2.0, 3.0, 4.0])
+        qm1 = dm.qm_result_matrices([m1], tmp_mean, multiprocessing=False)[0]
+        self.assertEquals([1.0, 3.0, 2.0], [qm1.values[0][0], qm1.values[1][0],
+                                            qm1.values[1][1]])
+        self.assertTrue(np.isnan(qm1.values[0][1]))
+
     def test_quantile_normalize_scores_with_all_defined_weights(self):
         """happy path for quantile normalization"""
         m1 = dm.DataMatrix(2, 2, values=[[1, 3], [2, 4]])
@@ -0,0 +1,85 @@
+"""membership_history_test.py - unit tests for the membership_history module
+
+This file is part of cMonkey Python. Please see README and LICENSE for
+more information and licensing details.
+"""
+import unittest
+import os
+import shutil
+import sqlite3
+import tempfile
+import numpy as np
+import cmonkey.membership_history as mh
+
+
+ROW_NAMES = ['VNG1', 'VNG2', 'VNG3']
+COL_NAMES = ['cond1', 'cond2']
+
+
+class MembershipHistoryTest(unittest.TestCase):  # pylint: disable-msg=R0904
+    """Test class for MembershipHistory"""
+
+    def setUp(self):  # pylint: disable-msg=C0103
+        self.dirname = tempfile.mkdtemp()
+        self.history_dir = os.path.join(self.dirname, 'membership_history')
+
+    def tearDown(self):  # pylint: disable-msg=C0103
+        shutil.rmtree(self.dirname)
+
+    def test_append_and_snapshot(self):
+        """the appended tables are returned by iteration"""
+        history = mh.MembershipHistory(self.history_dir, ROW_NAMES, COL_NAMES)
+        history.append(10, [[1, 2], [2, 0], [3, 1]], [[1, 2], [3, 0]])
+        history.append(1, [[1, 3], [2, 1], [3, 2]], [[1, 3], [2, 0]])
+
+        history = mh.MembershipHistory(self.history_dir)
+        self.assertEquals(ROW_NAMES, history.row_names)
+        self.assertEquals([1, 10], history.iterations())
+        snapshot = history.snapshot(10)
+        self.assertEquals(np.int32, snapshot.row_membs.dtype)
+        self.assertEquals(3, snapshot.num_clusters())
+        self.assertEquals(['VNG1', 'VNG3'], snapshot.rows_for_cluster(1))
+        self.assertEquals(['cond1'], snapshot.columns_for_cluster(2))
+        self.assertEquals([2], snapshot.clusters_for_row(1))
+        self.assertIsNone(history.snapshot(5))
+
+    def test_errors(self):
+        """the names and tables have to match"""
+        self.assertRaises(IOError, mh.MembershipHistory, self.history_dir)
+        history = mh.MembershipHistory(self.history_dir, ROW_NAMES, COL_NAMES)
+        self.assertRaises(ValueError, history.append, 1, [[1], [2]], [[1], [2]])
+        self.assertRaises(ValueError, mh.MembershipHistory, self.history_dir,
+                          ['VNG1'], COL_NAMES)
+
+    def test_member_table(self):
+        """each member's clusters are in ascending order, empty slots are 0"""
+        table = mh.member_table([(3, 0), (1, 0), (2, 2), (4, 0)], 3)
+        self.assertEquals([[1, 3, 4], [0, 0, 0], [2, 0, 0]], table.tolist())
+        self.assertEquals([[0], [0]], mh.member_table([], 2).tolist())
+
+    def test_convert_database(self):
+        """the converted snapshots contain the database memberships"""
+        dbpath = os.path.join(self.dirname, 'cmonkey_run.db')
+        conn = sqlite3.connect(dbpath)
+        conn.execute('create table row_names (order_num int, name text)')
+        conn.execute('create table column_names (order_num int, name text)')
+        conn.execute('create table row_members (iteration int, cluster int, order_num int)')
+        conn.execute('create table column_members (iteration int, cluster int, order_num int)')
+        conn.executemany('insert into row_names values (?,?)', list(enumerate(ROW_NAMES)))
+        conn.executemany('insert into column_names values (?,?)', list(enumerate(COL_NAMES)))
+        conn.executemany('insert into row_members values (?,?,?)',
+                         [(1, 1, 0), (1, 2, 0), (1, 2, 1), (1, 1, 2),
+                          (10, 2, 0), (10, 1, 1), (10, 2, 2)])
+        conn.executemany('insert into column_members values (?,?,?)',
+                         [(1, 1, 0), (1, 2, 1), (10, 1, 0), (10, 2, 0), (10, 2, 1)])
+        conn.commit()
+        conn.close()
+
+        history = mh.convert_database(dbpath, self.history_dir)
+        self.assertEquals([1, 10], history.iterations())
+        self.assertEquals([[1, 2], [2, 0], [1, 0]], history.snapshot(1).row_membs.tolist())
+        snapshot = history.snapshot(10)
+        self.assertEquals(['VNG1', 'VNG3'], snapshot.rows_for_cluster(2))
+        self.assertEquals(['cond1', 'cond2'], snapshot.columns_for_cluster(2))
+        # converting again keeps the history
+        self.assertEquals([1, 10], mh.convert_database(dbpath, self.history_dir).iterations())
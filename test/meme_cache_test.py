@@ -0,0 +1,159 @@
+"""meme_cache_test.py - unit tests for the meme_cache module
+
+This file is part of cMonkey Python. Please see README and LICENSE for
+more information and licensing details.
+"""
+import unittest
+import os
+import shutil
+import tempfile
+import cmonkey.meme as meme
+import cmonkey.meme_cache as meme_cache
+import cmonkey.motif as motif
+import cmonkey.seqtools as st
+
+
+MEME_CONFIG = {'MEME': {'max_width': 24, 'background_order': 3, 'version': '4.3.0',
+                        'use_revcomp': 'True', 'arg_mod': 'zoops',
+                        'scan_engine': 'pssm'}}
+SCAN_SEQS = {'f1': ('loc1', 'ACGTACGTAA'), 'f2': ('loc2', 'TTGACATTGA'),
+             'f3': ('loc3', 'GGGCCCAATT')}
+
+
+def make_result(evalue):
+    motif_info = meme.MemeMotifInfo([[0.25, 0.25, 0.25, 0.25]], 1, 1, 2, 10,
+                                    evalue, [])
+    return meme.MemeRunResult([('f1', 0.01, 0.03)], {'f1': [(0.01, 3, 1)]},
+                              [motif_info])
+
+
+def make_params(seqs, num_motifs=1, previous_motif_infos=None):
+    return motif.ComputeScoreParams(1, 1, sorted(seqs.keys()), seqs, SCAN_SEQS,
+                                    None, 2, 70, num_motifs, previous_motif_infos,
+                                    'out', 100, [])
+
+
+class MemeResultCacheTest(unittest.TestCase):  # pylint: disable-msg=R0904
+    """Test class for the MEME result cache"""
+
+    def setUp(self):  # pylint: disable-msg=C0103
+        self.dirname = tempfile.mkdtemp()
+
+    def tearDown(self):  # pylint: disable-msg=C0103
+        shutil.rmtree(self.dirname)
+
+    def test_get_and_put(self):
+        """stored results are returned and counted as hits"""
+        cache = meme_cache.MemeResultCache(self.dirname, 1 << 20)
+        self.assertIsNone(cache.get('key1'))
+        cache.put('key1', make_result(0.5))
+        result = cache.get('key1')
+        self.assertEquals([('f1', 0.01, 0.03)], result.pe_values)
+        self.assertEquals(0.5, result.motif_infos[0].evalue)
+        self.assertEquals((1, 1), (cache.hits, cache.misses))
+        cache.reset_stats()
+        self.assertEquals((0, 0), (cache.hits, cache.misses))
+
+    def test_evict(self):
+        """the least recently used results are evicted first"""
+        cache = meme_cache.MemeResultCache(self.dirname, 1 << 20)
+        for i, key in enumerate(['key1', 'key2', 'key3']):
+            cache.put(key, make_result(0.5))
+            os.utime(os.path.join(self.dirname, key + meme_cache.RESULT_SUFFIX),
+                     (1000 + i, 1000 + i))
+        self.assertEquals(0, cache.evict())
+        cache.get('key1')
+        cache.max_size = cache.size() - 1
+        self.assertEquals(1, cache.evict())
+        self.assertIsNone(cache.get('key2'))
+        self.assertIsNotNone(cache.get('key1'))
+        self.assertIsNotNone(cache.get('key3'))
+
+    def test_cache_key(self):
+        """the key depends on the input sequences and the MEME settings"""
+        meme_suite = meme.MemeSuite430(MEME_CONFIG)
+        seqs = {'f1': 'ACGTACGTAA', 'f2': 'TTGACATTGA'}
+        self.assertIsNone(meme_suite.cache_key(make_params(seqs)))
+
+        meme_suite.set_scan_sequences(SCAN_SEQS)
+        key = meme_suite.cache_key(make_params(seqs))
+        self.assertEquals(key, meme_suite.cache_key(make_params(dict(seqs))))
+        self.assertNotEquals(key, meme_suite.cache_key(make_params(seqs, num_motifs=2)))
+        self.assertNotEquals(key, meme_suite.cache_key(
+            make_params({'f1': 'ACGTACGTAA', 'f3': 'GGGCCCAATT'})))
+        # only a good previous motif changes the MEME seed
+        self.assertEquals(key, meme_suite.cache_key(
+            make_params(seqs, previous_motif_infos=make_result(5.0).motif_infos)))
+        self.assertNotEquals(key, meme_suite.cache_key(
+            make_params(seqs, previous_motif_infos=make_result(0.01).motif_infos)))
+
+
+class CountingMemeSuite(meme.MemeSuite430):
+    """replaces the dust tool by lower-casing the sequences"""
+    def __init__(self, config_params):
+        meme.MemeSuite430.__init__(self, config_params)
+        self.dusted = []
+
+    def dust(self, fasta_file_path):
+        with open(fasta_file_path) as infile:
+            seqpairs = st.read_sequences_from_fasta_string(infile.read())
+        self.dusted.extend([feature_id for feature_id, _ in seqpairs])
+        return ''.join(['>%s\n%s\n' % (feature_id, seq.lower())
+                        for feature_id, seq in seqpairs])
+
+
+class DustCacheTest(unittest.TestCase):  # pylint: disable-msg=R0904
+    """Test class for the dust cache"""
+
+    def setUp(self):  # pylint: disable-msg=C0103
+        self.dirname = tempfile.mkdtemp()
+
+    def tearDown(self):  # pylint: disable-msg=C0103
+        shutil.rmtree(self.dirname)
+
+    def test_lookup_and_put(self):
+        """masked sequences are found by their unmasked sequence"""
+        cache = meme_cache.DustCache(os.path.join(self.dirname, 'sub'), 'dust1', 1 << 20)
+        seqs = {'f1': 'ACGTACGT', 'f2': 'TTTTTTTT'}
+        self.assertEquals(({}, seqs), cache.lookup(seqs))
+        cache.put(seqs, {'f1': 'ACGTNNNN'})
+        cache.put({'f3': 'TTTTTTTT'}, {'f3': 'NNNNNNNN'})
+        self.assertEquals(({'f1': 'ACGTNNNN', 'f4': 'NNNNNNNN'}, {}),
+                          cache.lookup({'f1': 'ACGTACGT', 'f4': 'TTTTTTTT'}))
+
+    def test_shared_directory(self):
+        """caches in the same directory keep each other's entries, masks
+        of another dust tool are not used"""
+        cache1 = meme_cache.DustCache(self.dirname, 'dust1', 1 << 20)
+        cache2 = meme_cache.DustCache(self.dirname, 'dust1', 1 << 20)
+        cache1.put({'f1': 'ACGTACGT'}, {'f1': 'ACGTNNNN'})
+        cache2.put({'f2': 'TTTTTTTT'}, {'f2': 'NNNNNNNN'})
+        self.assertEquals(({'f1': 'ACGTNNNN', 'f2': 'NNNNNNNN'}, {}),
+                          cache1.lookup({'f1': 'ACGTACGT', 'f2': 'TTTTTTTT'}))
+        cache3 = meme_cache.DustCache(self.dirname, 'dust2', 1 << 20)
+        self.assertEquals(({}, {'f1': 'ACGTACGT'}), cache3.lookup({'f1': 'ACGTACGT'}))
+
+    def test_max_size(self):
+        """the cache is bounded in size"""
+        cache = meme_cache.DustCache(self.dirname, 'dust1', 1)
+        cache.put({'f1': 'ACGTACGT', 'f2': 'TTTTTTTT'}, {'f1': 'ACGTNNNN', 'f2': 'NNNNNNNN'})
+        self.assertEquals(0, cache.store.size())
+
+    def test_remove_low_complexity(self):
+        """only sequences that were not masked before are sent to dust"""
+        config = {'MEME': dict(MEME_CONFIG['MEME'], cache_size=1),
+                  'cache_dir': self.dirname}
+        seqs = {'f1': ('loc1', 'ACGTACGTAA'), 'f2': ('loc2', 'TTGACATTGA'),
+                'f3': ('loc3', 'GGG')}
+        meme_suite = CountingMemeSuite(config)
+        meme_suite.max_width = 5
+        self.assertEquals({'f1': 'acgtacgtaa', 'f2': 'ttgacattga'},
+                          meme_suite.remove_low_complexity(seqs))
+        self.assertEquals(['f1', 'f2'], sorted(meme_suite.dusted))
+
+        meme_suite = CountingMemeSuite(config)
+        meme_suite.max_width = 5
+        seqs['f4'] = ('loc4', 'GGGCCCAATT')
+        self.assertEquals({'f1': 'acgtacgtaa', 'f2': 'ttgacattga', 'f4': 'gggcccaatt'},
+                          meme_suite.remove_low_complexity(seqs))
+        self.assertEquals(['f4'], meme_suite.dusted)
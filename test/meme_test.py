@@ -5,6 +5,9 @@ more information and licensing details.
 """
 import cmonkey.meme as meme
 import unittest
+import os
+import shutil
+import tempfile
 
 
 class MemeTest(unittest.TestCase):  # pylint: disable-msg=R0904
@@ -52,6 +55,36 @@ class MemeTest(unittest.TestCase):  # pylint: disable-msg=R0904
         self.assertEquals('TGATAAAACACTTTATCTCTGTAT', sites0[3][5])
         self.assertEquals('ACGTAGACCGTATCGCGGAGATCT', sites0[4][5])
 
+    def test_read_meme_output_stream(self):
+        """the streaming reader reads the lines of an open file"""
+        with open('testdata/meme.out') as inputfile:
+            motif_infos = meme.read_meme_output_stream(inputfile, 2)
+        self.assertEquals(2, len(motif_infos))
+        self.assertEquals(20, motif_infos[1].width)
+        self.assertEquals(4, motif_infos[1].num_sites)
+        self.assertEquals(76, motif_infos[1].llr)
+        self.assertAlmostEquals(2.2e+3, motif_infos[1].evalue)
+        self.assertEquals(4, len(motif_infos[1].sites))
+        self.assertEquals(20, len(motif_infos[1].pssm))
+        self.assertEquals(24, len(motif_infos[0].pssm))
+        self.assertEquals([0.8, 0.0, 0.0, 0.2], motif_infos[0].pssm[0])
+
+    def test_read_meme_output_xml(self):
+        """tests the read_meme_output_xml function"""
+        with open('testdata/meme.xml') as inputfile:
+            motif_infos = meme.read_meme_output_xml(inputfile.read(), 2)
+        self.assertEquals(2, len(motif_infos))
+        self.assertEquals(4, motif_infos[0].width)
+        self.assertEquals(2, motif_infos[0].num_sites)
+        self.assertEquals(18, motif_infos[0].llr)
+        self.assertAlmostEquals(1.9e+3, motif_infos[0].evalue)
+        self.assertEquals([0.0, 0.6, 0.4, 0.0], motif_infos[0].pssm[1])
+        self.assertEquals(('NP_395673.1', '+', 8, 2.61e-11, 'GCCGCCG', 'ACAG', 'CGACAGCTTC'),
+                          motif_infos[0].sites[0])
+        self.assertEquals('-', motif_infos[0].sites[1][1])
+        self.assertEquals(2, motif_infos[1].motif_num)
+        self.assertEquals(1, len(motif_infos[1].sites))
+
     def test_read_mast_output_oldstyle(self):
         """tests the read_mast_output function"""
         with open('testdata/mast.out') as inputfile:
@@ -115,3 +148,33 @@ class MemeTest(unittest.TestCase):  # pylint: disable-msg=R0904
         self.assertAlmostEquals(0.322, pev[0][1])
         self.assertAlmostEquals(130.0, pev[0][2])
         self.assertTrue('NP_280363.1' in annotations)
+
+
+class MemeSuiteFilesTest(unittest.TestCase):  # pylint: disable-msg=R0904
+    """Test class for the files that a MEME suite shares between its runs"""
+
+    def setUp(self):  # pylint: disable-msg=C0103
+        self.dirname = tempfile.mkdtemp()
+
+    def tearDown(self):  # pylint: disable-msg=C0103
+        shutil.rmtree(self.dirname)
+
+    def test_database_file(self):
+        """the MAST database is written to the output directory and
+        removed in cleanup()"""
+        config = {'MEME': {'max_width': 24, 'background_order': 3, 'version': '4.3.0',
+                           'use_revcomp': 'True', 'arg_mod': 'zoops'},
+                  'output_dir': self.dirname}
+        background_file, _ = meme.global_background_file(
+            None, [], 'upstream', seqs={'f1': ('loc1', 'ACGTACGTAA')},
+            dirname=self.dirname)
+        meme_suite = meme.MemeSuite430(config, background_file=background_file)
+        meme_suite.set_scan_sequences({'f1': ('loc1', 'ACGTACGTAA'),
+                                       'f2': ('loc2', 'TTGACATTGA')})
+        dbfile = meme_suite.database_file()
+        self.assertEquals(self.dirname, os.path.dirname(dbfile))
+        self.assertEquals(self.dirname, os.path.dirname(background_file))
+        with open(dbfile) as infile:
+            self.assertTrue('>f2' in infile.read())
+        meme_suite.cleanup()
+        self.assertEquals([], os.listdir(self.dirname))
@@ -77,6 +77,44 @@ class ComputeArrayScoresTest(unittest.TestCase):
                                                {'multiprocessing': True, 'num_cores': None})
         self.__compare_with_refresult(refresult, result)
 
+    def test_compute_fused_row_scores(self):
+        """the fused kernel equals the scores computed on the submatrices
+        of each cluster, also when the columns are split into blocks"""
+        membership = self.__read_members()
+        ratios = self.__read_ratios()
+        ratios.values[numpy.random.RandomState(42).rand(*ratios.values.shape) < 0.1] = numpy.nan
+        ratios.values[3, :] = numpy.nan
+        row_members, col_members = ma.cluster_member_matrices(membership, ratios, 43)
+        result = numpy.empty((ratios.num_rows, 43))
+        ma.compute_fused_row_scores(ratios.values, row_members, col_members, result,
+                                    block_size=ratios.num_rows * 43 * 3)
+        for cluster in range(1, 44):
+            cnames = membership.columns_for_cluster(cluster)
+            submatrix = ratios.submatrix_by_name(membership.rows_for_cluster(cluster), cnames)
+            if submatrix.num_columns <= 1:
+                self.assertTrue(numpy.all(numpy.isnan(result[:, cluster - 1])))
+                continue
+            matrix = ratios.submatrix_by_name(column_names=cnames)
+            rm = util.row_means(numpy.square(matrix.values -
+                                             util.column_means(submatrix.values)))
+            ref = numpy.log(numpy.clip(rm, 1e-20, 1000.0) + 1e-99)
+            self.assertTrue(numpy.allclose(ref, result[:, cluster - 1], rtol=0.0, atol=1e-10,
+                                           equal_nan=True))
+
+    def test_compute_cluster_column_scores(self):
+        """the batched column scores equal the scores of the cluster submatrices"""
+        membership = self.__read_members()
+        ratios = self.__read_ratios()
+        ratios.values[numpy.random.RandomState(42).rand(*ratios.values.shape) < 0.1] = numpy.nan
+        ratios.values[:, 2] = numpy.nan
+        row_members, _ = ma.cluster_member_matrices(membership, ratios, 43)
+        result = scoring.compute_cluster_column_scores(ratios.values, row_members)
+        for cluster in range(1, 44):
+            submatrix = ratios.submatrix_by_name(row_names=membership.rows_for_cluster(cluster))
+            _, ref = scoring.compute_column_scores_submatrix(submatrix)
+            self.assertTrue(numpy.allclose(ref, result[:, cluster - 1], rtol=0.0, atol=1e-10,
+                                           equal_nan=True))
+
     def __compare_with_refresult(self, refresult, result):
         self.assertEquals(refresult.num_rows, result.num_rows)
         self.assertEquals(refresult.num_columns, result.num_columns)
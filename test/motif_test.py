@@ -0,0 +1,187 @@
+"""motif_test.py - unit tests for the motif module
+
+This file is part of cMonkey Python. Please see README and LICENSE for
+more information and licensing details.
+"""
+import unittest
+import pickle
+import time
+import cmonkey.meme as meme
+import cmonkey.motif as motif
+import cmonkey.util as util
+
+
+class MotifJobCostModelTest(unittest.TestCase):  # pylint: disable-msg=R0904
+    """Test class for the MEME job cost model"""
+
+    def test_estimate_unfitted(self):
+        """without timings, the cost grows with the total sequence length"""
+        model = motif.MotifJobCostModel()
+        model.fit()
+        self.assertIsNone(model.coeffs)
+        self.assertEquals(0.0, model.estimate(0, 0))
+        self.assertTrue(model.estimate(10, 2000) > model.estimate(20, 1000))
+
+    def test_estimate_fitted(self):
+        """the fitted model reproduces the timings"""
+        model = motif.MotifJobCostModel(min_timings=4)
+        for num_seqs, seq_length in [(5, 500), (10, 1500), (20, 2000), (40, 6000),
+                                     (60, 7000)]:
+            model.add_timing(num_seqs, seq_length, 3 * num_seqs * seq_length ** 1.5)
+        model.fit()
+        self.assertAlmostEqual(3 * 30 * 4000 ** 1.5, model.estimate(30, 4000), delta=1.0)
+
+    def test_fit_same_size(self):
+        """jobs of the same size do not determine the model"""
+        model = motif.MotifJobCostModel(min_timings=2)
+        model.add_timing(10, 1000, 50)
+        model.add_timing(10, 1000, 70)
+        model.fit()
+        self.assertIsNone(model.coeffs)
+
+    def test_job_size(self):
+        """the number of sequences and their total length"""
+        params = motif.ComputeScoreParams(1, 1, ['f1', 'f2'], {'f1': 'ACGT', 'f2': 'AC'},
+                                          {}, None, 2, 70, 1, None, 'out', 100, [])
+        self.assertEquals((2, 6), motif.job_size(params))
+
+
+class FakeMemeRunner:
+    """returns a p-value for each input sequence"""
+    def __call__(self, params):
+        if params.cluster < 0:
+            raise ValueError('invalid cluster')
+        return meme.MemeRunResult([(feature_id, 0.1, 0.5) for feature_id in params.seqs],
+                                  {}, [])
+
+
+class SlowMemeRunner(FakeMemeRunner):
+    """takes longer than the tests wait"""
+    def __call__(self, params):
+        time.sleep(30)
+        return FakeMemeRunner.__call__(self, params)
+
+
+def make_params(cluster, seqs, meme_runner=None):
+    return motif.ComputeScoreParams(1, cluster, sorted(seqs.keys()), seqs, {},
+                                    meme_runner or FakeMemeRunner(), 2, 70, 1, None,
+                                    'out', 100, [])
+
+
+class MotifJobBatchTest(unittest.TestCase):  # pylint: disable-msg=R0904
+    """Test class for running MEME jobs"""
+
+    def make_batch(self, clusters):
+        run_params = [make_params(cluster, {'f1': 'ACGT', 'f2': 'AC'}) for cluster in clusters]
+        return motif.MotifJobBatch(1, {'iteration': 1}, {}, {}, {}, {}, run_params)
+
+    def test_run(self):
+        """the jobs are run in the calling thread"""
+        batch = self.make_batch([1, 2])
+        batch.run({'multiprocessing': False})
+        self.assertEquals([1, 2], sorted([result[0] for result in batch.computed]))
+        self.assertEquals({'f1': 0.1, 'f2': 0.1}, batch.computed[0][1])
+
+    def test_start_and_wait(self):
+        """the jobs are run in the background"""
+        batch = self.make_batch([1, 2, 3])
+        batch.start()
+        batch.wait()
+        self.assertTrue(batch.done())
+        self.assertEquals([1, 2, 3], sorted([result[0] for result in batch.computed]))
+
+    def test_start_with_pool(self):
+        """the jobs are run by the pool's workers"""
+        pool = util.WorkerPool(2)
+        pool.start()
+        try:
+            batch = self.make_batch([1, 2, 3])
+            batch.start(pool)
+            batch.wait()
+            self.assertEquals([1, 2, 3], sorted([result[0] for result in batch.computed]))
+        finally:
+            pool.shutdown()
+
+    def test_cancel(self):
+        """a cancelled batch stops waiting for the jobs of a terminated pool"""
+        pool = util.WorkerPool(1)
+        pool.start()
+        batch = self.make_batch([1, 2])
+        batch.run_params = [make_params(cluster, {'f1': 'ACGT', 'f2': 'AC'}, SlowMemeRunner())
+                            for cluster in [1, 2]]
+        batch.start(pool)
+        pool.shutdown(terminate=True)
+        batch.cancel()
+        self.assertTrue(batch.done())
+        self.assertIsNone(batch.computed)
+
+    def test_wait_raises_error(self):
+        """errors in the background thread are raised when waiting"""
+        batch = self.make_batch([1, -1])
+        batch.start()
+        self.assertRaises(ValueError, batch.wait)
+
+    def test_pickle(self):
+        """a checkpoint of a started batch can be restarted"""
+        batch = self.make_batch([1, 2])
+        batch.start()
+        batch.computed = None
+        restored = pickle.loads(pickle.dumps(batch))
+        batch.wait()
+        self.assertTrue(restored.done())
+        restored.start()
+        restored.wait()
+        self.assertEquals([1, 2], sorted([result[0] for result in restored.computed]))
+
+
+class FakeOrganism:
+    """maps genes to feature ids and returns their search sequences"""
+    def __init__(self):
+        self.synonyms = {'gene1': 'F1', 'gene2': 'F2', 'gene3': 'F3', 'gene4': 'F4'}
+        self.seqs = {'F1': ('loc1', 'ACGTACGT'), 'F2': ('loc1', 'ACGTACGT'),
+                     'F3': ('loc3', 'TTGACATT'), 'F4': ('loc4', 'GGCC')}
+        self.num_lookups = 0
+
+    def feature_ids_for(self, genes):
+        return [self.synonyms[gene] for gene in genes if gene in self.synonyms]
+
+    def sequences_for_genes_search(self, feature_ids, seqtype):
+        self.num_lookups += 1
+        return {feature_id: self.seqs[feature_id] for feature_id in feature_ids}
+
+
+class FakeMembership:
+    def rows_for_cluster(self, cluster):
+        return ['gene3', 'gene2', 'gene1', 'gene5'] if cluster == 1 else ['gene5']
+
+
+def remove_short(seqs, feature_ids):
+    return {feature_id: seq for feature_id, seq in seqs.items() if len(seq[1]) > 4}
+
+
+class GeneSequenceTableTest(unittest.TestCase):  # pylint: disable-msg=R0904
+    """Test class for GeneSequenceTable"""
+
+    def test_seqs_for(self):
+        """the result equals filtering the cluster's sequences"""
+        organism = FakeOrganism()
+        table = motif.GeneSequenceTable(organism, ['gene1', 'gene2', 'gene3', 'gene4'],
+                                        'upstream', [remove_short])
+        seqs, feature_ids = table.seqs_for(['gene4', 'gene2', 'gene1'])
+        self.assertEquals(['F1', 'F2', 'F4'], feature_ids)
+        self.assertEquals({'F1': ('loc1', 'ACGTACGT')}, seqs)
+        expected = remove_short(motif.unique_filter(
+            organism.sequences_for_genes_search(feature_ids, 'upstream'), feature_ids),
+            feature_ids)
+        self.assertEquals(expected, seqs)
+
+    def test_seqs_for_cluster(self):
+        """the sequences are looked up once for all clusters"""
+        organism = FakeOrganism()
+        table = motif.GeneSequenceTable(organism, ['gene1', 'gene2', 'gene3', 'gene4'],
+                                        'upstream', [remove_short])
+        seqs, feature_ids = table.seqs_for_cluster(1, FakeMembership())
+        self.assertEquals(['F1', 'F2', 'F3'], feature_ids)
+        self.assertEquals(['F1', 'F3'], sorted(seqs.keys()))
+        self.assertEquals(({}, []), table.seqs_for_cluster(2, FakeMembership()))
+        self.assertEquals(1, organism.num_lookups)
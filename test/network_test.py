@@ -4,6 +4,7 @@ This file is part of cMonkey Python. Please see README and LICENSE for
 more information and licensing details.
 """
 import unittest
+import numpy as np
 import cmonkey.network as nw
 
 
@@ -70,3 +71,29 @@ class NetworkTest(unittest.TestCase):  # pylint: disable-msg=R0904
         self.assertEquals(1, len(res_edges))
         self.assertTrue(edge2 in res_edges)
 
+    def test_adjacency(self):
+        """the adjacency matrix is symmetric and ignores unknown nodes"""
+        edge1 = ('n1', 'n2', 123)
+        edge2 = ('n3', 'n2', 234)
+        edge3 = ('n4', 'n2', 345)
+        network = nw.Network.create('network', [edge1, edge2, edge3], 42,
+                                    check_size=False)
+        adjacency = network.adjacency(['n1', 'n2', 'n3']).toarray()
+        self.assertEquals([[0, 123, 0], [123, 0, 234], [0, 234, 0]],
+                          adjacency.tolist())
+
+    def test_compute_network_scores(self):
+        """the score of a gene is -log(x / n + 1) for the edges to the
+        n cluster genes"""
+        edge1 = ('n1', 'n2', 1.0)
+        edge2 = ('n3', 'n2', 2.0)
+        edge3 = ('n4', 'n1', 4.0)
+        network = nw.Network.create('network', [edge1, edge2, edge3], 42,
+                                    check_size=False)
+        nodes = ['n1', 'n2', 'n3', 'n4']
+        row_members = np.array([[True, False], [False, False],
+                                [True, False], [False, False]])
+        result = nw.compute_network_scores(network.adjacency(nodes), row_members, [2, 0])
+        self.assertTrue(np.allclose([-np.log(1.0), -np.log(3.0 / 2 + 1), 0.0,
+                                     -np.log(4.0 / 2 + 1)], result[:, 0]))
+        self.assertTrue(np.all(result[:, 1] == 0.0))
@@ -0,0 +1,191 @@
+"""numerics_test.py - parity tests for the NumPy/SciPy numerics backend
+
+The reference values were computed by the R implementations in the
+util module and are stored in testdata
+
+This file is part of cMonkey Python. Please see README and LICENSE for
+more information and licensing details.
+"""
+import unittest
+import numpy as np
+import cmonkey.numerics as numerics
+import cmonkey.util as util
+import cmonkey.datamatrix as dm
+import cmonkey.membership as memb
+
+
+CONFIG_PARAMS = {
+    'memb.clusters_per_row': 2,
+    'memb.clusters_per_col': int(round(43 * 2.0 / 3.0)),
+    'num_clusters': 43
+}
+
+
+def read_matrix(filename):
+    """reads a reference matrix file"""
+    return dm.create_from_csv(filename, case_sensitive=True)
+
+
+def read_members(filename):
+    """reads a membership file from an R reference run"""
+    members = {}
+    with open(filename) as infile:
+        for line in infile:
+            row = line.strip().split(' ')
+            members[row[0].replace('"', '')] = [int(value) for value in row[1:]]
+    return members
+
+
+def read_membership():
+    row_members = read_members('testdata/row_memb-49.tsv')
+    col_members = read_members('testdata/col_memb-49.tsv')
+    return memb.OrigMembership(sorted(row_members.keys()), sorted(col_members.keys()),
+                               row_members, col_members, CONFIG_PARAMS)
+
+
+class NumericsTest(unittest.TestCase):  # pylint: disable-msg=R0904
+    """Test class for the numerics module"""
+
+    def test_density(self):
+        """density() against R's density() + approx()"""
+        kvalues = [3.4268700450682301, 3.3655160468930152, -8.0654569044842539,
+                   2.0762815314005487, 4.8537715329554203, 1.2374476248622075]
+        cluster_values = [-3.5923001345962162, 0.77069901513184735,
+                          -4.942909785931378, -3.1580950032999096]
+        result = numerics.density(kvalues, cluster_values, 2.69474878768,
+                                  -13.8848342423, 12.6744452247)
+        ref = [0.08663036966690765, 0.08809242907902183, 0.49712338305039777,
+               0.12248549621579163, 0.05708884005243133, 0.14857948193544993]
+        self.assertTrue(np.allclose(ref, result, rtol=0.0, atol=1e-11))
+
+    def test_density_matrix(self):
+        """the batched density equals density() for each column"""
+        np.random.seed(42)
+        kvalues = np.random.normal(0.0, 1.0, (50, 4))
+        kvalues[3, 1] = np.nan
+        members = np.random.uniform(0.0, 1.0, (50, 4)) < 0.3
+        bandwidths = np.array([0.1, 0.2, 0.05, 0.3])
+        dmin = np.nanmin(kvalues, axis=0) - 1
+        dmax = np.nanmax(kvalues, axis=0) + 1
+        result = numerics.density_matrix(kvalues, members, bandwidths, dmin, dmax)
+        for k in range(4):
+            ref = numerics.density(kvalues[:, k], kvalues[members[:, k], k],
+                                   bandwidths[k], dmin[k], dmax[k])
+            self.assertTrue(np.allclose(ref, result[:, k], rtol=0.0, atol=1e-12,
+                                        equal_nan=True))
+
+    def test_density_out_of_range(self):
+        """values outside of the density range are NA in R's approx()"""
+        result = numerics.density([0.0, 100.0, np.nan], [0.0, 0.5], 0.1, -1.0, 1.0)
+        self.assertEqual(1.0, result[0])
+        self.assertTrue(np.isnan(result[1]))
+        self.assertTrue(np.isnan(result[2]))
+
+    def test_rorder(self):
+        """order(decreasing=T) is 1-based and keeps ties in input order"""
+        self.assertEqual([3, 2, 4],
+                         list(numerics.rorder([0.1, 0.5, 0.7, 0.5, np.nan], 3)))
+        self.assertEqual([3, 2, 4, 1, 5],
+                         list(numerics.rorder([0.1, 0.5, 0.7, 0.5, np.nan], 5)))
+
+    def test_rrank(self):
+        """rank(ties='min', na='keep')"""
+        result = numerics.rrank([3.0, 1.0, 3.0, np.nan, 2.0])
+        self.assertEqual([3.0, 1.0, 3.0], list(result[:3]))
+        self.assertTrue(np.isnan(result[3]))
+        self.assertEqual(2.0, result[4])
+
+    def test_rrank_matrix(self):
+        """ranks are 0-based and in row-major order"""
+        result = numerics.rrank_matrix(np.array([[3.0, 1.0], [3.0, 2.0]]))
+        self.assertEqual(np.int32, result.dtype)
+        self.assertEqual([2, 0, 2, 1], list(result))
+
+    def test_rrank_matrix_nan(self):
+        """NaN values are not ranked, infinite values are"""
+        result = numerics.rrank_matrix(np.array([[1.0, np.nan], [3.0, 2.0]]))
+        self.assertEqual([0, -1, 2, 1], list(result))
+        result = numerics.rrank_matrix(np.array([[np.inf, np.nan], [-np.inf, 2.0]]))
+        self.assertEqual([2, -1, 0, 1], list(result))
+
+    def test_mad(self):
+        """mad() with R's consistency constant"""
+        self.assertAlmostEqual(1.4826, numerics.mad([1.0, 2.0, 3.0, 4.0, 5.0]))
+        self.assertTrue(np.isnan(numerics.mad([1.0, np.nan])))
+
+    def test_phyper(self):
+        """upper and lower tail of the hypergeometric distribution"""
+        upper = numerics.phyper([1], [5], [5], [3])
+        lower = numerics.phyper([1], [5], [5], [3], lower_tail=True)
+        self.assertAlmostEqual(0.5, upper[0])
+        self.assertAlmostEqual(0.5, lower[0])
+
+    def test_sd_rnorm(self):
+        """sd_rnorm() returns the requested number of values"""
+        numerics.set_seed(42)
+        result = numerics.sd_rnorm([1.3, 1.6, 1.2, 1.05], 9, 0.748951)
+        self.assertEqual(9, len(result))
+        self.assertTrue(np.all(np.isnan(numerics.sd_rnorm([1.0], 3, 0.5))))
+        # R's sd() ignores NA but not infinite values
+        self.assertFalse(np.any(np.isnan(numerics.sd_rnorm([1.0, 2.0, np.nan], 3, 0.5))))
+        self.assertTrue(np.all(np.isnan(numerics.sd_rnorm([1.0, 2.0, np.inf], 3, 0.5))))
+
+    def test_rvec(self):
+        """evaluation of the R vector expressions used in the configuration"""
+        result = numerics.rvec('c(rep(1e-5, 100), seq(1e-5, 1, length=2000*3/4))')
+        self.assertEqual(1600, len(result))
+        self.assertEqual(1e-5, result[99])
+        self.assertAlmostEqual(1.0, result[-1])
+        result = numerics.rvec('c(rep(1, 2000/3), rep(2, 2000/3))')
+        self.assertEqual(1332, len(result))
+        self.assertEqual([1.0, 2.0, 3.0], list(numerics.rvec('seq(1, 3)')))
+
+    def test_kmeans(self):
+        """k-means finds obvious clusters, numbers are 1-based"""
+        numerics.set_seed(42)
+        values = np.array([[0.0, 0.0], [0.1, 0.0], [10.0, 10.0], [10.1, 10.0]])
+        result = numerics.kmeans(values, 2)
+        self.assertEqual(result[0], result[1])
+        self.assertEqual(result[2], result[3])
+        self.assertNotEqual(result[0], result[2])
+        self.assertEqual({1, 2}, set(result))
+
+
+class NumericsParityTest(unittest.TestCase):  # pylint: disable-msg=R0904
+    """Parity of the numpy backend with the R reference tables"""
+
+    def setUp(self):  # pylint: disable-msg=C0103
+        self.old_backend = util.NUMERICS_BACKEND
+        util.set_numerics_backend('numpy')
+
+    def tearDown(self):  # pylint: disable-msg=C0103
+        util.NUMERICS_BACKEND = self.old_backend
+
+    def test_density_scores(self):
+        membership = read_membership()
+        row_scores = read_matrix('testdata/combined_scores.tsv')
+        col_scores = read_matrix('testdata/combined_colscores.tsv')
+        ref_rowscores = read_matrix('testdata/density_rowscores.tsv')
+        ref_colscores = read_matrix('testdata/density_colscores.tsv')
+        rds, cds = memb.get_density_scores(membership, row_scores, col_scores)
+        self.assertTrue(np.allclose(ref_rowscores.values, rds.values, rtol=0.0, atol=1e-11))
+        self.assertTrue(np.allclose(ref_colscores.values, cds.values, rtol=0.0, atol=1e-11))
+
+    def test_quantile_normalize(self):
+        in_matrices = [read_matrix('testdata/rowscores_fixed.tsv'),
+                       read_matrix('testdata/motscores_fixed.tsv'),
+                       read_matrix('testdata/netscores_fixed.tsv')]
+        ref_matrices = [read_matrix('testdata/rowscores_qnorm.tsv'),
+                        read_matrix('testdata/motscores_qnorm.tsv'),
+                        read_matrix('testdata/netscores_qnorm.tsv')]
+        scalings = [6.0, 0.033355570380253496, 0.016677785190126748]
+        result = dm.quantile_normalize_scores(in_matrices, scalings)
+        for matrix, ref_matrix in zip(result, ref_matrices):
+            self.assertTrue(np.allclose(ref_matrix.values, matrix.values,
+                                        rtol=0.0, atol=1e-5))
+
+    def test_scaling_rvec(self):
+        scale = util.get_rvec_fun('seq(1e-5, 0.5, length=2000*3/4)')
+        self.assertAlmostEqual(1e-5, scale(1))
+        self.assertAlmostEqual(0.5, scale(1500))
+        self.assertAlmostEqual(0.5, scale(1999))
@@ -4,6 +4,9 @@ This file is part of cMonkey Python. Please see README and LICENSE for
 more information and licensing details.
 """
 import unittest
+import random
+import pickle
+import numpy as np
 import cmonkey.membership as memb
 import cmonkey.datamatrix as dm
 import cmonkey.microarray as ma
@@ -198,6 +201,120 @@ class OrigMembershipTest(unittest.TestCase):
         self.assertEquals(0, len(m.free_slots_for_column('C2')))
         self.assertEquals(4, len(m.free_slots_for_column('C1')))
 
+    def test_row_indexes_for_cluster(self):
+        m = memb.OrigMembership(['R1', 'R2', 'R3'], ['C1', 'C2'],
+                                {'R1': [1, 5], 'R2': [], 'R3': [5, 5]},
+                                {'C1': [3], 'C2': []},
+                                CONFIG_PARAMS)
+        self.assertEquals([0, 2], m.row_indexes_for_cluster(5).tolist())
+        self.assertEquals(np.int32, m.row_indexes_for_cluster(5).dtype)
+        self.assertEquals([], m.row_indexes_for_cluster(2).tolist())
+        self.assertEquals(2, m.num_row_members(5))
+
+        # R3 is still a member through its second slot
+        m.replace_row_cluster('R3', 0, 2)
+        self.assertEquals([0, 2], m.row_indexes_for_cluster(5).tolist())
+        self.assertEquals([2], m.row_indexes_for_cluster(2).tolist())
+        m.replace_row_cluster('R3', 1, 1)
+        self.assertEquals([0], m.row_indexes_for_cluster(5).tolist())
+        self.assertEquals([0, 2], m.row_indexes_for_cluster(1).tolist())
+        self.assertEquals({'R1', 'R3'}, m.rows_for_cluster(1))
+
+        m.add_cluster_to_row('R2', 5)
+        self.assertEquals([0, 1], m.row_indexes_for_cluster(5).tolist())
+        self.assertEquals(2, m.num_row_members(5))
+
+    def test_column_indexes_for_cluster(self):
+        m = memb.OrigMembership(['R1', 'R2'], ['C1', 'C2'],
+                                {'R1': [1, 5], 'R2': []},
+                                {'C1': [3, 4, 5, 6, 7], 'C2': [3]},
+                                CONFIG_PARAMS)
+        self.assertEquals([0, 1], m.column_indexes_for_cluster(3).tolist())
+        m.add_cluster_to_column('C2', 2)
+        m.add_cluster_to_column('C1', 2, force=True)
+        self.assertEquals([0, 1], m.column_indexes_for_cluster(2).tolist())
+        self.assertEquals(2, m.num_column_members(2))
+        m.replace_column_cluster('C1', 0, 0)
+        self.assertEquals([1], m.column_indexes_for_cluster(3).tolist())
+        self.assertEquals({'C2'}, m.columns_for_cluster(3))
+
+    def test_reindex(self):
+        """direct modifications of the tables are picked up by reindex()"""
+        m = memb.OrigMembership(['R1', 'R2'], ['C1', 'C2'],
+                                {'R1': [1, 5], 'R2': []}, {'C1': [3], 'C2': []},
+                                CONFIG_PARAMS)
+        m.row_membs[1] = [5, 2]
+        m.col_membs = np.zeros((2, 5), dtype='int32')
+        m.reindex()
+        self.assertEquals({'R1', 'R2'}, m.rows_for_cluster(5))
+        self.assertEquals({'R2'}, m.rows_for_cluster(2))
+        self.assertEquals(0, m.num_column_members(3))
+
+    def test_pickle(self):
+        """unpickled memberships rebuild their cluster indexes"""
+        m = memb.OrigMembership(['R1', 'R2'], ['C1', 'C2'],
+                                {'R1': [1, 5], 'R2': [5]}, {'C1': [3], 'C2': []},
+                                CONFIG_PARAMS)
+        changes = m.changes
+        m.add_cluster_to_row('R2', 2)
+        self.assertTrue(m.changes > changes)
+        copy = pickle.loads(pickle.dumps(m))
+        self.assertEquals(m.changes, copy.changes)
+        self.assertEquals({'R1', 'R2'}, copy.rows_for_cluster(5))
+        self.assertEquals([1], copy.row_indexes_for_cluster(2).tolist())
+        self.assertEquals({'C1'}, copy.columns_for_cluster(3))
+
+    def test_best_clusters(self):
+        """best_clusters() breaks ties by cluster number and puts NaN last"""
+        values = np.array([[0.1, 0.5, 0.7, 0.5, np.nan],
+                           [np.nan, 0.2, np.nan, 0.3, 0.3]])
+        self.assertEquals([[3, 2, 4], [4, 5, 2]], memb.best_clusters(values, 3).tolist())
+        self.assertEquals([[2, 3, 4], [2, 4, 5]],
+                          memb.best_clusters(values, 3, True).tolist())
+        self.assertEquals([[3, 2, 4, 1, 5], [4, 5, 2, 1, 3]],
+                          memb.best_clusters(values, 7).tolist())
+
+    def test_change_mask(self):
+        """the change mask is reproducible with a fixed seed"""
+        random.seed(42)
+        mask1 = memb.change_mask(100, 0.5)
+        random.seed(42)
+        mask2 = memb.change_mask(100, 0.5)
+        self.assertEquals(mask1.tolist(), mask2.tolist())
+        self.assertTrue(0 < mask1.sum() < 100)
+        self.assertTrue(memb.change_mask(10, 1.0).all())
+
+    def test_batch_update_same_as_legacy(self):
+        """the batched update makes the same changes as the row-by-row version"""
+        params = dict(CONFIG_PARAMS)
+        params.update({'num_clusters': 6, 'memb.clusters_per_col': 4,
+                       'memb.prob_row_change': 1.0, 'memb.max_changes_per_col': 3})
+        rows = ['R%d' % i for i in range(20)]
+        cols = ['C%d' % i for i in range(8)]
+        generator = np.random.RandomState(3)
+        row_members = {row: [c for c in generator.randint(0, 7, 2).tolist() if c > 0]
+                       for row in rows}
+        col_members = {col: generator.randint(1, 7, generator.randint(0, 5)).tolist()
+                       for col in cols}
+        clusters = [str(c) for c in range(1, 7)]
+        rd_scores = dm.DataMatrix(20, 6, rows, clusters,
+                                  values=np.round(generator.normal(size=(20, 6)), 1))
+        cd_scores = dm.DataMatrix(8, 6, cols, clusters,
+                                  values=np.round(generator.normal(size=(8, 6)), 1))
+
+        legacy = memb.OrigMembership(rows, cols, row_members, col_members, params)
+        memb.update_for_rows(legacy, rd_scores, False)
+        memb.update_for_cols(legacy, cd_scores, False)
+        batch = memb.OrigMembership(rows, cols, row_members, col_members, params)
+        memb.batch_update_for_rows(batch, rd_scores)
+        memb.batch_update_for_cols(batch, cd_scores)
+        self.assertEquals(legacy.row_membs.tolist(), batch.row_membs.tolist())
+        self.assertEquals(legacy.col_membs.tolist(), batch.col_membs.tolist())
+        for cluster in range(1, 7):
+            self.assertEquals(legacy.rows_for_cluster(cluster), batch.rows_for_cluster(cluster))
+            self.assertEquals(legacy.columns_for_cluster(cluster),
+                              batch.columns_for_cluster(cluster))
+
 if __name__ == '__main__':
     SUITE = []
     SUITE.append(unittest.TestLoader().loadTestsFromTestCase(OrigMembershipTest))
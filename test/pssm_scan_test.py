@@ -0,0 +1,86 @@
+"""pssm_scan_test.py - unit tests for the pssm_scan module
+
+This file is part of cMonkey Python. Please see README and LICENSE for
+more information and licensing details.
+"""
+import unittest
+import itertools
+import math
+import random
+import numpy as np
+import cmonkey.pssm_scan as ps
+import cmonkey.meme as meme
+import cmonkey.seqtools as st
+
+
+PSSM = [[0.9, 0.03, 0.03, 0.04], [0.0, 0.0, 1.0, 0.0], [0.1, 0.7, 0.1, 0.1],
+        [0.25, 0.25, 0.25, 0.25], [0.02, 0.02, 0.02, 0.94], [0.0, 0.9, 0.1, 0.0],
+        [0.8, 0.1, 0.1, 0.0], [0.1, 0.1, 0.7, 0.1]]
+BGMODEL = [{'A': 0.3, 'C': 0.2, 'G': 0.2, 'T': 0.3}]
+
+
+def random_seq(rand, length):
+    return ''.join([rand.choice('ACGT') for _ in range(length)])
+
+
+class PssmScanTest(unittest.TestCase):  # pylint: disable-msg=R0904
+    """Test class for the pssm_scan module"""
+
+    def test_encode(self):
+        """letters are encoded as 0-3, everything else is N"""
+        self.assertEquals([0, 1, 2, 3, 4, 0, 4], ps.encode('ACGTNaX').tolist())
+
+    def test_sequence_table(self):
+        """sequences are padded with N"""
+        table = ps.SequenceTable([('s1', 'ACG'), ('s2', 'T')])
+        self.assertEquals(2, len(table))
+        self.assertEquals([[0, 1, 2], [3, 4, 4]], table.codes.tolist())
+        self.assertEquals(1, table.row_for('s2'))
+        self.assertIsNone(table.row_for('s3'))
+
+    def test_score_pvalues(self):
+        """the p-values equal the enumeration of all words"""
+        bgfreqs = ps.background_frequencies(BGMODEL)
+        scores = ps.scaled_score_matrix(PSSM[:3], bgfreqs)
+        tail = ps.score_pvalues(scores, bgfreqs)
+        dist = np.zeros(len(tail))
+        for word in itertools.product(range(4), repeat=3):
+            dist[sum(scores[i, code] for i, code in enumerate(word))] += \
+                np.prod(bgfreqs[list(word)])
+        self.assertTrue(np.allclose(np.cumsum(dist[::-1])[::-1], tail))
+        self.assertAlmostEqual(1.0, tail[0])
+
+    def test_reverse_score_matrix(self):
+        """the reverse strand scores equal the forward scores on the
+        reverse complement"""
+        bgfreqs = ps.background_frequencies(BGMODEL)
+        scores = ps.scaled_score_matrix(PSSM, bgfreqs)
+        seq = 'ACGTTGCANAGGCT'
+        forward = ps.window_scores(ps.encode(st.revcomp(seq))[np.newaxis], scores)
+        reverse = ps.window_scores(ps.encode(seq)[np.newaxis],
+                                   ps.reverse_score_matrix(scores))
+        self.assertEquals(forward[0, ::-1].tolist(), reverse[0].tolist())
+
+    def test_qfast(self):
+        """the product of one p-value is the p-value itself"""
+        self.assertEquals(0.2, ps.qfast(1, 0.2))
+        self.assertAlmostEqual(0.2 * (1 - math.log(0.2)), ps.qfast(2, 0.2))
+        self.assertEquals(1.0, ps.qfast(3, 1.0))
+
+    def test_scan(self):
+        """the sequence with the planted motif has the best p-value
+        and a hit at the planted position"""
+        rand = random.Random(42)
+        seqs = [('seq%d' % i, random_seq(rand, 100)) for i in range(20)]
+        seqs[3] = ('seq3', seqs[3][1][:40] + 'AGCGTCAG' + seqs[3][1][48:])
+        seqs.append(('short', 'ACG'))
+        scanner = ps.PssmScanner(seqs, max_evalue=1e9)
+        motif_info = meme.MemeMotifInfo(PSSM, 1, 8, 10, 0, 0.1, [])
+        pevalues, annotations = scanner.scan([motif_info], BGMODEL, ['seq3'])
+        self.assertEquals(21, len(pevalues))
+        self.assertEquals('seq3', pevalues[0][0])
+        self.assertAlmostEqual(pevalues[0][1] * 21, pevalues[0][2])
+        self.assertEquals(('short', 1.0, 21.0), pevalues[-1])
+        self.assertEquals([], annotations['seq0'])
+        best = min(annotations['seq3'])
+        self.assertEquals((41 + 2, 1), best[1:])
@@ -0,0 +1,143 @@
+"""result_writer_test.py - unit tests for the result_writer module
+
+This file is part of cMonkey Python. Please see README and LICENSE for
+more information and licensing details.
+"""
+import unittest
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import cmonkey.result_writer as result_writer
+
+
+class ResultWriterTest(unittest.TestCase):  # pylint: disable-msg=R0904
+    """Test class for the ResultWriter"""
+
+    def setUp(self):  # pylint: disable-msg=C0103
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.execute('create table statstypes (category text, name text)')
+        self.conn.execute("insert into statstypes values ('main', 'fuzzy_coeff')")
+        self.conn.execute('create table motif_infos (iteration int, motif_num int)')
+        self.conn.execute('create table motif_pssm_rows (motif_info_id int, row int)')
+        self.conn.execute('insert into motif_infos values (1, 1)')
+        self.conn.commit()
+
+    def tearDown(self):  # pylint: disable-msg=C0103
+        self.conn.close()
+
+    def test_flush(self):
+        """the buffered rows are written with reserved row ids"""
+        writer = result_writer.ResultWriter(self.conn)
+        for motif_num in [1, 2]:
+            motif_info_id = writer.next_rowid('motif_infos')
+            writer.insert('motif_infos', ('rowid', 'iteration', 'motif_num'),
+                          (motif_info_id, 2, motif_num))
+            writer.insert_many('motif_pssm_rows', ('motif_info_id', 'row'),
+                               [(motif_info_id, row) for row in range(2)])
+        self.assertEquals(6, writer.num_rows())
+        self.assertEquals(1, self.conn.execute('select count(*) from motif_infos').fetchone()[0])
+        writer.flush()
+        self.assertEquals(0, writer.num_rows())
+        self.assertEquals([(1, 1, 1), (2, 2, 1), (3, 2, 2)],
+                          self.conn.execute('select rowid, * from motif_infos').fetchall())
+        self.assertEquals([(2, 0), (2, 1), (3, 0), (3, 1)],
+                          self.conn.execute('select * from motif_pssm_rows').fetchall())
+        self.assertEquals(4, writer.next_rowid('motif_infos'))
+
+    def test_flush_error(self):
+        """a failed flush writes nothing and discards the rows"""
+        writer = result_writer.ResultWriter(self.conn)
+        writer.insert('motif_infos', ('iteration', 'motif_num'), (2, 1))
+        writer.insert('no_table', ('iteration',), (2,))
+        self.assertRaises(sqlite3.OperationalError, writer.flush)
+        self.assertEquals(0, writer.num_rows())
+        self.assertEquals(1, self.conn.execute('select count(*) from motif_infos').fetchone()[0])
+
+    def test_statstype_id(self):
+        """statstypes that are added later are found"""
+        writer = result_writer.ResultWriter(self.conn)
+        self.assertEquals(1, writer.statstype_id('main', 'fuzzy_coeff'))
+        self.conn.execute("insert into statstypes values ('scoring', 'Rows')")
+        self.assertEquals(2, writer.statstype_id('scoring', 'Rows'))
+        self.assertRaises(KeyError, writer.statstype_id, 'scoring', 'Columns')
+
+    def test_configure_connection(self):
+        """the output database uses a write-ahead log"""
+        dirname = tempfile.mkdtemp()
+        try:
+            conn = sqlite3.connect(os.path.join(dirname, 'out.db'))
+            result_writer.configure_connection(conn)
+            self.assertEquals('wal', conn.execute('pragma journal_mode').fetchone()[0])
+            self.assertEquals(1, conn.execute('pragma synchronous').fetchone()[0])
+            conn.close()
+        finally:
+            shutil.rmtree(dirname)
+
+
+def create_table(conn):
+    with conn:
+        conn.execute('create table motif_infos (iteration int, motif_num int)')
+
+
+def fail(conn):
+    raise ValueError('write failed')
+
+
+class BackgroundWriterTest(unittest.TestCase):  # pylint: disable-msg=R0904
+    """Test class for the BackgroundWriter"""
+
+    def setUp(self):  # pylint: disable-msg=C0103
+        self.dirname = tempfile.mkdtemp()
+        self.path = os.path.join(self.dirname, 'out.db')
+        conn = result_writer.connect(self.path)
+        create_table(conn)
+        conn.close()
+
+    def tearDown(self):  # pylint: disable-msg=C0103
+        shutil.rmtree(self.dirname)
+
+    def test_flush_and_wait(self):
+        """the flushed rows are written in the background"""
+        conn = sqlite3.connect(self.path)
+        background = result_writer.BackgroundWriter(self.path)
+        writer = result_writer.ResultWriter(conn, background)
+        for iteration in range(1, 6):
+            writer.insert_many('motif_infos', ('iteration', 'motif_num'),
+                               [(iteration, 1), (iteration, 2)])
+            writer.flush()
+        writer.wait()
+        self.assertEquals(10, conn.execute('select count(*) from motif_infos').fetchone()[0])
+        writer.close()
+        conn.close()
+
+    def test_backpressure(self):
+        """submit() blocks while the queue is full"""
+        background = result_writer.BackgroundWriter(self.path, max_pending=1)
+        started = threading.Event()
+        release = threading.Event()
+
+        def block(conn):
+            started.set()
+            release.wait()
+
+        background.submit(block)
+        started.wait()
+        background.submit(create_table)
+        submitter = threading.Thread(target=background.submit, args=(create_table,))
+        submitter.start()
+        submitter.join(0.2)
+        self.assertTrue(submitter.is_alive())
+        release.set()
+        submitter.join()
+        # the table exists, the error is propagated
+        self.assertRaises(sqlite3.OperationalError, background.close)
+
+    def test_error(self):
+        """errors are raised in the run and the later tasks are skipped"""
+        background = result_writer.BackgroundWriter(self.path)
+        background.submit(fail)
+        self.assertRaises(ValueError, background.wait)
+        self.assertRaises(ValueError, background.submit, create_table)
+        self.assertRaises(ValueError, background.close)
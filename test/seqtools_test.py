@@ -5,7 +5,10 @@ more information and licensing details.
 """
 import unittest
 import os
+import random
 import re
+import shutil
+import tempfile
 import cmonkey.seqtools as st
 
 
@@ -51,6 +54,25 @@ class SeqtoolsTest(unittest.TestCase):  # pylint: disable-msg=R0904
         """tests with simple coordinate, setting reverse flag"""
         self.assertEquals('CTAA', st.subsequence("ATTAGCA", 2, 6, reverse=True))
 
+    def test_contig_array(self):
+        """subsequences of contig arrays equal the ones of strings"""
+        contig = st.contig_array("ATTAGCA")
+        self.assertEquals('TTAG', st.subsequence(contig, 2, 6))
+        self.assertEquals('CTAA', st.subsequence(contig, 2, 6, reverse=True))
+        self.assertEquals('ATTAGCA', st.subsequence(contig, -3, 20))
+
+    def test_save_and_load_contig_array(self):
+        """contig arrays are stored and memory-mapped"""
+        dirname = tempfile.mkdtemp()
+        try:
+            path = os.path.join(dirname, 'contig.npy')
+            st.save_contig_array(path, st.contig_array("ATTAGCA"))
+            self.assertEquals(['contig.npy'], os.listdir(dirname))
+            contig = st.load_contig_array(path)
+            self.assertEquals('CTAA', st.subsequence(contig, 2, 6, reverse=True))
+        finally:
+            shutil.rmtree(dirname)
+
     def test_subseq_counts_1(self):
         """test subseq_counts() with length 1"""
         counts = st.subseq_counts(["ACCGTATA", "CACAT"], 1)
@@ -91,10 +113,39 @@ class SeqtoolsTest(unittest.TestCase):  # pylint: disable-msg=R0904
         self.assertEquals(4, len(background[0]))
         self.assertEquals(7, len(background[1]))
 
+    def test_kmer_counts(self):
+        """all lengths are counted in one pass, subsequences with other
+        characters are counted as well"""
+        counts = st.kmer_counts(["ACCGTATA", "CACAT", "AXC"], 2)
+        self.assertEquals(2, len(counts))
+        self.assertEquals({'A': 6, 'C': 5, 'G': 1, 'T': 3, 'X': 1}, counts[0])
+        self.assertEquals(2, counts[1]['AC'])
+        self.assertEquals(1, counts[1]['AX'])
+        self.assertEquals(1, counts[1]['XC'])
+        self.assertEquals(13, sum(counts[1].values()))
+
+    def test_markov_background_cached(self):
+        """the model of a sequence set is only computed once"""
+        background1 = st.markov_background(["ACCGTATA", "CACAT"], 1)
+        background1[0]['A'] = 0.0
+        background2 = st.markov_background(["ACCGTATA", "CACAT"], 1)
+        self.assertAlmostEqual(5.0 / 13.0, background2[0]['A'])
+
+    def test_markov_background_cached_random_state(self):
+        """cached models of degenerate sequences draw the same replacements"""
+        seqs = ["ACCGTNNRYA", "CACAT"]
+        random.seed(7)
+        st.markov_background(seqs, 1)
+        expected = random.random()
+        random.seed(7)
+        st.markov_background(seqs, 1)
+        self.assertEquals(expected, random.random())
+
     def test_revcomp(self):
         """test revcomp function"""
         self.assertEquals("GNCAT", st.revcomp('ATGNC'))
         self.assertEquals("GNCAT", st.revcomp('atgnc'))
+        self.assertEquals("", st.revcomp(''))
 
     def test_replace_degenerate_residues(self):
         seqs = ['ACGTRYKMSWN']
@@ -164,3 +215,50 @@ class FastaTest(unittest.TestCase):  # pylint: disable-msg=R0904
         self.assertEquals(1, len(seqs2))
         self.assertEquals(seqs[0][0], seqs2[0][0])
         self.assertEquals(seqs[0][1], seqs2[0][1])
+
+
+FEATURES_TEXT = ('-- comment\n' +
+                 'NP_206803.1\tCDS\tnusB\tNC_000915.1\t<123\t456\tD\n' +
+                 'NP_206804.1\tCDS\tnusC\tNC_000915.1\t234\t>789\tR\n')
+
+
+class FeatureTableTest(unittest.TestCase):  # pylint: disable-msg=R0904
+    """Test class for FeatureTable"""
+
+    def tearDown(self):
+        """cleanup"""
+        if os.path.exists('/tmp/features_tmp.npz'):
+            os.remove('/tmp/features_tmp.npz')
+
+    def test_create_from_text(self):
+        """parses the features and looks them up by id"""
+        table = st.FeatureTable.create_from_text(FEATURES_TEXT)
+        self.assertEquals(2, len(table))
+        features = table.features_for(['NP_206804.1', 'unknown'])
+        self.assertEquals(['NP_206804.1'], list(features.keys()))
+        self.assertEquals(st.Feature('NP_206804.1', 'CDS', 'nusC',
+                                     st.Location('NC_000915.1', 234, 789, True)),
+                          features['NP_206804.1'])
+
+    def test_save_and_load(self):
+        """a saved table is loaded with the same features"""
+        table = st.FeatureTable.create_from_text(FEATURES_TEXT)
+        table.save('/tmp/features_tmp.npz')
+        table2 = st.FeatureTable.load('/tmp/features_tmp.npz')
+        ids = ['NP_206803.1', 'NP_206804.1']
+        self.assertEquals(table.features_for(ids), table2.features_for(ids))
+        self.assertEquals(st.Location('NC_000915.1', 123, 456, False),
+                          table2.feature('NP_206803.1').location)
+
+    def test_save_twice(self):
+        """saving replaces the table and leaves no temporary file"""
+        dirname = tempfile.mkdtemp()
+        path = os.path.join(dirname, 'features.npz')
+        try:
+            table = st.FeatureTable.create_from_text(FEATURES_TEXT)
+            table.save(path)
+            table.save(path)
+            self.assertEquals(['features.npz'], os.listdir(dirname))
+            self.assertEquals(2, len(st.FeatureTable.load(path)))
+        finally:
+            shutil.rmtree(dirname)
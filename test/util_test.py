@@ -6,6 +6,9 @@ more information and licensing details.
 import unittest
 import cmonkey.util as util
 import operator
+import os
+import shutil
+import tempfile
 import numpy as np
 
 
@@ -281,6 +284,40 @@ class UtilsTest(unittest.TestCase):  # pylint: disable-msg=R0904
         self.assertTrue(1 in multiple)
         self.assertTrue(2 in multiple)
 
+    def test_write_content_addressed(self):
+        """files with the same contents are only written once"""
+        dirname = tempfile.mkdtemp()
+        try:
+            path1 = util.write_content_addressed(dirname, 'test', 'ACGT\n')
+            path2 = util.write_content_addressed(dirname, 'test', 'ACGT\n')
+            path3 = util.write_content_addressed(dirname, 'test', 'TTTT\n')
+            self.assertEquals(path1, path2)
+            self.assertNotEquals(path1, path3)
+            self.assertEquals(2, len(os.listdir(dirname)))
+            with open(path1) as infile:
+                self.assertEquals('ACGT\n', infile.read())
+        finally:
+            shutil.rmtree(dirname)
+
+    def test_write_atomic(self):
+        """the file is replaced when it is complete, failed writes keep it"""
+        dirname = tempfile.mkdtemp()
+        path = os.path.join(dirname, 'test.npy')
+        try:
+            util.write_atomic(path, lambda outfile: np.save(outfile, np.arange(3)))
+            self.assertEquals(['test.npy'], os.listdir(dirname))
+            self.assertEquals(0o666 & ~util.UMASK, os.stat(path).st_mode & 0o777)
+            self.assertTrue(np.array_equal(np.arange(3), np.load(path)))
+
+            def fail(outfile):
+                outfile.write(b'partial')
+                raise IOError('disk full')
+            self.assertRaises(IOError, util.write_atomic, path, fail)
+            self.assertEquals(['test.npy'], os.listdir(dirname))
+            self.assertTrue(np.array_equal(np.arange(3), np.load(path)))
+        finally:
+            shutil.rmtree(dirname)
+
 
 class Order2StringTest(unittest.TestCase):  # pylint: disable-msg=R09042
     """Test class for order2string"""
@@ -295,3 +332,76 @@ class Order2StringTest(unittest.TestCase):  # pylint: disable-msg=R09042
         self.assertEquals("21st", util.order2string(21))
         self.assertEquals("22nd", util.order2string(22))
         self.assertEquals("23rd", util.order2string(23))
+
+
+def add_shared_value(value):
+    """worker function for WorkerPoolTest"""
+    return value + util.shared('test.value')
+
+
+def worker_pid(_):
+    """worker function for WorkerPoolTest"""
+    return os.getpid()
+
+
+class WorkerPoolTest(unittest.TestCase):  # pylint: disable-msg=R0904
+    """Test class for WorkerPool"""
+
+    def setUp(self):  # pylint: disable-msg=C0103
+        self.pool = util.WorkerPool(2)
+
+    def tearDown(self):  # pylint: disable-msg=C0103
+        self.pool.shutdown()
+        util.SHARED_STATE.pop('test.value', None)
+
+    def test_broadcast(self):
+        """workers see the state that was broadcast after they were started"""
+        util.broadcast('test.value', 10)
+        self.assertEquals([11, 12, 13], self.pool.map(add_shared_value, [1, 2, 3]))
+        pids = set(self.pool.map(worker_pid, range(10)))
+        util.broadcast('test.value', 20)
+        self.assertEquals([21, 22, 23], self.pool.map(add_shared_value, [1, 2, 3]))
+        # the workers are reused
+        pids.update(self.pool.map(worker_pid, range(10)))
+        self.assertTrue(len(pids) <= 2)
+
+    def test_broadcast_not_forced(self):
+        """broadcasting the same object does not create a new version"""
+        value = [1, 2]
+        util.broadcast('test.value', value)
+        version = util.SHARED_STATE['test.value'][0]
+        util.broadcast('test.value', value, force=False)
+        self.assertEquals(version, util.SHARED_STATE['test.value'][0])
+        util.broadcast('test.value', value)
+        self.assertNotEquals(version, util.SHARED_STATE['test.value'][0])
+        self.assertTrue(util.shared('test.value') is value)
+
+    def test_broadcast_tag(self):
+        """objects with a tag are only sent again when the tag changes"""
+        value = [1, 2]
+        util.broadcast('test.value', value, tag=1)
+        version = util.SHARED_STATE['test.value'][0]
+        util.broadcast('test.value', value, tag=1)
+        self.assertEquals(version, util.SHARED_STATE['test.value'][0])
+        value.append(3)
+        util.broadcast('test.value', value, tag=2)
+        self.assertNotEquals(version, util.SHARED_STATE['test.value'][0])
+        self.assertEquals([[0, 1, 2, 3]], self.pool.map(add_shared_value, [[0]]))
+
+    def test_imap_unordered(self):
+        """imap_unordered() returns all results with the current shared state"""
+        util.broadcast('test.value', 10)
+        self.assertEquals([11, 12, 13],
+                          sorted(self.pool.imap_unordered(add_shared_value, [1, 2, 3])))
+
+    def test_get_mp_pool_uses_run_pool(self):
+        """get_mp_pool() returns the run's pool and does not shut it down"""
+        util.RUN_POOL = self.pool
+        try:
+            util.broadcast('test.value', 1)
+            with util.get_mp_pool({'num_cores': 2}) as pool:
+                self.assertTrue(pool is self.pool)
+                self.assertEquals([2], pool.map(add_shared_value, [1]))
+            self.assertEquals([3], self.pool.map(add_shared_value, [2]))
+        finally:
+            util.RUN_POOL = None
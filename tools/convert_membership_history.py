@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""convert_membership_history.py - converts the memberships in a cmonkey2
+output database into a columnar membership history"""
+import os
+import argparse
+import logging
+
+import cmonkey.membership_history as membership_history
+
+
+if __name__ == '__main__':
+    description = __doc__
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('resultdir', help='cmonkey2 result directory')
+    parser.add_argument('--dbfile', default='cmonkey_run.db',
+                        help='name of the output database in resultdir')
+    parser.add_argument('--outdir', default=None,
+                        help='membership history directory, default: resultdir/membership_history')
+    args = parser.parse_args()
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s', level=logging.INFO)
+
+    dbpath = os.path.join(args.resultdir, args.dbfile)
+    if not os.path.exists(dbpath):
+        raise Exception("output database '%s' does not exist" % dbpath)
+    outdir = args.outdir
+    if outdir is None:
+        outdir = os.path.join(args.resultdir, 'membership_history')
+    history = membership_history.convert_database(dbpath, outdir)
+    print("%d iterations in '%s'" % (len(history.iterations()), outdir))